@@ -2,62 +2,220 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from scipy.integrate import cumulative_trapezoid # Для интегрирования методом трапеций
-from scipy.fft import fft, fftfreq
-from scipy.signal import get_window  # Добавляем оконную функцию
 import warnings
 import chardet
 
-def firstFieldIntegral(X1, X2, Y1, Y2, time, eds, 
-                       save_dir="FFI", 
+from . import harmonics
+
+def _stack_scans(values):
+    """
+    Скан или сканы -> (2-D массив, был ли это один скан).
+    Список сканов разной длины дополняется NaN до самого длинного.
+    """
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return np.atleast_2d(values.astype(float)), values.ndim == 1
+    values = list(values)
+    if all(np.ndim(v) == 0 for v in values):    # Один скан списком чисел
+        return np.asarray(values, dtype=float).reshape(1, -1), True
+    rows = [np.asarray(row, dtype=float).ravel() for row in values]
+    stacked = np.full((len(rows), max(r.size for r in rows)), np.nan)
+    for i, row in enumerate(rows):
+        stacked[i, :row.size] = row
+    return stacked, False
+
+
+def _noise(eds):
+    """Шум ЭДС по каждому скану: MAD первых разностей (тренд сигнала не мешает)."""
+    d = np.diff(eds, axis=-1)
+    mad = np.nanmedian(np.abs(d - np.nanmedian(d, axis=-1, keepdims=True)), axis=-1, keepdims=True)
+    return 1.4826*mad/np.sqrt(2)
+
+
+def first_field_integral(time, pos, eds, eds_noise=None, pos_noise=1e-4, min_velocity=1e-6):
+    """
+    Первый интеграл поля по сканам без построения графиков.
+    time, pos, eds - один скан (1-D), стопка сканов (2-D, скан в строке) или
+    список сканов разной длины. pos - координата нити, мм; time - с; eds - В.
+    Скорость считается по соседним точкам (v = dx/dt) сразу для всех сканов;
+    интервалы с dt <= 0, |v| < min_velocity или NaN исключаются маской.
+    eds_noise - СКО ЭДС, В (по умолчанию оценивается по каждому скану),
+    pos_noise - СКО координаты, мм.
+
+    Возвращает словарь массивов (для 1-D входа - без оси сканов):
+        pos, velocity, local, local_err - по интервалам: середина, скорость,
+            локальный интеграл ЭДС/v и его погрешность;
+        valid - маска учтённых интервалов;
+        integral, integral_err - интеграл скана sum(ЭДС*dt)/sum(dx) и погрешность.
+    Единица local и integral - В*с/мм (координаты в мм): 1 В*с/мм = 1e3 Тл*м,
+    в отличие от harmonics.multipoles, которые переводят длину в метры (Тл*м).
+    """
+    (t, single), (x, _), (e, _) = (_stack_scans(a) for a in (time, pos, eds))
+    dt = np.diff(t, axis=-1)
+    dx = np.diff(x, axis=-1)
+    e_mid = (e[:, 1:] + e[:, :-1])/2  # ЭДС на интервале - среднее по концам (трапеции)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vel = dx/dt
+        valid = (dt > 0) & (np.abs(vel) >= min_velocity) & np.isfinite(vel) & np.isfinite(e_mid)
+        vel = np.where(valid, vel, np.nan)
+        local = e_mid/vel
+
+        sigma_e = _noise(e) if eds_noise is None else np.broadcast_to(np.asarray(eds_noise, float), (len(e), 1))
+        sigma_e_mid = sigma_e/np.sqrt(2)
+        local_err = np.sqrt((sigma_e_mid/vel)**2 + (local*np.sqrt(2)*pos_noise/dx)**2)
+
+        flux = np.where(valid, e_mid*dt, 0.0).sum(axis=-1)       # Поток, В*с
+        shift = np.where(valid, dx, 0.0).sum(axis=-1)            # Перемещение, мм
+        integral = flux/shift
+        # Ошибки координат в sum(dx) сокращаются - остаются только концы прохода
+        flux_err = sigma_e[:, 0]*np.sqrt(np.where(valid, dt**2, 0.0).sum(axis=-1))
+        integral_err = np.hypot(flux_err, integral*np.sqrt(2)*pos_noise)/np.abs(shift)
+
+    result = {'pos': (x[:, 1:] + x[:, :-1])/2, 'velocity': vel, 'local': local,
+              'local_err': local_err, 'valid': valid,
+              'integral': integral, 'integral_err': integral_err}
+    if single:
+        result = {key: value[0] for key, value in result.items()}
+    return result
+
+
+def bidirectional_field_integral(time, pos, eds, bins=None, **kwargs):
+    """
+    Первый интеграл по проходам туда и обратно (scans.ffi_bidir_scan).
+    time, pos, eds - списки проходов (как у first_field_integral, kwargs - туда же).
+    Постоянная добавка к ЭДС (термо-ЭДС, смещение нуля) даёт в локальном
+    интеграле ЭДС/v слагаемое offset/v - с разными знаками для двух направлений,
+    поэтому среднее направлений её сокращает.
+    Локальные интегралы всех проходов одним bincount раскладываются на общую
+    сетку из bins интервалов по координате (по умолчанию - половина медианного
+    числа точек прохода) в пределах, пройденных всеми проходами.
+
+    Возвращает словарь: grid - середины интервалов сетки; forward, backward -
+    средние локальные интегралы по направлениям; local, local_err - их среднее и
+    погрешность; offset - оценка постоянной ЭДС, В; integral, integral_err -
+    среднее интегралов направлений (единицы - как у first_field_integral, В*с/мм); direction - знаки проходов; strokes - результат
+    first_field_integral по проходам.
+    """
+    ffi = first_field_integral(time, pos, eds, **kwargs)
+    direction = np.sign(np.nanmedian(ffi['velocity'], axis=-1))
+    forward = direction > 0
+    if forward.all() or not forward.any():
+        raise ValueError("Нужны проходы в обоих направлениях")
+    valid = ffi['valid']
+    x = ffi['pos']
+    lo = np.max(np.nanmin(np.where(valid, x, np.nan), axis=-1))    # Общий для всех проходов отрезок
+    hi = np.min(np.nanmax(np.where(valid, x, np.nan), axis=-1))
+    if bins is None:
+        bins = max(int(np.median(valid.sum(axis=-1)))//2, 1)
+    edges = np.linspace(lo, hi, bins + 1)
+
+    with np.errstate(invalid="ignore"):
+        idx = np.floor((x - lo)/(hi - lo)*bins)
+        use = valid & (idx >= 0) & (idx < bins)
+    # Ключ = направление*bins + интервал: суммы и суммы квадратов за один проход
+    key = (np.where(forward, 0, bins)[:, None] + np.where(use, idx, 0)).astype(np.int64)[use]
+    local = ffi['local'][use]
+    n = np.bincount(key, minlength=2*bins).reshape(2, bins)
+    s1 = np.bincount(key, local, 2*bins).reshape(2, bins)
+    s2 = np.bincount(key, local**2, 2*bins).reshape(2, bins)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s1/n
+        sem = np.sqrt((s2 - s1*mean)/(n - 1)/n)
+        speed = np.nanmean(np.abs(ffi['velocity']))
+        offset = np.nanmean(mean[0] - mean[1])/2*speed
+
+        # Интегралы по направлениям: среднее по проходам и погрешность среднего
+        integral = ffi['integral']
+        err = ffi['integral_err']
+        by_dir = [(np.mean(integral[m]), np.sqrt(np.sum(err[m]**2))/m.sum()) for m in (forward, ~forward)]
+    return {'grid': (edges[1:] + edges[:-1])/2, 'forward': mean[0], 'backward': mean[1],
+            'local': mean.mean(axis=0), 'local_err': np.hypot(*sem)/2, 'offset': offset,
+            'integral': (by_dir[0][0] + by_dir[1][0])/2,
+            'integral_err': np.hypot(by_dir[0][1], by_dir[1][1])/2,
+            'direction': direction, 'strokes': ffi}
+
+
+def integral_map(time, pos, eds, shape=None, **kwargs):
+    """
+    Карта первого интеграла по проходам карты (scans.map_scan): интеграл каждого
+    прохода - значение в его точке. Все проходы считаются одним вызовом
+    first_field_integral (kwargs - туда же). shape - форма сетки (len(y), len(x)),
+    если точки - scan_plan.grid_points.
+    Возвращает словарь: integral, integral_err - массивы формы shape (или по точкам), В*с/мм.
+    """
+    ffi = first_field_integral(time, pos, eds, **kwargs)
+    integral, err = np.atleast_1d(ffi['integral']), np.atleast_1d(ffi['integral_err'])
+    if shape is not None:
+        integral, err = integral.reshape(shape), err.reshape(shape)
+    return {'integral': integral, 'integral_err': err}
+
+
+def second_field_integral(time, pos, eds, first_integral, wire_length, first_integral_err=0.0,
+                          eds_noise=None, pos_noise=1e-4, chunk=65536):
+    """
+    Второй интеграл поля по встречному проходу (scans.sfi_scan): ведущий конец нити
+    смещается на dx, второй - на -dx. Поток Ф = sum(ЭДС*dt) накапливается
+    cumulative_trapezoid порциями по chunk точек, так что длинные прогоны
+    (в т.ч. numpy.memmap из файла прогона) не требуют промежуточных массивов
+    размером со скан.
+        I2 = L/2 * (Ф/dx + I1),
+    I1 - первый интеграл в той же точке (first_field_integral, В*с/мм), L - длина нити
+    в единицах pos (мм); I2 отсчитывается от второго конца нити и получается в
+    В*с = Тл*м^2.
+
+    Возвращает словарь: flux (накопленный поток по точкам скана), integral, integral_err.
+    """
+    n = len(time)
+    flux = np.zeros(n)
+    sum_dt2, noise = 0.0, []
+    for i in range(0, max(n - 1, 0), chunk):
+        j = min(i + chunk, n - 1)
+        t = np.asarray(time[i:j + 1], dtype=float)
+        e = np.asarray(eds[i:j + 1], dtype=float)
+        flux[i + 1:j + 1] = flux[i] + cumulative_trapezoid(np.nan_to_num(e), t)
+        sum_dt2 += np.sum(np.diff(t)**2)
+        if eds_noise is None and e.size > 2:
+            noise.append(_noise(e)[0])
+    x = np.array([pos[0], pos[n - 1]], dtype=float) if n else np.zeros(2)
+    shift = x[1] - x[0]
+    sigma_e = eds_noise if eds_noise is not None else (np.median(noise) if noise else 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = flux[-1]/shift if n else np.nan                # Ф/dx - в единицах первого интеграла
+        ratio_err = np.hypot(sigma_e*np.sqrt(sum_dt2), ratio*np.sqrt(2)*pos_noise)/np.abs(shift)
+    integral = wire_length/2*(ratio + first_integral)
+    integral_err = wire_length/2*np.hypot(ratio_err, first_integral_err)
+    return {'flux': flux, 'integral': integral, 'integral_err': integral_err}
+
+
+def firstFieldIntegral(X1, X2, Y1, Y2, time, eds,
+                       save_dir="FFI",
                        filename="first_field_integral.png",
                        save_path=None):
-    
+    """График первого интеграла по скану: нить - середина между кареток X1 и X2."""
     # Полный путь к файлу
     if save_path is None:
         save_path = (f"Calculation/{save_dir}/{filename}")
 
     try:
-        x1_arr = np.array(X1)
-        x2_arr = np.array(X2)
-        time_arr = np.array(time)
-        eds_arr = np.array(eds)
-
-        if not (len(x2_arr) == len(x1_arr) == len(time_arr) == len(eds_arr)):
-                print("Ошибка: Длины массивов не соответствуют ожидаемым!")
-                print(f"len(X1)={len(x1_arr)}, len(X2)={len(x2_arr)}, len(time)={len(time_arr)}, len(eds)={len(eds_arr)}")
-                print("Ожидается: len(X2) == len(eds) == len(X1)-1 == len(time)-1")
-                return None
-        
-        # Вычисление временных интервалов
-        dt = time_arr[1:] - time_arr[:-1] # Используем np.diff для краткости
-        dt = np.diff(time_arr)
-
-        # Вычисление скорости (поэлементно)
-        # Подавляем предупреждения о делении на ноль временно
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore", category=RuntimeWarning)
-            vel = (x2_arr - x1_arr) / dt
-            # Заменяем бесконечности (от деления на 0) и NaN на 0 или другое значение
-            vel = np.nan_to_num(vel, nan=0.0, posinf=0.0, neginf=0.0)
-        
-        first_fi = eds / vel 
+        pos = (np.asarray(X1, dtype=float) + np.asarray(X2, dtype=float))/2
+        ffi = first_field_integral(time, pos, eds)
 
         # Создаем фигуру перед построением графика
         fig, ax = plt.subplots()
-        
-        # Строим график зависимости первого магнитного поля от координаты нити (X1, например)
-        ax.plot(X2, first_fi)
-        ax.xlabel('Координата X2 (мм)')
-        ax.ylabel('Первый интеграл магнитного поля')
-        ax.title('Зависимость первого интеграла магнитного поля от координаты нити')
+
+        # Строим график зависимости первого магнитного поля от координаты нити
+        ax.errorbar(ffi['pos'], ffi['local'], yerr=ffi['local_err'], fmt='-', errorevery=max(1, ffi['pos'].size//50))
+        ax.set_xlabel('Координата нити (мм)')
+        ax.set_ylabel('Первый интеграл магнитного поля')
+        ax.set_title(f"I1 = {ffi['integral']:.4e} ± {ffi['integral_err']:.1e}")
         ax.grid(which="both", linestyle="--")  # Сетка для удобства
 
         if save_path:
                 fig.savefig(save_path, dpi=300, bbox_inches='tight')
                 print(f"График сохранён как {save_path}")
-        
+
         return fig
-    
+
     except Exception as e:
         print(f"Произошла ошибка в firstFieldIntegral: {e}")
         return None
@@ -82,50 +240,36 @@ def demoFirstFieldIntegral(X1, X2, vel, eds, save_path=None):
     return fig
 
 
-def harmonicAnalysis(X1, X2, Y1, Y2, time, eds, save_path=None):
-    vel = []
-    vel = (X2 - X1) / time
-
-    # Убираем DC-компоненту (вычитаем среднее значение)
-    eds -= np.mean(eds)
-
-    # Применяем оконную функцию Ханна
-    window = get_window("hann", len(eds))  # Создаем окно Ханна
-    eds *= window  # Применяем окно к сигналу
-
-    # Выполняем преобразование Фурье
-    N = len(time)  # Количество точек во временном ряду
-    fft_values = fft(eds)  # Преобразование Фурье для ЭДС
-    freqs = np.fft.fftfreq(N, d=(time[1] - time[0])) * 2 * np.pi  # Преобразуем в круговую частоту
-
-    # Вычисление амплитуд гармоник
-    amplitudes = 2.0 / N * np.abs(fft_values[:N // 2])  # Вычисление модуля спектра
-
-    # Отбрасываем слишком малые амплитуды (шум)
-    threshold = 1e-10  # Порог отсечения
-    amplitudes[amplitudes < threshold] = np.nan  # Меняем малые значения на NaN, чтобы они не отображались
-
-    # Вывод коэффициентов мультипольного разложения
-    for i, amp in enumerate(amplitudes[:10]):  # Перебираем первые 10 гармоник
-        print(f"Гармоника {i}: амплитуда = {amp:.3e}")  # Форматируем с одной цифрой после запятой
-
+def harmonicAnalysis(X1, X2, Y1, Y2, time, eds, radius=None, r_ref=None, n_max=15, save_path=None):
+    """
+    Мультипольные коэффициенты скана по окружности (Calculation.harmonics) и их график.
+    Угол нити - относительно центра окружности, подобранной по координатам нити;
+    radius - радиус окружности (по умолчанию подобранный). Массивы на входе не изменяются.
+    Возвращает (fig, res): res - словарь harmonics.multipoles (n, b, a, relative, ...),
+    таблица коэффициентов - res['b'][0], res['a'][0] по res['n'].
+    """
+    x = (np.asarray(X1, dtype=float) + np.asarray(X2, dtype=float))/2
+    y = (np.asarray(Y1, dtype=float) + np.asarray(Y2, dtype=float))/2
+    cx, cy, fitted = harmonics.fit_circle(x, y)
+    theta = harmonics.wire_angle(x, y, (cx, cy))
+    if radius is None:
+        radius = fitted
 
+    res = harmonics.multipoles(theta, time, eds, radius, r_ref, n_max=n_max)
 
     fig, ax = plt.subplots()
-    
-    # Строим график зависимости первого магнитного поля от координаты нити (X1, например)
-    ax.plot(freqs[:N // 2], amplitudes)
-    ax.xlabel('Круговая частота (рад/с)')
-    ax.ylabel('Амплитуда')
-    ax.title('Мультипольное разложение ЭДС (логарифмическая шкала)')
+
+    # Нормальные и косые коэффициенты рядом
+    ax.bar(res['n'] - 0.2, res['b'][0], width=0.4, label='b_n')
+    ax.bar(res['n'] + 0.2, res['a'][0], width=0.4, label='a_n')
+    ax.set_xlabel('Номер гармоники n')
+    ax.set_ylabel('Коэффициент, Тл*м')
+    ax.set_title('Мультипольное разложение')
+    ax.legend()
     ax.grid(which="both", linestyle="--")  # Сетка для удобства
 
     if save_path:
             fig.savefig(save_path, dpi=300, bbox_inches='tight')
             print(f"График сохранён как {save_path}")
-    
-    return fig
-
-
 
-      
\ No newline at end of file
+    return fig, res
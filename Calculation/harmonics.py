@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Мультипольный анализ сканов вращающейся нити
+--------------------------------------------
+Нить движется по окружности радиуса r вокруг центра скана. Поток через
+заметённую площадь зависит только от угла нити theta:
+
+    Ф(theta) = Re F(z),  F(z) = sum C_n * r_ref/n * (z/r_ref)^n,  z = r*exp(i*theta),
+    C_n = b_n + i*a_n  - интегральные коэффициенты (Тл*м) на радиусе r_ref,
+    By + i*Bx = sum C_n * (z/r_ref)^(n-1).
+
+Поэтому ЭДС сначала интегрируется по времени в поток, поток переносится на
+равномерную сетку из 2^k бинов по углу нити, посчитанному по координатам
+осей X/Y относительно центра дуги (wire_angle): неравномерные отметки времени
+и пульсации скорости не размазывают гармоники. Дрейф от смещения ЭДС за оборот
+вычитается, и все сканы проходят одно rfft(axis=-1, workers=-1).
+Коэффициент k-й гармоники потока c_n = N/2 * C_n*r_ref/n*(r/r_ref)^n*exp(i*n*theta0).
+
+    res = multipoles(theta, time, eds, radius=10.0, r_ref=10.0)
+    res['b'][:, 1], res['a'][:, 1]      # квадруполь всех сканов
+"""
+import numpy as np
+from scipy.fft import rfft
+from scipy.integrate import cumulative_trapezoid
+
+DEFAULT_BINS = 512
+LENGTH_UNIT = 1e-3          # Координаты в мм, поток - в В*с = Тл*м^2
+
+
+def _scans(values):
+    """Один скан (1-D) или несколько (2-D / список разной длины) -> список 1-D массивов."""
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return [values.astype(float)] if values.ndim == 1 else [row.astype(float) for row in values]
+    values = list(values)
+    if all(np.ndim(v) == 0 for v in values):
+        return [np.asarray(values, dtype=float)]
+    return [np.asarray(v, dtype=float) for v in values]
+
+
+def fit_circle(x, y):
+    """Центр и радиус окружности по точкам (МНК: 2*cx*x + 2*cy*y + c = x^2 + y^2)."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    A = np.column_stack([2*x, 2*y, np.ones_like(x)])
+    (cx, cy, c), *_ = np.linalg.lstsq(A, x**2 + y**2, rcond=None)
+    return cx, cy, np.sqrt(c + cx**2 + cy**2)
+
+
+def wire_angle(x, y, center=(0.0, 0.0)):
+    """Угол нити, рад, по координатам X/Y (мм) относительно центра дуги, развёрнутый по последней оси."""
+    return np.unwrap(np.arctan2(np.asarray(y, dtype=float) - center[1],
+                                np.asarray(x, dtype=float) - center[0]), axis=-1)
+
+
+def _check_bins(bins):
+    if bins < 2 or bins & (bins - 1):
+        raise ValueError(f"Число угловых бинов должно быть степенью двойки, получено {bins}")
+
+
+def resample_angle(theta, values, bins=DEFAULT_BINS):
+    """
+    values(theta) на bins = 2^k равных шагов одного оборота, начиная с наименьшего
+    угла каждого скана. theta, values - один скан или несколько (2-D / список разной
+    длины); угол развёртывается, направление вращения любое. Все сканы
+    интерполируются одним searchsorted: углы сканов разнесены на непересекающиеся
+    отрезки общей оси. Линейный дрейф за оборот (values(theta0 + 2*pi) - values(theta0))
+    вычитается. Возвращает (сканы x bins, theta0 по сканам, дрейф по сканам).
+    """
+    _check_bins(bins)
+    thetas, values = _scans(theta), _scans(values)
+    keys, vals, theta0 = [], [], np.empty(len(thetas))
+    for i, (th, v) in enumerate(zip(thetas, values)):
+        th = np.unwrap(th)
+        if th[-1] < th[0]:                              # Вращение по часовой - переворачиваем
+            th, v = th[::-1], v[::-1]
+        th = np.maximum.accumulate(th)                  # Дрожание энкодера на малой скорости
+        if th[-1] - th[0] < 2*np.pi*(1 - 0.5/bins):
+            raise ValueError(f"Скан {i} покрывает {np.degrees(th[-1] - th[0]):.1f} градусов, нужен полный оборот")
+        theta0[i] = th[0]
+        keys.append(th - th[0])
+        vals.append(v)
+    span = max(k[-1] for k in keys) + 1.0               # Шаг между отрезками сканов на общей оси
+    offsets = span*np.arange(len(keys))
+    key = np.concatenate([k + o for k, o in zip(keys, offsets)])
+    val = np.concatenate(vals)
+    grid = offsets[:, None] + 2*np.pi*np.arange(bins + 1)[None, :]/bins
+    # Интервал - только внутри своего скана: скан, не доходящий до 2*pi на долю
+    # бина, экстраполируется по своим последним точкам, а не к началу следующего
+    sizes = np.array([k.size for k in keys])
+    ends = np.cumsum(sizes)[:, None]
+    j = np.clip(np.searchsorted(key, grid, side="right"), ends - sizes[:, None] + 1, ends - 1)
+    step = key[j] - key[j - 1]
+    w = np.divide(grid - key[j - 1], step, out=np.zeros_like(grid), where=step > 0)
+    resampled = val[j - 1] + w*(val[j] - val[j - 1])
+    drift = resampled[:, -1] - resampled[:, 0]
+    return resampled[:, :-1] - drift[:, None]*np.arange(bins)/bins, theta0, drift
+
+
+def multipoles(theta, time, eds, radius, r_ref=None, n_max=15, bins=DEFAULT_BINS, unit=LENGTH_UNIT):
+    """
+    Коэффициенты b_n, a_n по сканам по окружности.
+    theta, time, eds - один скан (1-D) или несколько (2-D или список разной длины):
+    угол нити относительно центра окружности (рад, см. wire_angle), время (с), ЭДС (В).
+    radius - радиус окружности (число или по скану), r_ref - радиус приведения
+    (по умолчанию radius), в мм (unit - метров в единице длины). Гармоники до n_max,
+    bins - число угловых бинов (степень двойки: rfft по степени двойки и точные гармоники).
+
+    Возвращает словарь: n; c - комплексный массив (сканы x n_max) C_n = b_n + i*a_n, Тл*м;
+    b, a - его части; relative - |C_n|/|C_main|*1e4 (единицы 10^-4 от основной
+    гармоники main); drift - дрейф потока за оборот, В*с.
+    """
+    radius = np.asarray(radius, dtype=float).reshape(-1, 1)
+    r_ref = radius if r_ref is None else np.asarray(r_ref, dtype=float).reshape(-1, 1)
+    # Поток, В*с (ЭДС не изменяется) -> равномерная сетка по углу для всех сканов сразу
+    flux = [cumulative_trapezoid(e, t, initial=0.0) for t, e in zip(_scans(time), _scans(eds))]
+    samples, theta0, drift = resample_angle(theta, flux, bins)
+
+    n = np.arange(1, n_max + 1)
+    spectrum = rfft(samples, axis=-1, workers=-1)[:, 1:n_max + 1]*2/bins
+    c = spectrum*np.exp(-1j*n*theta0[:, None])*n/(r_ref*unit*(radius/r_ref)**n)
+    return _result(n, c, drift=drift)
+
+
+def _result(n, c, **extra):
+    """Словарь коэффициентов: c, b, a, relative к основной гармонике, main."""
+    main = np.argmax(np.abs(c), axis=-1)
+    relative = np.abs(c)/np.abs(c[np.arange(len(c)), main])[:, None]*1e4
+    return dict({'n': n, 'c': c, 'b': c.real, 'a': c.imag, 'relative': relative,
+                 'main': n[main]}, **extra)
+
+
+class AngleBins(object):
+    """
+    Среднее и дисперсия значений по bins = 2^k равным бинам угла одного оборота,
+    накапливаемые по ходу измерения (Уэлфорд; порции объединяются формулой Чана).
+    Память O(bins) при любом числе оборотов и отсчётов.
+
+        acc = AngleBins(128)
+        acc.update(theta, value)         # отсчёт или массивы отсчётов, theta в рад
+        acc.mean, acc.variance, acc.count
+    """
+    def __init__(self, bins=DEFAULT_BINS, theta0=0.0):
+        _check_bins(bins)
+        self.bins = bins
+        self.theta0 = theta0                 # Начало нулевого бина, рад
+        self.width = 2*np.pi/bins
+        self.count = np.zeros(bins, dtype=np.int64)
+        self._mean = np.zeros(bins)
+        self._m2 = np.zeros(bins)            # Сумма квадратов отклонений от среднего
+
+    @property
+    def centers(self):
+        return self.theta0 + (np.arange(self.bins) + 0.5)*self.width
+
+    @property
+    def mean(self):
+        return np.where(self.count > 0, self._mean, np.nan)
+
+    @property
+    def variance(self):
+        return np.where(self.count > 1, self._m2/np.maximum(self.count - 1, 1), np.nan)
+
+    @property
+    def coverage(self):
+        """Доля бинов, в которые попал хотя бы один отсчёт."""
+        return np.count_nonzero(self.count)/self.bins
+
+    def index(self, theta):
+        return np.floor((np.asarray(theta, dtype=float) - self.theta0)/self.width).astype(np.int64) % self.bins
+
+    def update(self, theta, values):
+        """Добавляет отсчёты values в бины углов theta (любой оборот и направление)."""
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        idx = np.atleast_1d(self.index(theta))
+        ok = np.isfinite(values)
+        if ok.all() and values.size == 1:        # Один отсчёт с опроса - Уэлфорд без bincount
+            i, x = idx[0], values[0]
+            self.count[i] += 1
+            delta = x - self._mean[i]
+            self._mean[i] += delta/self.count[i]
+            self._m2[i] += delta*(x - self._mean[i])
+            return
+        idx, values = idx[ok], values[ok]
+        n = np.bincount(idx, minlength=self.bins)
+        hit = n > 0
+        mean = np.bincount(idx, values, self.bins)/np.maximum(n, 1)       # Средние порции по бинам
+        m2 = np.bincount(idx, (values - mean[idx])**2, self.bins)[hit]
+        mean = mean[hit]
+        count = self.count[hit]
+        total = count + n[hit]
+        delta = mean - self._mean[hit]
+        self._mean[hit] += delta*n[hit]/total
+        self._m2[hit] += m2 + delta**2*count*n[hit]/total
+        self.count[hit] = total
+
+    def filled(self):
+        """Средние по бинам; пустые бины - периодическая интерполяция по соседним."""
+        mean, full = self.mean, self.count > 0
+        if not full.any():
+            raise ValueError("В накопителе нет отсчётов")
+        if not full.all():
+            centers = self.centers
+            mean[~full] = np.interp(centers[~full], centers[full], mean[full], period=2*np.pi)
+        return mean
+
+
+def binned_multipoles(acc, radius, r_ref=None, n_max=15, unit=LENGTH_UNIT):
+    """
+    Коэффициенты b_n, a_n по накопителю AngleBins со средними dФ/dtheta (В*с/рад)
+    по бинам угла нити. Среднее по бину ширины w ослабляет n-ю гармонику в
+    sinc(n*w/2) раз - это учитывается. Результат как у multipoles (одна строка) и
+    err - стандартная погрешность b_n и a_n по разбросу отсчётов в бинах, Тл*м;
+    coverage - доля заполненных бинов.
+    """
+    if n_max >= acc.bins//2:
+        raise ValueError(f"n_max={n_max} не меньше половины числа бинов {acc.bins}")
+    r_ref = radius if r_ref is None else r_ref
+    n = np.arange(1, n_max + 1)
+    spectrum = rfft(acc.filled(), workers=-1)[1:n_max + 1]*2/acc.bins
+    attenuation = np.sinc(n*acc.width/2/np.pi)           # np.sinc(x) = sin(pi*x)/(pi*x)
+    scale = attenuation*r_ref*unit*(radius/r_ref)**n
+    # dФ/dtheta = Re sum i*n*K_n*exp(i*n*theta), C_n = K_n*n/(r_ref*(r/r_ref)^n)
+    c = spectrum*np.exp(-1j*n*(acc.theta0 + acc.width/2))/(1j*scale)
+    # Дисперсия среднего в бине: общая по всем бинам / число отсчётов в бине
+    dof = np.sum(np.maximum(acc.count - 1, 0))
+    pooled = np.sum(acc._m2)/dof if dof else np.nan
+    sem2 = pooled/np.maximum(acc.count, 1)
+    err = 2/acc.bins*np.sqrt(np.sum(sem2)/2)/scale
+    return _result(n, c[None, :], err=err[None, :], coverage=acc.coverage)
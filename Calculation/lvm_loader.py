@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Загрузка файлов LabVIEW (.lvm и старые .txt со стенда)
+-------------------------------------------------------
+Файл: заголовок LVM (ключ<TAB>значение) до ***End_of_Header***, заголовок
+каналов до второго ***End_of_Header***, строка имён столбцов и числа с
+десятичной запятой. В первой строке данных после чисел идёт столбец Comment
+с результатом и настройками измерения (команды Keithley, перемещения,
+скорости, температуры) - он разбирается в словарь settings.
+
+    run = load_lvm("file957.txt")
+    run["Signal, Volt"], run.settings[":SENS:VOLT:DC:NPLC"], run.to_dataframe()
+
+Числа читаются одним проходом NumPy, а результат кэшируется рядом с файлом
+в <имя>.cache.npz вместе с mtime и размером исходника: повторная загрузка
+не разбирает текст вовсе.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+END_OF_HEADER = "***End_of_Header***"
+CACHE_SUFFIX = ".cache.npz"
+CACHE_VERSION = 1
+_SCPI_TAIL = re.compile(r"(?<=\S)(?=:[A-Za-z])")   # "...-5.2848E-6:SENS:CHAN 2" -> результат | команда
+
+
+def _number(text):
+    """Число из строки настроек (точка или запятая), иначе строка как есть."""
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        return text
+
+
+def parse_settings(comment):
+    """
+    Разбирает комментарий первой строки в словарь.
+    Команды прибора (":SENS:VOLT:DC:NPLC 1.00") - ключ команда, значение аргумент;
+    остальное - "ключ: значение", причём ключ может содержать ", " ("Верт. перемещ. 1, мм").
+    """
+    pieces = []
+    for piece in comment.split(", "):
+        if piece.startswith(":"):
+            pieces.append(piece)
+        else:
+            pieces.extend(p for p in _SCPI_TAIL.split(piece, maxsplit=1) if p)
+    items, key_prefix = [], ""
+    for piece in pieces:
+        if piece.startswith(":"):
+            items.append(piece)
+        elif ":" in piece:
+            items.append(key_prefix + piece)
+            key_prefix = ""
+        else:                     # Часть ключа до запятой - клеим к следующему куску
+            key_prefix += piece + ", "
+    settings = {}
+    for item in items:
+        if item.startswith(":"):
+            command, _, arg = item.partition(" ")
+            settings[command.upper()] = _number(arg.strip())
+        else:
+            key, _, value = item.partition(":")
+            settings[key.strip()] = _number(value.strip())
+    return settings
+
+
+def _parse_header(lines):
+    """Словарь ключ -> значение (или список значений по каналам)."""
+    header = {}
+    for line in lines:
+        fields = [f for f in line.split("\t") if f != ""]
+        if not fields:
+            continue
+        key, values = fields[0], fields[1:]
+        if key not in ("Date", "Time"):         # Время "09:00:44,95..." оставляем строкой
+            values = [_number(v) for v in values]
+        header[key] = values[0] if len(values) == 1 else values
+    return header
+
+
+class LvmRun(object):
+    """
+    Содержимое файла: header (общий заголовок), channels (заголовок каналов),
+    columns (имена числовых столбцов), data (массив n x len(columns)),
+    comment и settings (разобранный комментарий первой строки).
+    """
+    def __init__(self, path, header, channels, columns, data, comment):
+        self.path = path
+        self.header = header
+        self.channels = channels
+        self.columns = columns
+        self.data = data
+        self.comment = comment
+        self.settings = parse_settings(comment) if comment else {}
+
+    def __getitem__(self, name):
+        return self.data[:, self.columns.index(name)]
+
+    def __len__(self):
+        return len(self.data)
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.data, columns=self.columns)
+
+
+def _parse(path, encoding):
+    with open(path, "rb") as f:
+        text = f.read().decode(encoding, errors="replace")
+    first = text.index(END_OF_HEADER)
+    second = text.index(END_OF_HEADER, first + len(END_OF_HEADER))
+    header = _parse_header(text[:first].splitlines())
+    channels = _parse_header(text[first + len(END_OF_HEADER):second].splitlines()[1:])
+    body = text[text.index("\n", second) + 1:]
+    names_line, _, body = body.partition("\n")
+    names = names_line.rstrip("\r").split("\t")
+    columns = [n for n in names if n not in ("X_Value", "Comment", "")]
+    k = len(columns)
+
+    # Первая строка несёт комментарий - разбираем отдельно, остальное одним проходом
+    first_row, _, rest = body.partition("\n")
+    fields = first_row.rstrip("\r").split("\t")
+    start = 1 if names[0] == "X_Value" else 0
+    comment = "\t".join(fields[start + k:]).strip()
+    head = np.array([_number(v) for v in fields[start:start + k]], dtype=float)
+    values = np.array(rest.replace(",", ".").split(), dtype=float)
+    if values.size % k:
+        raise ValueError(f"{path}: в строках данных не по {k} чисел")
+    data = np.vstack([head[None, :], values.reshape(-1, k)]) if head.size == k else values.reshape(-1, k)
+    return LvmRun(path, header, channels, columns, data, comment)
+
+
+def load_lvm(path, encoding="cp1251", cache=True):
+    """Загружает файл LabVIEW; cache=True - читать/писать <path>.cache.npz."""
+    stat = os.stat(path)
+    key = np.array([stat.st_mtime_ns, stat.st_size, CACHE_VERSION], dtype=np.int64)
+    cache_path = path + CACHE_SUFFIX
+    if cache and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as npz:
+                if np.array_equal(npz["key"], key):
+                    meta = json.loads(str(npz["meta"]))
+                    return LvmRun(path, meta["header"], meta["channels"], meta["columns"],
+                                  npz["data"], meta["comment"])
+        except (OSError, KeyError, ValueError):
+            pass                                        # Битый кэш - просто перечитываем
+    run = _parse(path, encoding)
+    if cache:
+        meta = json.dumps({"header": run.header, "channels": run.channels,
+                           "columns": run.columns, "comment": run.comment}, ensure_ascii=False)
+        try:
+            with open(cache_path, "wb") as f:
+                np.savez(f, key=key, data=run.data, meta=np.array(meta))
+        except OSError:
+            pass                                        # Папка только для чтения - без кэша
+    return run
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Графики результатов
+-------------------
+Расчёт (Calc_integrals_func) и отрисовка разделены: GUI передаёт сюда уже
+посчитанные кривые, а рисуются они только когда видны.
+
+PlotView занимает место QLabel из .ui (plot_pic):
+  - с pyqtgraph - родной виджет Qt в раскладке самого QLabel (следует за его
+    размером), кривая обновляется setData без растеризации;
+  - без pyqtgraph - matplotlib (Agg) в PNG размером ровно с QLabel, лениво
+    (при показе/изменении размера) и через RenderCache, так что возврат к уже
+    показанному прогону не перерисовывается.
+
+    view = PlotView(self.plot_pic)
+    view.show(run_file, 'ffi', pos, local, title="I1 = ...")
+
+Во время скана тот же PlotView показывает LivePlot: поток скана дописывает
+точки в кольцевой LiveBuffer, а таймер GUI с частотой кадров забирает только
+новый хвост, прореживает его min/max по столбцам (MinMaxDecimator) и
+перерисовывает - стоимость кадра не растёт с длиной прогона.
+"""
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PyQt6 import QtGui, QtWidgets
+from PyQt6.QtCore import QEvent, QObject, QTimer
+
+try:
+    import pyqtgraph as pg
+except ImportError:     # Без pyqtgraph графики рисуются matplotlib в QPixmap
+    pg = None
+
+# Подписи осей по виду графика
+PLOT_LABELS = {
+    'ffi': ('Координата нити (мм)', 'Первый интеграл магнитного поля'),
+    'sfi': ('Координата ведущего конца нити (мм)', 'Поток, В*с'),
+    'circ': ('Угол нити, градусы', 'dФ/dθ, В*с/рад'),
+    'map': ('Координата нити вдоль прохода (мм)', 'Первый интеграл по строкам карты'),
+    'live_eds': ('Время, с', 'ЭДС, В'),
+    'live_pos': ('Время, с', 'Координата, мм'),
+}
+RENDER_DPI = 100
+LIVE_FPS = 25               # Частота кадров живого графика (pyqtgraph)
+LIVE_FPS_RENDER = 2         # ... и без pyqtgraph, когда каждый кадр - отрисовка matplotlib
+
+
+class RenderCache(object):
+    """LRU-кэш отрисовок. Ключ - (id прогона, вид графика, размер)."""
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key, render):
+        """Отрисовка из кэша; при промахе вызывает render() и запоминает результат."""
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        value = render()
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def render_png(curve, size, dpi=RENDER_DPI):
+    """PNG кривой {'kind', 'x', 'y', 'title'} размером size = (ширина, высота) в пикселях."""
+    width, height = size
+    fig = Figure(figsize=(width/dpi, height/dpi), dpi=dpi)
+    FigureCanvasAgg(fig)                       # Без pyplot: не трогает глобальное состояние
+    ax = fig.add_subplot()
+    ax.plot(curve['x'], curve['y'])
+    xlabel, ylabel = PLOT_LABELS.get(curve['kind'], ('', ''))
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(curve['title'])
+    ax.grid(which="both", linestyle="--")
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi)
+    return buf.getvalue()
+
+
+class PlotView(QObject):
+    """
+    График результата скана на месте label (QLabel из .ui).
+    native=None - pyqtgraph, если установлен; False - всегда matplotlib в label.
+    """
+    def __init__(self, label, cache=None, native=None):
+        super().__init__(label)
+        self.label = label
+        self.cache = cache if cache is not None else RenderCache()
+        self.curve = None
+        self.key = None
+        if native is None:
+            native = pg is not None
+        if native:
+            self.widget = pg.PlotWidget(background='w')
+            self.widget.showGrid(x=True, y=True)
+            self._item = self.widget.plot(pen=pg.mkPen('b'))
+            layout = label.layout() or QtWidgets.QVBoxLayout(label)
+            layout.setContentsMargins(0, 0, 0, 0)
+            layout.addWidget(self.widget)
+        else:
+            self.widget = None
+            label.installEventFilter(self)
+
+    def show(self, run_id, kind, x, y, title=""):
+        """Показывает кривую прогона run_id; kind - вид графика (ключ PLOT_LABELS)."""
+        self.key = (run_id, kind)
+        self.curve = {'kind': kind, 'x': x, 'y': y, 'title': title}
+        if self.widget is not None:
+            xlabel, ylabel = PLOT_LABELS.get(kind, ('', ''))
+            self.widget.setLabel('bottom', xlabel)
+            self.widget.setLabel('left', ylabel)
+            self.widget.setTitle(title)
+            self._item.setData(x, y, connect='finite')    # Исключённые интервалы (NaN) - разрывы
+        elif self.label.isVisible():
+            self._render()
+
+    def live(self, x, y, title=""):
+        """Кадр живого графика: без кэша, без pyqtgraph - только если график виден."""
+        self.key = None
+        self.curve = {'kind': self.curve['kind'] if self.curve else '', 'x': x, 'y': y, 'title': title}
+        if self.widget is not None:
+            self.widget.setTitle(title)
+            self._item.setData(x, y, connect='finite')
+        elif self.label.isVisible():
+            self._render()
+
+    def set_kind(self, kind):
+        """Подписи осей для живого графика вида kind."""
+        self.curve = {'kind': kind, 'x': [], 'y': [], 'title': ""}
+        if self.widget is not None:
+            xlabel, ylabel = PLOT_LABELS.get(kind, ('', ''))
+            self.widget.setLabel('bottom', xlabel)
+            self.widget.setLabel('left', ylabel)
+
+    def eventFilter(self, obj, event):
+        if self.curve is not None and event.type() in (QEvent.Type.Show, QEvent.Type.Resize):
+            self._render()
+        return False
+
+    def _render(self):
+        size = (self.label.width(), self.label.height())
+        if self.key is None:                    # Живой кадр - в кэш не кладём
+            self.label.setPixmap(self._pixmap(size))
+        else:
+            self.label.setPixmap(self.cache.get(self.key + (size,), lambda: self._pixmap(size)))
+
+    def _pixmap(self, size):
+        pixmap = QtGui.QPixmap()
+        pixmap.loadFromData(render_png(self.curve, size))
+        return pixmap
+
+
+class LiveBuffer(object):
+    """
+    Кольцевой буфер точек (t, y, pos) фиксированного размера. Пишет поток скана,
+    читает таймер GUI; total - сколько точек записано всего.
+    """
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self._data = np.zeros((3, capacity))
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def extend(self, t, y, pos):
+        t, y, pos = (np.atleast_1d(np.asarray(a, dtype=float)) for a in (t, y, pos))
+        n = t.size
+        if n > self.capacity:
+            t, y, pos, n = t[-self.capacity:], y[-self.capacity:], pos[-self.capacity:], self.capacity
+        with self._lock:
+            idx = (self.total + np.arange(n)) % self.capacity
+            self._data[:, idx] = t, y, pos
+            self.total += n
+
+    def since(self, start):
+        """Точки, записанные после total == start (не старше ёмкости буфера), и новый total."""
+        with self._lock:
+            end = self.total
+            start = max(start, end - self.capacity)
+            idx = np.arange(start, end) % self.capacity
+            return self._data[:, idx], end
+
+
+class MinMaxDecimator(object):
+    """
+    Инкрементное прореживание: точки складываются в корзины по size отсчётов,
+    от корзины на экран идут min и max. Когда корзин больше 2*columns, соседние
+    сливаются попарно и size удваивается - на экране всегда не больше 4*columns точек.
+    """
+    def __init__(self, columns=800):
+        self.columns = columns
+        self.size = 1
+        self.t = np.empty(0)
+        self.lo = np.empty(0)
+        self.hi = np.empty(0)
+        self.n = np.empty(0, dtype=int)
+
+    def add(self, t, y):
+        i = 0
+        if self.n.size and self.n[-1] < self.size:              # Дополняем неполную корзину
+            i = min(self.size - self.n[-1], t.size)
+            self.lo[-1] = np.fmin(self.lo[-1], np.nanmin(y[:i], initial=np.inf))
+            self.hi[-1] = np.fmax(self.hi[-1], np.nanmax(y[:i], initial=-np.inf))
+            self.n[-1] += i
+        full = (t.size - i)//self.size
+        j = i + full*self.size
+        blocks = y[i:j].reshape(full, self.size)
+        parts = [(t[i:j:self.size], np.nanmin(blocks, axis=1, initial=np.inf),
+                  np.nanmax(blocks, axis=1, initial=-np.inf), np.full(full, self.size))]
+        if j < t.size:
+            parts.append((t[j:j + 1], [np.nanmin(y[j:], initial=np.inf)], [np.nanmax(y[j:], initial=-np.inf)],
+                          [t.size - j]))
+        for bt, lo, hi, n in parts:
+            self.t = np.concatenate([self.t, bt])
+            self.lo = np.concatenate([self.lo, lo])
+            self.hi = np.concatenate([self.hi, hi])
+            self.n = np.concatenate([self.n, n])
+        while self.n.size > 2*self.columns:
+            self._merge()
+
+    def _merge(self):
+        odd = self.n.size % 2
+        m = self.n.size - odd
+        tail = [a[m:] for a in (self.t, self.lo, self.hi, self.n)]
+        self.t = np.concatenate([self.t[:m:2], tail[0]])
+        self.lo = np.concatenate([np.fmin(self.lo[:m:2], self.lo[1:m:2]), tail[1]])
+        self.hi = np.concatenate([np.fmax(self.hi[:m:2], self.hi[1:m:2]), tail[2]])
+        self.n = np.concatenate([self.n[:m:2] + self.n[1:m:2], tail[3]])
+        self.size *= 2
+
+    def curve(self):
+        """Точки для отрисовки: min и max каждой корзины."""
+        return np.repeat(self.t, 2), np.column_stack([self.lo, self.hi]).ravel()
+
+
+class LivePlot(QObject):
+    """
+    Живой график скана в PlotView. feed(chunk) вызывается из потока скана
+    (chunk - словарь частичных данных ScanContext.data: time и eds или pos,
+    числа или массивы); перерисовка - по таймеру GUI.
+    Для ЭДС в заголовке - текущая оценка первого интеграла sum(ЭДС*dt)/dx.
+    """
+    def __init__(self, view, capacity=1 << 16, columns=None):
+        super().__init__(view)
+        self.view = view
+        self.buffer = LiveBuffer(capacity)
+        self.columns = columns
+        self.timer = QTimer(self)
+        fps = LIVE_FPS if view.widget is not None else LIVE_FPS_RENDER
+        self.timer.setInterval(int(1000/fps))
+        self.timer.timeout.connect(self.update)
+
+    def start(self):
+        """Новый скан: очищает буфер и запускает перерисовку."""
+        self.buffer = LiveBuffer(self.buffer.capacity)
+        width = self.view.widget.width() if self.view.widget is not None else self.view.label.width()
+        self.decimator = MinMaxDecimator(self.columns or max(width, 100))
+        self._drawn = 0
+        self._kind = None
+        self._flux, self._last, self._pos0 = 0.0, None, None
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.update()
+
+    def feed(self, chunk):
+        y = chunk.get('eds')
+        kind = 'live_eds' if y is not None else 'live_pos'
+        pos = chunk.get('pos', chunk.get('x_pos'))
+        if y is None:
+            y = pos
+        if y is None or 'time' not in chunk:
+            return
+        self._kind = self._kind or kind
+        self.buffer.extend(chunk['time'], y, np.nan if pos is None else pos)
+
+    def update(self):
+        (t, y, pos), self._drawn = self.buffer.since(self._drawn)
+        if not t.size:
+            return
+        if self.view.curve is None or self.view.curve['kind'] != self._kind:
+            self.view.set_kind(self._kind)
+        self.decimator.add(t, y)
+        title = ""
+        if self._kind == 'live_eds':
+            # Поток накапливается по новым точкам, с последней точкой прошлого кадра
+            if self._last is not None:
+                t, y, pos = (np.concatenate([[a], b]) for a, b in zip(self._last, (t, y, pos)))
+            self._flux += np.sum((y[1:] + y[:-1])/2*np.diff(t))
+            self._last = (t[-1], y[-1], pos[-1])
+            if self._pos0 is None:
+                self._pos0 = pos[0]
+            shift = pos[-1] - self._pos0
+            if shift:
+                title = f"I1 ≈ {self._flux/shift:.4e}"
+        self.view.live(*self.decimator.curve(), title)
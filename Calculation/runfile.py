@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Файл прогона (run file)
+-----------------------
+Двоичный формат для записи скана по ходу измерения вместо CSV в конце.
+
+    8 байт   магия b"SWRUN001"
+    4 байта  длина заголовка H (uint32, little-endian)
+    H байт   JSON-заголовок (UTF-8, с запасом HEADER_SLACK байт, дополнен пробелами до кратного 4096):
+             {"fields": [["time", "<f8"], ...], "meta": {...}, "complete": false}
+    далее    записи фиксированного размера в little-endian, только дописываются
+
+Записи пишутся порциями (RunWriter.append/extend + flush), так что при сбое
+теряется лишь последняя незаписанная порция, а оборванная запись в конце
+отбрасывается при чтении. Заголовок с запасом места перезаписывается при
+close(): там отмечается "complete" (только если прогон дошёл до конца -
+close(complete=False) после отмены или ошибки) и итоговые метаданные.
+
+Чтение без копирования:
+
+    run = open_run("runs/ffi_20250519_120000.run")
+    run.meta["speed"], run.data["eds"]      # data - numpy.memmap записей
+"""
+import json
+import os
+import struct
+import warnings
+
+import numpy as np
+
+RUN_MAGIC = b"SWRUN001"
+HEADER_ALIGN = 4096
+HEADER_SLACK = 1024    # Запас заголовка под "complete", "records" и метаданные close()
+_LENGTH = struct.Struct("<I")
+
+
+def _header_bytes(header, size=None):
+    """Заголовок размера size (None - с запасом HEADER_SLACK до кратного HEADER_ALIGN)
+    или None, если header в size не помещается."""
+    text = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    if size is None:
+        size = -(-(len(RUN_MAGIC) + _LENGTH.size + len(text) + HEADER_SLACK)//HEADER_ALIGN)*HEADER_ALIGN
+    pad = size - len(RUN_MAGIC) - _LENGTH.size - len(text)
+    if pad < 0:
+        return None
+    return RUN_MAGIC + _LENGTH.pack(len(text) + pad) + text + b" "*pad
+
+
+def _to_json(value):
+    """Метаданные: numpy-типы в обычные числа и списки."""
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class RunWriter(object):
+    """
+    Дописывает записи в файл прогона.
+    fields - список (имя, dtype) каналов, например [("time", "<f8"), ("eds", "<f8")];
+    metadata - словарь параметров скана (оси, скорость, NPLC, радиус...);
+    chunk - число записей, после которого порция сбрасывается на диск.
+    """
+    def __init__(self, path, fields, metadata=None, chunk=256):
+        self.path = path
+        self.dtype = np.dtype([(name, np.dtype(dt).newbyteorder("<")) for name, dt in fields])
+        self.header = {"fields": [[name, self.dtype[name].str] for name in self.dtype.names],
+                       "meta": _to_json(dict(metadata or {})), "complete": False}
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        head = _header_bytes(self.header)
+        self._header_size = len(head)
+        self._file = open(path, "wb")
+        self._file.write(head)
+        self._file.flush()
+        self._chunk = np.zeros(chunk, dtype=self.dtype)
+        self._pending = 0
+        self.records = 0
+
+    def append(self, *values, **named):
+        """Одна запись: значениями по порядку полей или по именам."""
+        if values:
+            self._chunk[self._pending] = values
+        for name, value in named.items():
+            self._chunk[name][self._pending] = value
+        self._pending += 1
+        self.records += 1
+        if self._pending == self._chunk.size:
+            self.flush()
+
+    def extend(self, columns=None, **named):
+        """Много записей сразу: структурированный массив или массивы по именам полей."""
+        if columns is None:
+            columns = named
+        if isinstance(columns, np.ndarray):
+            block = columns.astype(self.dtype, copy=False)
+        else:
+            n = len(next(iter(columns.values())))
+            block = np.zeros(n, dtype=self.dtype)
+            for name, value in columns.items():
+                block[name] = value
+        self.flush()
+        self._file.write(block.tobytes())
+        self.records += block.size
+
+    def flush(self, fsync=False):
+        """Сбрасывает накопленную порцию на диск."""
+        if self._pending:
+            self._file.write(self._chunk[:self._pending].tobytes())
+            self._pending = 0
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self, complete=True, **metadata):
+        """Дописывает порцию и отмечает прогон завершённым (complete=False - прерванным);
+        metadata дополняет заголовок."""
+        if self._file is None:
+            return
+        try:
+            self.flush()
+            meta = dict(self.header["meta"])
+            self.header["meta"].update(_to_json(metadata))
+            self.header["complete"] = bool(complete)
+            self.header["records"] = self.records
+            head = _header_bytes(self.header, self._header_size)
+            if head is None:       # Метаданные close() не влезли в запас - отметка завершения важнее
+                warnings.warn(f"{self.path}: итоговые метаданные не помещаются в заголовок и не записаны")
+                self.header["meta"] = meta
+                head = _header_bytes(self.header, self._header_size)
+            if head is None:
+                raise RuntimeError(f"{self.path}: заголовок прогона не помещается в отведённое место")
+            self._file.seek(0)
+            self._file.write(head)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+
+
+class RunFile(object):
+    """Прочитанный прогон: meta - метаданные, data - numpy.memmap записей (только чтение)."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic = f.read(len(RUN_MAGIC))
+            if magic != RUN_MAGIC:
+                raise ValueError(f"{path}: не файл прогона")
+            length, = _LENGTH.unpack(f.read(_LENGTH.size))
+            self.header = json.loads(f.read(length).decode("utf-8"))
+        self.offset = len(RUN_MAGIC) + _LENGTH.size + length
+        self.dtype = np.dtype([(name, dt) for name, dt in self.header["fields"]])
+        n = (os.path.getsize(path) - self.offset)//self.dtype.itemsize  # Оборванная запись отбрасывается
+        if n:
+            self.data = np.memmap(path, dtype=self.dtype, mode="r", offset=self.offset, shape=(n,))
+        else:
+            self.data = np.zeros(0, dtype=self.dtype)
+
+    @property
+    def meta(self):
+        return self.header["meta"]
+
+    @property
+    def complete(self):
+        return self.header.get("complete", False)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+
+def open_run(path):
+    return RunFile(path)
+
+
+def export_csv(path, csv_path):
+    """Сохраняет прогон в CSV (столбцы - поля записей) для внешних программ."""
+    run = RunFile(path)
+    np.savetxt(csv_path, np.column_stack([run[name] for name in run.dtype.names]),
+               delimiter=",", header=",".join(run.dtype.names), comments="")
@@ -23,16 +23,13 @@ print(df.head())
 print(df.describe())  # Статистика по всем столбцам
 
 
-# Убираем DC-компоненту (вычитаем среднее значение)
-df['EDS'] -= np.mean(df['EDS'])
-
-# Применяем оконную функцию Ханна
+# Убираем DC-компоненту и применяем окно Ханна (df['EDS'] не меняем)
 window = get_window("hann", len(df['EDS']))  # Создаем окно Ханна
-df['EDS'] *= window  # Применяем окно к сигналу
+eds = (df['EDS'].to_numpy() - np.mean(df['EDS']))*window
 
 # Выполняем преобразование Фурье
 N = len(df['Time'])  # Количество точек во временном ряду
-fft_values = fft(df['EDS'])  # Преобразование Фурье для ЭДС
+fft_values = fft(eds)  # Преобразование Фурье для ЭДС
 
 # Вычисление частот (правильный вариант)
 dt = df['Time'][1] - df['Time'][0]  # шаг дискретизации
@@ -9,19 +9,52 @@ from __future__ import division, print_function
 import acsc_modified as acsc
 import newACS
 from Calculation import Calc_integrals_func as calc #!КАК ИМПОРТИРОВАТЬ
-from Keithley_2182A.keithley import Keithley2182A as ktl
+from Calculation import harmonics
+from Calculation.plotting import LivePlot, PlotView
+import emergency
+import interrupts
+import scan_plan
+import scans
+from qt_interrupts import QtInterrupts
+from scan_worker import ScanWorker
 import time
-from PyQt6 import QtGui
-import io
-from PyQt6.QtWidgets import QApplication, QMainWindow, QMessageBox
-from PyQt6.QtCore import Qt, QSize, QTimer
+from PyQt6.QtWidgets import QApplication, QComboBox, QLineEdit, QMainWindow, QMessageBox
+from PyQt6.QtCore import Qt, QRect, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import QKeySequence, QShortcut
 # Импортируем сгенерированный класс. Команда: pyuic6 GUI_for_controller_with_tabs2.ui -o GUI_for_controller_with_tabs2.py
 from GUI_for_controller_with_tabs2 import Ui_MainWindow
 import numpy as np
-import csv
+import os
+
+# Вольтметр: на стенде - GPIB, при работе с симулятором контроллера - симулятор Keithley
+KEITHLEY_RESOURCE = os.environ.get("KEITHLEY_RESOURCE",
+                                   "SIM::7::INSTR" if acsc.BACKEND == "sim" else "GPIB0::7::INSTR")
+# Подключение PEG оси-лидера к Trigger Link вольтметра - коды AssignPegNT (энкодер -> PEG engine,
+# PEG engine -> выходы) по схеме стенда: PEG_BITCODES="0x..,0x..". Без них скан PEG не запускается
+_peg_bitcodes = os.environ.get("PEG_BITCODES", "0,0" if acsc.BACKEND == "sim" else "")
+PEG_BITCODES = tuple(int(v, 0) for v in _peg_bitcodes.split(",")) if _peg_bitcodes else None
+if acsc.BACKEND == "sim":
+    from Keithley_2182A import keithley_sim
+    keithley_sim.configure(field=keithley_sim.MultipoleField({1: 1e-3, 2: 5e-3},  # Диполь + квадруполь, Тл*м на r=10 мм
+                                                             wire_length=3.0),
+                           wire=keithley_sim.acs_wire(acsc.acs),
+                           trigger=keithley_sim.acs_peg_trigger(acsc.acs, (1, 0)),
+                           clock=acsc.acs.clock)
+
+RUN_DIR = "runs"                                   # Файлы прогонов (Calculation.runfile)
+WIRE_LENGTH = 3000.0                               # Длина нити между кареток, мм (для второго интеграла)
+FFI_PEG_MODE = "Первый интеграл (PEG)"
+FFI_STREAM_MODE = "Первый интеграл (поток)"
+FFI_BIDIR_MODE = "Первый интеграл (туда-обратно)"
+MAP_MODE = "Карта первого интеграла"
+MAP_ORDERS = {"Змейкой": "serpentine", "Ближайший сосед": "nearest"}   # Порядок обхода (scan_plan)
+EMERGENCY_HOTKEY = "Esc"                           # Аварийная остановка из любого окна приложения
+STOP_REASON = "Стоп в окне"                        # Причина остановки кнопкой/клавишей (без окна с ошибкой)
 
 
 class ACSControllerGUI(QMainWindow, Ui_MainWindow):
+    emergency_stopped = pyqtSignal(str, list)                    # Сторож остановил оси: причина, оси
+
     def __init__(self):
         super().__init__()
         self.setupUi(self)  # Инициализация интерфейса
@@ -54,6 +87,31 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             for i in range(4)
         }
 
+        self.check_mode.insertItem(1, FFI_PEG_MODE)              # Режимов нет в .ui, добавляем здесь
+        self.check_mode.insertItem(2, FFI_STREAM_MODE)
+        self.check_mode.insertItem(3, FFI_BIDIR_MODE)
+        self.ffi_repeats_input = QLineEdit(parent=self.tab_2)      # Повторы туда-обратно, рядом с расстоянием
+        self.ffi_repeats_input.setGeometry(QRect(300, 220, 61, 21))
+        self.ffi_repeats_input.setPlaceholderText("Повторы")
+        self.check_mode.insertItem(4, MAP_MODE)
+        self.map_grid_input = QLineEdit(parent=self.tab_2)         # Сетка карты: "x0:x1:nx y0:y1:ny", мм
+        self.map_grid_input.setGeometry(QRect(20, 260, 181, 21))
+        self.map_grid_input.setPlaceholderText("x0:x1:nx y0:y1:ny")
+        self.map_order_input = QComboBox(parent=self.tab_2)
+        self.map_order_input.setGeometry(QRect(220, 260, 141, 21))
+        self.map_order_input.addItems(list(MAP_ORDERS))
+        self.circ_turns_input = self.lineEdit_3                  # Свободное поле рядом с радиусом и скоростью
+        self.circ_turns_input.setPlaceholderText("Обороты")
+        self.scan_worker = None                                  # Текущий скан (scan_worker.ScanWorker)
+        self.interrupts = None                                   # Прерывания контроллера (QtInterrupts) после подключения
+        self.watchdog = None                                     # Сторож аварийной остановки (emergency.EmergencyWatchdog)
+        self.emergency_stopped.connect(self.on_emergency_stop)
+        self.stop_shortcut = QShortcut(QKeySequence(EMERGENCY_HOTKEY), self)
+        self.stop_shortcut.setContext(Qt.ShortcutContext.ApplicationShortcut)
+        self.stop_shortcut.activated.connect(self.stop_all_axes)
+        self.scan_partial = []
+        self.plot_view = PlotView(self.plot_pic)                 # Графики результатов вместо картинки в plot_pic
+        self.live_plot = LivePlot(self.plot_view)                # ... и живой график во время скана
         self.connect_ui_elements()                               # Подключаем функции к элементам интерфейса
         self.selected_axes = []
 
@@ -103,6 +161,23 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             # self.set_default_values() # Устанавливаем дефолтные значения при успешном подключении
             for i in range(4):        # После успешного подключения обновляем ссылки на оси в словарях
                 self.axes_data[i]["axis_obj"] = self.stand.axes[i]
+            try:                      # Конец движения и отказы осей - прерываниями, без опроса MST
+                self.interrupts = QtInterrupts(self.stand.hc, parent=self)
+                self.interrupts.motion_end.connect(self.on_motion_end)
+                self.interrupts.failure.connect(self.on_axis_failure)
+            except RuntimeError as e:
+                print(f"Прерывания контроллера недоступны, конец движения - опросом: {e}")
+                self.interrupts = None
+            # Свой поток и своё соединение: остановка не ждёт ни окна, ни скана
+            self.watchdog = emergency.EmergencyWatchdog(self.stand.ip, self.stand.port, axes=range(4),
+                                                        on_stop=self.emergency_stopped.emit)
+            try:
+                self.watchdog.start()
+                self.stand.faults = self.watchdog.faults   # is_blocked - по последнему опросу сторожа
+                self.watchdog.install_signal()             # Стоп извне: kill -USR1 <pid> (Windows - Ctrl+Break)
+            except RuntimeError as e:
+                self.show_error(f"{e}. Стоп - только через соединение окна")
+                self.watchdog = None
                 
 
     def toggle_axis(self, axis):
@@ -218,11 +293,6 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             self.show_error("Контроллер не подключён!")
             return
         
-        self.oneAxisLog = {  # Инициализация лога
-            'time': [],
-            'pos': [],
-        }
-
         data = self.axes_data[axis]
         if data['state'] and axis in self.selected_axes:
             try:
@@ -235,8 +305,6 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
                     self.pos_timer.start()
                 # while True:
                 #     pos = acsc.getFPosition(self.stand.hc, axis)
-                #     self.oneAxisLog['pos'].append(pos)
-                #     self.oneAxisLog['time'].append(time.time() - start_time)
 
                 #     motor_state = acsc.getMotorState(self.stand.hc, axis)        # Если ось не движется, то закрываем цикл
                 #     if not motor_state['moving']:
@@ -276,7 +344,7 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
                 self.pos_timer.start()
         except Exception as e:
             self.show_error(f"Ошибка при запуске синхронного движения: {e}")
-        acsc.waitMotionEnd(self.stand.hc, leader, 30000)
+        # Конец движения - сигналом interrupts.motion_end (или опросом в update_positions)
         if not self.selected_axes:
             self.show_error("Нет включённых осей для движения!")
 
@@ -286,141 +354,131 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             self.show_error("Контроллер не подключён!")
             return
 
+        if self.watchdog is not None:      # killAll по соединению сторожа - сразу, без очереди вызовов окна
+            self.watchdog.kill(STOP_REASON)
+        if self.scan_worker is not None:   # Скан в потоке заметит отмену на ближайшем опросе
+            self.scan_worker.cancel()
         try:
-            acsc.killAll(self.stand.hc, acsc.SYNCHRONOUS)
+            if self.watchdog is None:
+                acsc.killAll(self.stand.hc, acsc.SYNCHRONOUS)
             if self.pos_timer.isActive():
                 self.pos_timer.stop()
         except Exception as e:
             self.show_error(f"Ошибка при остановке осей: {e}")
 
+    def on_emergency_stop(self, reason, axes):
+        """Сторож остановил оси axes: по запросу (Стоп, Esc, UDP, сигнал), концевику или отказу."""
+        print(f"Аварийная остановка осей {axes}: {reason}")
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+        self.update_positions()
+        if reason != STOP_REASON:
+            self.show_error(f"Аварийная остановка осей {axes}: {reason}")
+
+    def closeEvent(self, event):
+        """При закрытии окна прерывает скан и дожидается его потока."""
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+            self.scan_worker.wait(5000)
+        if self.interrupts is not None:
+            self.interrupts.close()
+            interrupts.detach(self.stand.hc)
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        super().closeEvent(event)
+
     def show_error(self, message):
         """Показывает сообщение об ошибке."""
         QMessageBox.critical(self, "Ошибка", message)
 
     def update_positions(self):
+        """Обновляет позиции и состояние выбранных осей. Возвращает снимок состояния (или None).
+        Без прерываний таймер останавливается здесь, когда ось пришла на место."""
         data = self.axes_data
-        for i in self.selected_axes:
-            try:
-                current_pos = data[i]['axis_obj'].get_pos()
-                data[i]["pos_label"].setText(f"Текущая позиция:  {current_pos:.4f}")
-                axis_state = acsc.getAxisState(self.stand.hc, i)
-                mot_state = acsc.getMotorState(self.stand.hc, i)
-                data[i]["is_moving_label"].setText(f"В движении    {axis_state['moving']}")
-                data[i]["is_moving_indicator"].setStyleSheet("background-color:rgb(0, 128, 0)")
-                data[i]['is_in_pos_label'].setText(f"На месте    {mot_state['in position']}")
-                if mot_state['in position']:
+        if not self.selected_axes:
+            return None
+        try:
+            snap = self.stand.snapshot(self.selected_axes)  # Все оси одним запросом массивов FPOS/FVEL/MST/AST/FAULT
+        except Exception as e:
+            print(f"Ошибка при получении состояния осей {self.selected_axes}: {e}")
+            return None
+        for rec in snap:
+            i = int(rec.axis)
+            moving = bool(rec.ast & acsc.AST_MOVE)
+            in_position = bool(rec.mst & acsc.MST_INPOS)
+            data[i]["pos_label"].setText(f"Текущая позиция:  {rec.fpos:.4f}")
+            data[i]["is_moving_label"].setText(f"В движении    {moving}")
+            data[i]["is_moving_indicator"].setStyleSheet("background-color:rgb(0, 128, 0)")
+            data[i]['is_in_pos_label'].setText(f"На месте    {in_position}")
+            if in_position:
+                if self.interrupts is None:
                     self.pos_timer.stop()
-                    data[i]["is_moving_indicator"].setStyleSheet("background-color:rgb(255, 0, 0)")
-                    data[i]["is_in_pos_indicator"].setStyleSheet("background-color:rgb(0, 128, 0)")
-            except Exception as e:
-                print(f"Ошибка при получении позиции оси {i}: {e}")
+                data[i]["is_moving_indicator"].setStyleSheet("background-color:rgb(255, 0, 0)")
+                data[i]["is_in_pos_indicator"].setStyleSheet("background-color:rgb(0, 128, 0)")
+        return snap
+
+    def on_motion_end(self, mask):
+        """Прерывание конца движения осей mask: последние позиции и остановка таймера,
+        если ни одна выбранная ось больше не движется (во время скана таймер работает до конца)."""
+        snap = self.update_positions()
+        moving = snap is not None and bool(np.any(snap.ast & acsc.AST_MOVE))
+        if not moving and self.scan_worker is None and self.pos_timer.isActive():
+            self.pos_timer.stop()
+
+    def on_axis_failure(self, interrupt, mask):
+        """Прерывание отказа движения или двигателя осей mask."""
+        kind = "двигателя" if interrupt == acsc.INTR_MOTOR_FAILURE else "движения"
+        self.update_positions()
+        self.show_error(f"Отказ {kind} осей {acsc.maskAxes(mask)}")
 
     #TODO добавить функцию, которая выводит нить на точку на радиусе окружности прямо с магнитной оси
     #TODO добавить провекру на совпадение координат противположных осей???
     def start_circular_motion(self): #! ПОКА ЧТО НАЧИНАЕТ ДВИЖЕНИЕ ИЗ ТОЧКИ ГДЕ СЕЙЧАС НАХОДИТСЯ
         """
-        Запускает движение нити по окружности с заданными параметрами.
+        Запускает движение нити по окружности с заданными параметрами (scans.circular_scan).
         Концы нити всегда находятся в одних и тех же координатах.
         """
         if not self.stand:
             self.show_error("Контроллер не подключён!")
             return
 
-        # Инициализация лога координат
-        self.circular_motion_log = {
-            'time': [],
-            'theta': [],
-            'x_pos': [],
-            'y_pos': [],
-            'eds':[],
-        }
         self.start_time = time.time()
-        vector_velocity = float(self.circ_speed_input.text())
-        radius = float(self.circ_radius_input.text())
-
-        axesM = [0, 1, 2, 3]  # List of axes to move (all) for toPointM
-        leader = axesM[0]
-
-        center_x = self.axes_data[1]["axis_obj"].get_pos()  # Получаем текущую позицию оси 1
-        center_y = self.axes_data[0]["axis_obj"].get_pos()  # Получаем текущую позицию оси 0
-        circle_angle_rad = 2*np.pi  # Whole circle
-        center_point = [center_x, center_y]
-        center_points = [center_y, center_x, center_y, center_x]
-
-        start_x = center_x + radius
-        start_y = center_y
-        start_point = [start_x, start_y]
-        start_points = [start_y, start_x, start_y, start_x]
+        try:
+            circ = {'velocity': float(self.circ_speed_input.text()),
+                    'radius': float(self.circ_radius_input.text()),
+                    'turns': int(self.circ_turns_input.text() or 1),
+                    'resource': KEITHLEY_RESOURCE}
+        except ValueError:
+            self.show_error("Ошибка: введите число через точку (обороты - целое)")
+            return
+        if not 1 <= circ['turns'] <= scans.MAX_TURNS:
+            self.show_error(f"Число оборотов должно быть от 1 до {scans.MAX_TURNS}")
+            return
 
         self.stand.enable_all()  # Включаем все оси перед движением
-        acsc.toPointM(self.stand.hc, acsc.AMF_RELATIVE, axesM, start_points, acsc.SYNCHRONOUS)
-        acsc.waitMotionEnd(self.stand.hc, leader, 30000)
-        print('Прибыла в начальную точку')
-
-        try:
-            acsc.extendedSegmentedMotionV2(self.stand.hc, acsc.AMF_VELOCITY,
-                                        axesM, start_points,
-                                        vector_velocity, #? Tangential velocity 😎😎😎!!!!! (мб 10 мм/с)
-                                        acsc.NONE, # EndVelocity
-                                        acsc.NONE, # JunctionVelocity
-                                        acsc.NONE, # Angle
-                                        acsc.NONE, # CurveVelocity
-                                        acsc.NONE, # Deviation
-                                        radius, # Radius
-                                        acsc.NONE, # MaxLength
-                                        acsc.NONE, # StarvationMargin
-                                        None,      # Segments (имя массива, если нужно > 50 сегм.)
-                                        acsc.NONE, # ExtLoopType
-                                        acsc.NONE, # MinSegmentLength
-                                        acsc.NONE, # MaxAllowedDeviation
-                                        acsc.NONE, # OutputIndex
-                                        acsc.NONE, # BitNumber
-                                        acsc.NONE, # Polarity
-                                        acsc.NONE, # MotionDelay
-                                        None       # Wait (синхронный вызов планирования)
-                                        )
-        except Exception as e:
-            print(f"Ошибка при запуске движения по окружности (extendedSegmentedMotionV2)")
-        
+        self.run_scan(scans.circular_scan, circ, self.finish_circular_motion)
+
+    def finish_circular_motion(self, result):
+        """Мультиполи по средним dФ/dtheta за все обороты и график среднего по углу."""
+        self.circular_motion_log = result['log']    # Последние опросы: time, fpos, fvel, eds, status осей, theta нити
+        circ, bins = result['params'], result['bins']
+        self.circular_bins = bins
+        print(f"Оборотов: {circ['turns']}, отсчётов: {bins.count.sum()}, "
+              f"заполнено бинов: {bins.coverage:.0%}")
         try:
-            '''Добавляем дугу (360 градусов окружнсоть) 😊😊😊😊😊'''
-            acsc.segmentArc2V2(self.stand.hc,
-                               acsc.AMF_VELOCITY,
-                               axesM,
-                               center_points,
-                               circle_angle_rad,
-                               None,           # FinalPoint (для вторичных осей, если есть)
-                               vector_velocity,      #? Using the previous velosity we input
-                               acsc.NONE,      # EndVelocity 
-                               acsc.NONE,      # Time
-                               None,           # Values (для user variables)
-                               None,           # Variables (для user variables)
-                               acsc.NONE,      # Index (для user variables)
-                               None,           # Masks (для user variables)
-                               acsc.NONE,      # ExtLoopType
-                               acsc.NONE,      # MinSegmentLength
-                               acsc.NONE,      # MaxAllowedDeviation
-                               acsc.NONE,      # LciState
-                               None            # Wait (синхронный вызов планирования)
-                               )
-        except Exception as e:
-            print(f"Ошибка при добавлении дуги (acsc.segmentArc2V2)")
-        
-        try:
-            acsc.endSequenceM(self.stand.hc, axesM, None)
-            '''The function informs the controller, that no more points 
-        or segments will be specified for the current multi-axis motion.
-        Эта функция сигнализирует контроллеру: "Все, описание траектории закончено.
-        Больше сегментов не будет.'''
-        except Exception as e:
-            print(f"Ошибка при завершении сегмента (acsc.endSequenceM)")
-            #!ВОЗМОЖНО СТОИТ ПЕРВУЮ ФУНКЦИЮ ЗАПУСТИТЬ ПОСЛЕДНЕЙ!!!!
-        
-        acsc.waitMotionEnd(self.stand.hc, leader, 30000)
-        print('Прибыла в начальную точку')
-        
-
-    def start_ffi_motion(self):
+            res = harmonics.binned_multipoles(bins, circ['radius'], n_max=min(15, bins.bins//2 - 1))
+        except ValueError as e:
+            self.show_error(f"Мультиполи не посчитаны: {e}")
+            return
+        for n, b, a, err in zip(res['n'], res['b'][0], res['a'][0], res['err'][0]):
+            print(f"n={n:2d}: b={b:+.4e}  a={a:+.4e}  ± {err:.1e} Тл*м")
+        self.plot_view.show(self.start_time, 'circ', np.degrees(bins.centers), bins.filled(),
+                            f"Основная гармоника n={res['main'][0]}, оборотов: {circ['turns']}")
+
+    def prepare_ffi_motion(self, prefix="ffi"):
+        """Читает параметры прохода с GUI, включает оси и задаёт им скорость.
+        Возвращает словарь параметров прохода для scans.ffi_scan или None при ошибке ввода.
+        prefix - начало имени файла прогона."""
         #! МОЖНО СДЕЛАТЬ QDoubleValidator и автоматическую замену запятой на точку
         #Todo Можно попробовать через сегменты тоже, если нужно туда-сюда
         try:
@@ -430,27 +488,22 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             self.ffi_distance_input.setText('0.0')
             distance = 0.0  # или другое значение по умолчанию
 
-        try:
-            mode = (self.mode_ffi_input.text())
-            if mode and distance != 0:
-                if mode == 'X':
-                    ffi_axes = [1,3]
-                    leader = 1
-                    for axis in ffi_axes:
-                        if not self.axes_data[axis]["state"]:
-                            self.axes_data[axis]['axis_obj'].enable()
-                            self.axes_data[axis]["state"] = True
-                            self.pos_log = self.ffi_motion_log['x_pos']
-                elif mode == 'Y':
-                    ffi_axes = [0,2]
-                    leader = 0
-                    for axis in ffi_axes:
-                        if not self.axes_data[axis]["state"]:
-                            self.axes_data[axis]['axis_obj'].enable()
-                            self.axes_data[axis]["state"] = True
-                            self.pos_log = self.ffi_motion_log['y_pos']
-        except Exception as e:
+        mode = self.mode_ffi_input.text()
+        if mode == 'X':
+            ffi_axes = [1,3]
+            pos_key, other_key, other_axis = 'x_pos', 'y_pos', 0
+        elif mode == 'Y':
+            ffi_axes = [0,2]
+            pos_key, other_key, other_axis = 'y_pos', 'x_pos', 1
+        else:
             self.show_error("Введите капсом 'X' или 'Y'")
+            return None
+        if distance == 0:
+            return None
+        for axis in ffi_axes:
+            if not self.axes_data[axis]["state"]:
+                self.axes_data[axis]['axis_obj'].enable()
+                self.axes_data[axis]["state"] = True
 
         try:
             speed = float(self.speed_ffi_input.text())
@@ -458,90 +511,156 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
                     self.axes_data[axis]['axis_obj'].set_speed(speed)
         except ValueError:
             self.show_error("Что-то со скоростью мб")
+            return None
 
-        self.ffi_motion_log = {  # Инициализация лога
-            'time': [],
-            'x_pos': [],
-            'y_pos': [],
-            'eds': [],
-        }
+        return {'distance': distance, 'speed': speed, 'axes': ffi_axes, 'leader': ffi_axes[0],
+                'resource': KEITHLEY_RESOURCE, 'pos_key': pos_key, 'other_key': other_key,
+                'run_file': os.path.join(RUN_DIR, time.strftime(f"{prefix}_%Y%m%d_%H%M%S.run")),
+                'other_pos': self.axes_data[other_axis]['axis_obj'].get_pos()}  # Вторая координата нити за проход не меняется
 
-        distances = [-(distance/2), -(distance/2)]
-        acsc.toPointM(self.stand.hc, acsc.AMF_RELATIVE, tuple(ffi_axes), tuple(distances), acsc.SYNCHRONOUS)
-        acsc.waitMotionEnd(self.stand.hc, leader, 20000)
-        distances = [distance, distance]
-        acsc.toPointM(self.stand.hc, acsc.AMF_RELATIVE, tuple(ffi_axes), tuple(distances), acsc.SYNCHRONOUS)
-        #*acsc.toPointM сама добавляет -1 в конец списка осей
-        start_time = time.time()
-        poll_interval = 0.05
-        axis = ffi_axes[0]
-        nano = ktl(resource="GPIB0::7::INSTR", mode='meas')              # Создаём экземпляр класса Keithley2182A
-        while True:
-            pos = acsc.getFPosition(self.stand.hc, axis)                 # Спрашиваем позицию оси-лидера у контроллера
-            self.pos_log.append(pos)                                     # Добавляем в список координат (X или Y)
-            self.ffi_motion_log['time'].append(time.time() - start_time) # Добавляем в список текущее время с момента начала движения
-            self.ffi_motion_log['eds'].append(eds)                       # Добавляем значение эдс от кейтли в список
-
-            motor_state = acsc.getMotorState(self.stand.hc, axis)        # Если ось не движется, то закрываем цикл
-            if not motor_state['moving']:
-                self.show_error("Движение успешно завершено")
-                break
-            time.sleep(poll_interval)                                    # Пауза между опросами            
-        
-        if mode == 'X':                                                  # Вспоминаем, в какой плоскости двигались и возвращаем
-            self.ffi_motion_log['x_pos'] = self.pos_log                  # список координат в словарь-ffi_motion_log
-        elif mode == 'Y':
-            self.ffi_motion_log['y_pos'] = self.pos_log
-
-        filename = 'ffi_motion_log.csv'                                  # Сохраняем лог в CSV
-        with open(filename, mode='w', newline='') as file:               # Открываем в режиме записи w-write
-            writer = csv.writer(file)
-            writer.writerow(['time', 'x_pos', 'y_pos', 'eds'])           # Заголовки
-
-            rows = zip(
-                self.ffi_motion_log['time'],
-                self.ffi_motion_log.get('x_pos', []),
-                self.ffi_motion_log.get('y_pos', []),
-                self.ffi_motion_log.get('eds', [])
-            )
-            for row in rows:
-                writer.writerow(row)
-
-        print(f"Лог сохранён в файл: {filename}")
-
-
-        #! ОПИСАНИЕ ПОЛУЧЕНИЯ ГРАФИКА
-        # Todo вынести это в модуль расчётов
-        x1 = self.ffi_motion_log['x_pos']
-        y1 = self.ffi_motion_log['y_pos']
-        x2 = x1[1:] # Удаляем первый элемент   
-        y2 = y1[1:]
-        x1 = x1[:-1]
-        y1 = y1[:-1]
-        time = self.ffi_motion_log['time']
-        time = time[:-1]
-        eds = self.ffi_motion_log['eds'][:-1]
-        eds = [_ ** 0.2 for _ in range(len(time))]
-        if mode == 'X':
-            v1, v2 = x1, x2
-        elif mode == 'Y':
-            v1, v2 = y1, y2
-        fig = calc.demoFirstFieldIntegral(v1, v2, speed, eds)
-            
-        # 1. Создаем буфер для сохранения изображения
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=300)
-        buf.seek(0)
-        
-        # 2. Загружаем изображение в QPixmap
-        pixmap = QtGui.QPixmap()
-        pixmap.loadFromData(buf.getvalue())
-        
-        # 3. Устанавливаем pixmap в QLabel
-        self.plot_pic.setPixmap(pixmap) 
-        
-        # (Опционально) Масштабируем изображение под размер QLabel
-        self.plot_pic.setScaledContents(True)
+    def start_ffi_motion(self):
+        """Проход для первого интеграла с записью ЭДС в буфер Keithley (scans.ffi_scan)."""
+        ffi = self.prepare_ffi_motion()
+        if ffi is not None:
+            self.run_scan(scans.ffi_scan, ffi, self.finish_ffi_motion)
+
+    def start_ffi_peg_motion(self):
+        """Проход для первого интеграла с запуском Keithley импульсами PEG (scans.ffi_peg_scan)."""
+        if PEG_BITCODES is None:
+            self.show_error("Подключение PEG к вольтметру не задано: PEG_BITCODES по схеме стенда")
+            return
+        ffi = self.prepare_ffi_motion()
+        if ffi is not None:
+            ffi['peg_bitcodes'] = PEG_BITCODES
+            self.run_scan(scans.ffi_peg_scan, ffi, self.finish_ffi_motion)
+
+    def start_ffi_stream_motion(self):
+        """Проход для первого интеграла с одновременным чтением координат и ЭДС (scans.ffi_stream_scan)."""
+        ffi = self.prepare_ffi_motion()
+        if ffi is not None:
+            self.run_scan(scans.ffi_stream_scan, ffi, self.finish_ffi_motion)
+
+    def start_ffi_bidir_motion(self):
+        """Проходы туда и обратно для первого интеграла без термо-ЭДС (scans.ffi_bidir_scan)."""
+        try:
+            repeats = int(self.ffi_repeats_input.text() or 1)
+        except ValueError:
+            self.show_error("Число повторов - целое")
+            return
+        ffi = self.prepare_ffi_motion(prefix="ffi_bidir")
+        if ffi is not None:
+            ffi['repeats'] = max(repeats, 1)
+            self.run_scan(scans.ffi_bidir_scan, ffi, self.finish_ffi_bidir_motion)
+
+    def start_map_motion(self):
+        """Карта первого интеграла: проходы по всем точкам сетки подряд (scans.map_scan)."""
+        try:
+            (x0, x1, nx), (y0, y1, ny) = ([float(v) for v in part.split(":")]
+                                          for part in self.map_grid_input.text().split())
+            x, y = np.linspace(x0, x1, int(nx)), np.linspace(y0, y1, int(ny))
+        except ValueError:
+            self.show_error("Сетка карты: x0:x1:nx y0:y1:ny, числа через точку")
+            return
+        mp = self.prepare_ffi_motion(prefix="map")
+        if mp is not None:
+            mp.update({'points': scan_plan.grid_points(x, y), 'grid': (x, y),
+                       'method': MAP_ORDERS[self.map_order_input.currentText()]})
+            self.stand.enable_all()                             # Переходы между точками - всеми осями
+            self.run_scan(scans.map_scan, mp, self.finish_map_motion)
+
+    def start_sfi_motion(self):
+        """Первый и встречный проходы для второго интеграла (scans.sfi_scan)."""
+        sfi = self.prepare_ffi_motion(prefix="sfi")
+        if sfi is not None:
+            sfi['wire_length'] = WIRE_LENGTH
+            self.run_scan(scans.sfi_scan, sfi, self.finish_sfi_motion)
+
+    def run_scan(self, scan, params, on_finished):
+        """Запускает скан в отдельном потоке (scan_worker). Окно остаётся отзывчивым,
+        результат приходит в on_finished уже в потоке GUI."""
+        self.scan_partial = []
+        self.scan_worker = ScanWorker(scan, self.stand, params, live=self.live_plot.feed)
+        self.scan_worker.progress.connect(self.scan_progress)
+        self.scan_worker.data.connect(self.scan_partial.append)   # Частичные данные скана (остаются и при отмене)
+        self.scan_worker.finished.connect(self.scan_done)
+        self.scan_worker.finished.connect(on_finished)
+        self.scan_worker.failed.connect(self.scan_failed)
+        self.scan_worker.stopped.connect(self.scan_stopped)
+        self.start_mode_motion.setEnabled(False)
+        self.live_plot.start()
+        self.scan_worker.start(self)
+        if not self.pos_timer.isActive():   # Позиции в окне обновляются во время скана
+            self.pos_timer.start()
+
+    def scan_progress(self, fraction, message):
+        self.statusbar.showMessage(f"{message}  {fraction:.0%}")
+
+    def scan_done(self, result=None):
+        self.live_plot.stop()
+        self.statusbar.clearMessage()
+
+    def scan_stopped(self):
+        """Поток скана завершён (worker удаляется) - можно запускать следующий."""
+        self.scan_worker = None
+        self.start_mode_motion.setEnabled(True)
+
+    def scan_failed(self, message):
+        self.scan_done()
+        self.show_error(message)
+
+    def finish_ffi_motion(self, result):
+        """Строит график первого интеграла (данные прохода уже в файле прогона)."""
+        self.show_error("Движение успешно завершено")
+        ffi = result['params']
+        self.ffi_dc = result['dc']                                       # time, fpos, fvel с контроллера
+
+        print(f"Прогон сохранён в файл: {ffi['run_file']}")           # Пишется сканом по ходу измерения
+        integral = calc.first_field_integral(result['time'], result['pos'], result['eds'])
+        title = f"I1 = {integral['integral']:.4e} ± {integral['integral_err']:.1e} В*с/мм"
+        print(f"Первый интеграл: {title}")
+        self.plot_view.show(ffi['run_file'], 'ffi', integral['pos'], integral['local'], title)
+
+    def finish_ffi_bidir_motion(self, result):
+        """Первый интеграл по всем проходам с сокращением постоянной ЭДС."""
+        self.show_error("Движение успешно завершено")
+        ffi = result['params']
+        self.ffi_dc = result['dc']
+        integral = calc.bidirectional_field_integral(result['time'], result['pos'], result['eds'])
+        title = f"I1 = {integral['integral']:.4e} ± {integral['integral_err']:.1e} В*с/мм"
+        print(f"Прогон сохранён в файл: {ffi['run_file']}")
+        print(f"Первый интеграл: {title}, постоянная ЭДС {integral['offset']:.2e} В, "
+              f"проходов: {len(integral['direction'])}")
+        self.plot_view.show(ffi['run_file'], 'ffi', integral['grid'], integral['local'], title)
+
+    def finish_map_motion(self, result):
+        """Собирает карту первого интеграла (строки - y, столбцы - x) и строит её по строкам."""
+        self.show_error("Карта снята")
+        mp = result['params']
+        x, y = mp['grid']
+        self.ffi_map = calc.integral_map(result['time'], result['pos'], result['eds'], shape=(len(y), len(x)))
+        print(f"Прогон сохранён в файл: {mp['run_file']}")
+        print(f"Точек: {len(mp['points'])}, холостые переходы: {result['dead_path']:.1f} мм ({mp['method']})")
+        print(f"Первый интеграл, В*с/мм, строки y = {np.round(y, 3)}:\n{self.ffi_map['integral']}")
+        # Строки карты одной кривой с разрывами (NaN) между ними
+        along = x if mp['pos_key'] == 'x_pos' else y
+        values = self.ffi_map['integral'] if mp['pos_key'] == 'x_pos' else self.ffi_map['integral'].T
+        gap = np.full((len(values), 1), np.nan)
+        self.plot_view.show(mp['run_file'], 'map', np.hstack([np.tile(along, (len(values), 1)), gap]).ravel(),
+                            np.hstack([values, gap]).ravel(), f"Карта {len(y)} x {len(x)}")
+
+    def finish_sfi_motion(self, result):
+        """Второй интеграл по первому и встречному проходам."""
+        self.show_error("Движение успешно завершено")
+        sfi, first = result['params'], result['first']
+        first_integral = calc.first_field_integral(first['time'], first['pos'], first['eds'])
+        second = calc.second_field_integral(result['time'], result['pos'], result['eds'],
+                                            first_integral['integral'], sfi['wire_length'],
+                                            first_integral['integral_err'])
+        print(f"Прогоны сохранены в файлы: {first['params']['run_file']}, {sfi['run_file']}")
+        print(f"Первый интеграл: {first_integral['integral']:.4e} ± {first_integral['integral_err']:.1e} В*с/мм")
+        print(f"Второй интеграл: {second['integral']:.4e} ± {second['integral_err']:.1e} Тл*м^2")
+        self.plot_view.show(sfi['run_file'], 'sfi', result['pos'], second['flux'],
+                            f"I2 = {second['integral']:.4e} ± {second['integral_err']:.1e} Тл*м^2")
 
     def check_mode_then_start(self):
         """Проверяет режим движения и запускает соответствующий метод."""
@@ -549,6 +668,10 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             self.show_error("Контроллер не подключён!")
             return
         
+        if self.scan_worker is not None:
+            self.show_error("Скан уже выполняется")
+            return
+
         selected_mode = self.check_mode.currentText()
         print(f"Нажата кнопка 'Старт', выбран режим: {selected_mode}")
 
@@ -556,9 +679,16 @@ class ACSControllerGUI(QMainWindow, Ui_MainWindow):
             self.start_circular_motion()
         elif selected_mode == "Первый магнитный интеграл":
             self.start_ffi_motion()
-        elif selected_mode == "Второй магнитный интеграл":  #Todo добавить возврат в ноль мб
-            # self.start_homing_motion() ТУТ ДОБАВИТЬ ВТОРОЙ ИНТЕГРАЛ
-            pass
+        elif selected_mode == FFI_PEG_MODE:
+            self.start_ffi_peg_motion()
+        elif selected_mode == FFI_STREAM_MODE:
+            self.start_ffi_stream_motion()
+        elif selected_mode == FFI_BIDIR_MODE:
+            self.start_ffi_bidir_motion()
+        elif selected_mode == MAP_MODE:
+            self.start_map_motion()
+        elif selected_mode == "Второй магнитный интеграл":
+            self.start_sfi_motion()
 
     def axisstate(self):
         data = self.axes_data
@@ -1,18 +1,33 @@
-import pyvisa
+try:
+    import pyvisa
+except ImportError:     # Без pyvisa доступен только симулятор (resource="SIM...")
+    pyvisa = None
 import threading
 import time
+import numpy as np
+
+LINE_FREQUENCY = 50     # Гц, 1 PLC = 20 мс
+BUFFER_SIZE = 1024      # Максимум измерений во внутреннем буфере 2182A (:TRAC)
 
 class Keithley2182A:
     def __init__(self, resource: str = "GPIB0::7::INSTR", mode: str = "meas"):
-        assert mode in ("fetch", "meas"), "mode должен быть 'fetch' или 'meas'"
+        """resource="SIM..." - симулятор прибора (keithley_sim), без GPIB.
+        mode="buffer" - измерения копятся во внутреннем буфере прибора, см. start_buffer."""
+        assert mode in ("fetch", "meas", "buffer"), "mode должен быть 'fetch', 'meas' или 'buffer'"
         self.mode = mode
-        self.rm = pyvisa.ResourceManager()
-        self.inst = self.rm.open_resource(resource)
+        if resource.upper().startswith("SIM"):
+            from . import keithley_sim
+            self.rm = None
+            self.inst = keithley_sim.SimulatedResource(resource)
+        else:
+            self.rm = pyvisa.ResourceManager()
+            self.inst = self.rm.open_resource(resource)
         self.inst.timeout = 2000  # мс
 
         self.inst.write("*RST")                         # Сброс настроек
         self.inst.write(":SYST:AZER OFF")               # Выключаем автообнуление (ускоряет)
         self.inst.write(":VOLT:NPLC 0.01")              # Минимальное время интеграции
+        self.nplc = 0.01
         self.inst.write(":TRIG:SOUR IMM")               # Немедленный триггер
         self.inst.write(":FORM:ELEM READ")              # Только значение ЭДС
 
@@ -38,10 +53,77 @@ class Keithley2182A:
             print(f"[!] Ошибка при получении ЭДС ({self.mode}): {e}")
             return float("nan")
 
+    def start_buffer(self, points: int = BUFFER_SIZE, nplc: float = None, trigger: str = "IMM"):
+        """
+        Запускает запись points измерений во внутренний буфер прибора.
+        trigger="IMM" - прибор измеряет с собственной частотой (период ~ nplc/50 с),
+        trigger="EXT" - одно измерение на каждый импульс на входе Trigger Link
+        (например, PEG контроллера ACS); время измерения должно быть меньше
+        интервала между импульсами. По GPIB за время записи идут только
+        короткие запросы счётчика (buffer_count).
+        """
+        points = int(min(max(points, 2), BUFFER_SIZE))
+        if nplc is not None:
+            self.nplc = min(max(nplc, 0.01), 50)
+            self.inst.write(f":VOLT:NPLC {self.nplc}")
+        self.inst.write(":INIT:CONT OFF")
+        self.inst.write(":ABOR")
+        self.inst.write(":TRAC:CLE")                    # Очищаем буфер
+        self.inst.write(f":TRAC:POIN {points}")         # Размер буфера
+        self.inst.write(":TRAC:FEED SENS")              # Пишем в буфер сами измерения
+        self.inst.write(":TRAC:FEED:CONT NEXT")         # Заполнить буфер один раз и остановиться
+        self.inst.write(f":TRIG:SOUR {trigger}")       # IMM или EXT
+        self.inst.write(":TRIG:DEL 0")                  # Без задержки после триггера
+        self.inst.write(f":TRIG:COUN {points}")
+        self.buffer_points = points
+        self.buffer_trigger = trigger
+        self._buffer_polls = []                         # (время, число измерений) для оценки периода
+        self.buffer_start = time.time()
+        self.inst.write(":INIT")
+
+    def buffer_count(self) -> int:
+        """Число измерений, уже записанных в буфер"""
+        n = int(float(self.inst.query(":TRAC:POIN:ACT?").strip()))
+        self._buffer_polls.append((time.time(), n))
+        return n
+
+    def wait_buffer(self, timeout: float = 10.0, poll: float = 0.05) -> bool:
+        """Ждёт заполнения буфера. Возвращает False по таймауту"""
+        t_end = time.time() + timeout
+        while self.buffer_count() < self.buffer_points:
+            if time.time() > t_end:
+                return False
+            time.sleep(poll)
+        return True
+
+    def read_buffer(self):
+        """
+        Выгружает буфер одним запросом :TRAC:DATA?.
+        Возвращает (times, readings): время каждого измерения (time.time())
+        и ЭДС в вольтах. Прибор меток времени не отдаёт, поэтому период оценивается
+        по опросам счётчика, сделанным во время записи. При внешнем триггере
+        times = None: k-е измерение соответствует k-му импульсу.
+        """
+        response = self.inst.query(":TRAC:DATA?")
+        readings = np.fromstring(response.strip(), sep=',')
+        self.inst.write(":TRAC:FEED:CONT NEV")
+        n = readings.size
+        if self.buffer_trigger != "IMM":
+            return None, readings
+        polls = np.array([p for p in self._buffer_polls if 0 < p[1] < self.buffer_points]).reshape(-1, 2)
+        if len(np.unique(polls[:, 1])) >= 2:            # Счётчик рос на глазах - берём линейную регрессию
+            period, t0 = np.polyfit(polls[:, 1], polls[:, 0], 1)
+            times = t0 + np.arange(1, n + 1)*period
+        else:
+            period = self.nplc/LINE_FREQUENCY
+            times = self.buffer_start + np.arange(1, n + 1)*period
+        return times, readings
+
     def close(self):
         """Закрывает соединение с вольтметром"""
-        self.keithley.close()
-        self.rm.close()
+        self.inst.close()
+        if self.rm is not None:
+            self.rm.close()
 
 
 
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Симулятор Keithley 2182A
+------------------------
+Ресурс в духе pyvisa, отвечающий на подмножество SCPI, которым пользуется
+keithley.Keithley2182A. Показания - ЭДС, наведённая в натянутой нити: она
+синтезируется по модели поля магнита и траектории нити, с временем
+интегрирования и шумом по NPLC. Keithley2182A берёт симулятор для любого
+ресурса, начинающегося с "SIM".
+
+Обычная настройка вместе с симулятором ACS:
+
+    import acsc_modified as acsc
+    from Keithley_2182A import keithley_sim
+    keithley_sim.configure(field=keithley_sim.MultipoleField({2: 0.5}),
+                           wire=keithley_sim.acs_wire(acsc.acs),
+                           clock=acsc.acs.clock)
+"""
+import time
+
+import numpy as np
+
+LINE_FREQUENCY = 50.0     # Гц, 1 PLC = 20 мс
+BUS_LATENCY = 0.002       # с на одну транзакцию GPIB
+NOISE_1PLC = 10e-9        # СКО, В, при NPLC 1; масштабируется как 1/sqrt(NPLC)
+IDN = "KEITHLEY INSTRUMENTS INC.,MODEL 2182A,SIM0001,C00 /A02"
+
+
+class WallClock(object):
+    """Источник времени по умолчанию, если общие часы симулятора не заданы."""
+    realtime = True
+
+    def __init__(self):
+        self._t0 = time.monotonic()
+
+    def now(self):
+        return time.monotonic() - self._t0
+
+    def sleep(self, dt):
+        if dt > 0:
+            time.sleep(dt)
+
+
+class MultipoleField(object):
+    """Интеграл поля мультипольного магнита.
+
+    b, a - словари {n: значение} нормальных/косых интегральных коэффициентов (Тл*м)
+    на радиусе приведения r_ref (мм), n=1 - диполь, n=2 - квадруполь, ...;
+    By + i*Bx = sum (b_n + i*a_n) * ((z - center)/r_ref)**(n-1), z = x + i*y (мм).
+    wire_length - длина натянутой нити (м), магнит - посередине нити.
+    """
+    def __init__(self, b, a=None, r_ref=10.0, center=(0.0, 0.0), wire_length=3.0):
+        self.b = dict(b)
+        self.a = dict(a or {})
+        self.r_ref = r_ref
+        self.center = complex(*center)
+        self.wire_length = wire_length
+
+    def first(self, x, y):
+        """Первые интегралы поля (Ix, Iy), Тл*м, в положении нити (x, y), мм."""
+        z = (np.asarray(x) + 1j*np.asarray(y) - self.center)/self.r_ref
+        c = 0j
+        for n in set(self.b) | set(self.a):
+            c = c + (self.b.get(n, 0.0) + 1j*self.a.get(n, 0.0))*z**(n - 1)
+        return np.imag(c), np.real(c)
+
+    def second(self, x, y):
+        """Вторые интегралы поля (Тл*м^2), отсчитанные от первого конца нити."""
+        ix, iy = self.first(x, y)
+        return ix*self.wire_length/2, iy*self.wire_length/2
+
+
+class GridField(object):
+    """Карта интеграла поля на регулярной сетке (x, y), мм.
+    ix, iy - формы (len(y), len(x)); между узлами - билинейная интерполяция.
+    Магнит - посередине нити длиной wire_length, м."""
+    def __init__(self, x, y, ix, iy, wire_length=3.0):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.ix = np.asarray(ix, dtype=float)
+        self.iy = np.asarray(iy, dtype=float)
+        self.wire_length = wire_length
+
+    def _interp(self, grid, x, y):
+        fx = np.interp(x, self.x, np.arange(self.x.size))
+        fy = np.interp(y, self.y, np.arange(self.y.size))
+        i0 = np.clip(np.floor(fx).astype(int), 0, self.x.size - 2)
+        j0 = np.clip(np.floor(fy).astype(int), 0, self.y.size - 2)
+        u, v = fx - i0, fy - j0
+        return ((1 - u)*(1 - v)*grid[j0, i0] + u*(1 - v)*grid[j0, i0 + 1]
+                + (1 - u)*v*grid[j0 + 1, i0] + u*v*grid[j0 + 1, i0 + 1])
+
+    def first(self, x, y):
+        return self._interp(self.ix, x, y), self._interp(self.iy, x, y)
+
+    def second(self, x, y):
+        ix, iy = self.first(x, y)
+        return ix*self.wire_length/2, iy*self.wire_length/2
+
+
+def static_wire(x=0.0, y=0.0):
+    """Траектория неподвижной нити."""
+    def wire(t):
+        z = np.zeros(np.shape(t))
+        return x + z, y + z, x + z, y + z, z, z, z, z
+    return wire
+
+
+def acs_wire(library, axes=(1, 0, 3, 2)):
+    """Траектория нити по симулятору ACS: оси (X1, Y1, X2, Y2), как на стенде.
+    Траектории нити принимают время числом или массивом."""
+    def wire(t):
+        pos = library.axis_positions(axes, t)
+        vel = library.axis_velocities(axes, t)
+        return tuple(pos) + tuple(vel)
+    return wire
+
+
+def acs_peg_trigger(library, axes=(1, 0)):
+    """Внешний триггер, подключённый к выходам PEG осей axes симулятора ACS."""
+    def trigger(t):
+        return np.sort(np.concatenate([library.peg_pulses(a, t) for a in axes]))
+    return trigger
+
+
+def wire_emf(field, state):
+    """ЭДС нити (В) в состоянии (x1, y1, x2, y2, vx1, vy1, vx2, vy2), мм и мм/с.
+    Поле берётся в среднем поперечном положении нити; разность скоростей
+    концов связана со вторым интегралом поля."""
+    x1, y1, x2, y2, vx1, vy1, vx2, vy2 = state
+    xm, ym = (x1 + x2)/2, (y1 + y2)/2
+    ix, iy = field.first(xm, ym)
+    ix2, iy2 = field.second(xm, ym)
+    length = field.wire_length
+    vx2m, vy2m, dvx, dvy = vx2*1e-3, vy2*1e-3, (vx2 - vx1)*1e-3, (vy2 - vy1)*1e-3
+    return (vx2m*iy - vy2m*ix) - (dvx*iy2 - dvy*ix2)/length
+
+
+_config = {"field": MultipoleField({}), "wire": static_wire(), "clock": None,
+           "noise": NOISE_1PLC, "seed": None, "trigger": None}
+
+
+def configure(**options):
+    """Задаёт умолчания для новых симулированных приборов: field, wire, clock, noise,
+    seed и trigger (функция t -> моменты импульсов внешнего триггера до t)."""
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise TypeError("Неизвестные параметры: %s" % ", ".join(sorted(unknown)))
+    _config.update(options)
+
+
+class SimulatedResource(object):
+    """Минимальный ресурс pyvisa, изображающий нановольтметр Keithley 2182A."""
+    def __init__(self, resource_name="SIM::7::INSTR", field=None, wire=None,
+                 clock=None, noise=None, seed=None, trigger=None):
+        self.resource_name = resource_name
+        self.field = field if field is not None else _config["field"]
+        self.wire = wire if wire is not None else _config["wire"]
+        self.clock = clock or _config["clock"] or WallClock()
+        self.noise = noise if noise is not None else _config["noise"]
+        self.trigger = trigger or _config["trigger"] or (lambda t: np.empty(0))
+        self.rng = np.random.default_rng(seed if seed is not None else _config["seed"])
+        self.timeout = 2000
+        self._reply = ""
+        self.reset()
+
+    def reset(self):
+        self.nplc = 5.0
+        self.autozero = True
+        self.trigger_source = "IMM"
+        self.trigger_count = 1
+        self.continuous = False
+        self._t_init = self.clock.now()
+        self.trace_points = 1024
+        self.trace_feed = False
+        self._trace = []                  # Показания текущего буфера :TRAC
+        self._trace_count = 0             # Сколько показаний возьмёт запущенный буфер
+        self._trace_stop = None           # Время :ABOR - после него показания не берутся
+
+    @property
+    def aperture(self):
+        """Время интегрирования одного показания, с (автоноль удваивает его)."""
+        return self.nplc/LINE_FREQUENCY*(2 if self.autozero else 1)
+
+    def _reading(self, t_end):
+        """Показания, проинтегрированные за апертуру, кончающуюся в t_end (число или массив)."""
+        ts = np.asarray(t_end, dtype=float)[..., None] - self.aperture*np.array([0.75, 0.5, 0.25])
+        emf = np.asarray(wire_emf(self.field, self.wire(ts.ravel()))).reshape(ts.shape).mean(axis=-1)
+        return emf + self.rng.normal(0.0, self.noise/np.sqrt(self.nplc), emf.shape)
+
+    def _measure(self):
+        self.clock.sleep(self.aperture)
+        return self._reading(self.clock.now())
+
+    def _fetch(self):
+        if not self.continuous:
+            return self._reading(self.clock.now())
+        # Последнее законченное показание прибора в непрерывном режиме
+        n = np.floor((self.clock.now() - self._t_init)/self.aperture)
+        return self._reading(self._t_init + max(n, 1)*self.aperture)
+
+    def _trace_fill(self):
+        """Дописывает в буфер показания, законченные к этому моменту. При TRIG:SOUR EXT
+        показание начинается по каждому импульсу триггера; импульсы, пришедшие
+        во время измерения, пропускаются, как на приборе."""
+        now = self.clock.now() if self._trace_stop is None else self._trace_stop
+        if self.trigger_source != "EXT":
+            done = min(int((now - self._t_init)/self.aperture), self._trace_count)
+            ends = self._t_init + np.arange(1, done + 1)*self.aperture
+        else:
+            ends = []
+            for t in self.trigger(now):
+                if t >= self._t_init and (not ends or t >= ends[-1]) and t + self.aperture <= now:
+                    ends.append(t + self.aperture)
+            ends = ends[:self._trace_count]
+        ends = np.asarray(ends)[len(self._trace):]
+        if ends.size:
+            self._trace.extend(self._reading(ends))
+
+    def write(self, command):
+        self.clock.sleep(BUS_LATENCY)
+        for cmd in command.split(";"):
+            self._command(cmd.strip())
+        return len(command)
+
+    def _command(self, cmd):
+        head, _, arg = cmd.partition(" ")
+        head = head.upper().lstrip(":")
+        if head.startswith("SENS:"):
+            head = head[5:]
+        arg = arg.strip().upper()
+        if head == "*RST":
+            self.reset()
+        elif head == "*IDN?":
+            self._reply = IDN
+        elif head in ("SYST:AZER", "SYST:AZER:STAT"):
+            self.autozero = arg in ("ON", "1")
+        elif head in ("VOLT:NPLC", "VOLT:DC:NPLC"):
+            self.nplc = float(arg)
+        elif head == "TRIG:SOUR":
+            self.trigger_source = arg[:3]
+        elif head == "TRIG:COUN":
+            self.trigger_count = np.inf if arg.startswith("INF") else int(float(arg))
+        elif head == "INIT:CONT":
+            self.continuous = arg in ("ON", "1")
+            self._t_init = self.clock.now()
+        elif head == "INIT":
+            self._t_init = self.clock.now()
+            self._trace_stop = None
+            if self.trace_feed:
+                self._trace = []
+                self._trace_count = int(min(self.trigger_count, self.trace_points))
+        elif head in ("ABOR", "ABORT"):
+            self._trace_fill()
+            self._trace_stop = self.clock.now()
+        elif head in ("TRAC:CLE", "TRAC:CLEAR"):
+            self._trace, self._trace_count = [], 0
+        elif head in ("TRAC:POIN", "TRAC:POINTS"):
+            self.trace_points = max(2, min(1024, int(float(arg))))
+        elif head in ("TRAC:FEED:CONT", "TRAC:FEED:CONTROL"):
+            self.trace_feed = arg.startswith("NEXT")
+        elif head in ("TRAC:POIN:ACT?", "TRAC:POINTS:ACTUAL?"):
+            self._trace_fill()
+            self._reply = "%d" % len(self._trace)
+        elif head == "TRAC:DATA?":
+            self._trace_fill()
+            self._reply = ",".join("%+.7E" % v for v in self._trace)
+        elif head in ("MEAS?", "MEAS:VOLT?", "READ?"):
+            self._reply = "%+.7E" % self._measure()
+        elif head in ("FETCH?", "FETC?", "DATA?"):
+            self._reply = "%+.7E" % self._fetch()
+        # Остальные настройки (FORM:ELEM, TRAC:FEED SENS, фильтры, диапазоны) на симуляцию не влияют
+
+    def read(self):
+        self.clock.sleep(BUS_LATENCY)
+        reply, self._reply = self._reply, ""
+        return reply + "\n"
+
+    def query(self, command):
+        self.write(command)
+        return self.read()
+
+    def close(self):
+        pass
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Acquisition buffer
+------------------
+Лог измерения в заранее выделенном структурированном массиве NumPy вместо
+словаря списков: запись точки - присваивание в готовую строку, без выделения
+памяти на каждый отсчёт.
+
+    log = AcquisitionBuffer(acquisition_fields(4))     # time, fpos[4], fvel[4], eds, status[4]
+    log.append(time=t, fpos=snap.fpos, fvel=snap.fvel, status=snap.mst)
+    log['fpos'][:, 1]                                  # X1 без копирования
+
+Без ring ёмкость удваивается при заполнении (амортизированно O(1) на точку);
+с ring=True хранятся последние capacity записей, старые перезаписываются.
+view() - записи по порядку: срез без копирования, пока кольцо не провернулось.
+"""
+import numpy as np
+
+
+def acquisition_fields(n_axes, eds=True, extra=()):
+    """Поля лога: время, координаты и скорости n_axes осей, ЭДС, биты состояния (MST) осей."""
+    fields = [("time", "<f8"), ("fpos", "<f8", (n_axes,)), ("fvel", "<f8", (n_axes,))]
+    if eds:
+        fields.append(("eds", "<f8"))
+    fields.append(("status", "<u4", (n_axes,)))
+    return fields + list(extra)
+
+
+class AcquisitionBuffer(object):
+    """
+    Структурированный массив записей fields (список (имя, dtype[, форма]) как у np.dtype).
+    capacity - начальная (или, при ring=True, постоянная) ёмкость в записях.
+    """
+    def __init__(self, fields, capacity=4096, ring=False):
+        self.dtype = np.dtype(fields)
+        self.ring = ring
+        self._data = np.zeros(capacity, dtype=self.dtype)
+        self._empty = np.zeros((), dtype=self.dtype)
+        self._start = 0      # Индекс самой старой записи (кольцо)
+        self.count = 0       # Записей в буфере
+        self.total = 0       # Записей за всё время (с перезаписанными)
+
+    @property
+    def capacity(self):
+        return self._data.size
+
+    def _grow(self, need):
+        capacity = self.capacity
+        while capacity < need:
+            capacity *= 2
+        data = np.zeros(capacity, dtype=self.dtype)
+        data[:self.count] = self._data[:self.count]
+        self._data = data
+
+    def _slot(self):
+        if self.count < self.capacity:
+            slot = (self._start + self.count) % self.capacity
+            self.count += 1
+        elif self.ring:
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+        else:
+            self._grow(self.count + 1)
+            slot = self.count
+            self.count += 1
+        self.total += 1
+        return slot
+
+    def append(self, *values, **named):
+        """Одна запись: значениями по порядку полей или по именам (остальные поля - нули)."""
+        slot = self._slot()
+        self._data[slot] = values if values else self._empty
+        for name, value in named.items():
+            self._data[name][slot] = value
+
+    def _rows(self, name, value):
+        """Число записей в значении поля (у полей-подмассивов лишняя ось)."""
+        return np.shape(value)[0] if np.ndim(value) > len(self.dtype[name].shape) else 1
+
+    def extend(self, columns=None, **named):
+        """Много записей: структурированный массив или массивы по именам полей."""
+        if columns is None:
+            columns = named
+        if isinstance(columns, np.ndarray) and columns.dtype.names:
+            block = columns.astype(self.dtype, copy=False)
+        else:
+            n = max(self._rows(name, value) for name, value in columns.items())
+            block = np.zeros(n, dtype=self.dtype)
+            for name, value in columns.items():
+                block[name] = value
+        n = block.size
+        if self.ring:
+            if n >= self.capacity:
+                self._data[:] = block[-self.capacity:]
+                self._start, self.count = 0, self.capacity
+                self.total += n
+                return
+            idx = (self._start + self.count + np.arange(n)) % self.capacity
+            self._data[idx] = block
+            overflow = max(self.count + n - self.capacity, 0)
+            self._start = (self._start + overflow) % self.capacity
+            self.count += n - overflow
+        else:
+            if self.count + n > self.capacity:
+                self._grow(self.count + n)
+            self._data[self.count:self.count + n] = block
+            self.count += n
+        self.total += n
+
+    def view(self):
+        """Записи от старой к новой. Без копирования, кроме провернувшегося кольца."""
+        end = self._start + self.count
+        if end <= self.capacity:
+            return self._data[self._start:end]
+        return np.concatenate([self._data[self._start:], self._data[:end - self.capacity]])
+
+    def clear(self):
+        self._start = self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        return self.view()[name]
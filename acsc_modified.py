@@ -7,14 +7,26 @@ This module is a wrapper for the ACS C library using ctypes
 from __future__ import division, print_function
 import ctypes
 from ctypes import byref
+import functools
 import numpy as np
+import os
 import platform
+import threading
 
-# Import the ACS C library DLL
-if platform.architecture()[0] == "32bit":
-    acs = ctypes.windll.LoadLibrary('ACSCL_x86.dll')
-if platform.architecture()[0] == "64bit":
-    acs = ctypes.windll.LoadLibrary('ACSCL_x64.dll')
+# Backend: "dll" - the ACS C library, "sim" - pure-Python simulator (acsc_sim).
+# Default is the DLL on Windows and the simulator elsewhere.
+BACKEND = os.environ.get("ACSC_BACKEND", "dll" if hasattr(ctypes, "windll") else "sim")
+
+def _loadLibrary(backend):
+    if backend == "sim":
+        import acsc_sim
+        return acsc_sim.SimulatedLibrary()
+    # Import the ACS C library DLL
+    if platform.architecture()[0] == "32bit":
+        return ctypes.windll.LoadLibrary('ACSCL_x86.dll')
+    return ctypes.windll.LoadLibrary('ACSCL_x64.dll')
+
+acs = _loadLibrary(BACKEND)
 
 int32 = ctypes.c_long
 uInt32 = ctypes.c_ulong
@@ -23,6 +35,55 @@ double = ctypes.c_double
 char = ctypes.c_char
 p = ctypes.pointer
 
+# Cached argument types and output buffers. Array types are created once per
+# length, axis lists once per tuple of axes; scalar outputs of the getters go
+# through per-thread c_double/c_int with a ready byref, small array reads
+# through per-thread NumPy buffers with a ready data pointer. The buffers are
+# only valid for synchronous calls - the getters copy the value out at once.
+@functools.lru_cache(maxsize=None)
+def _doubleArray(n):
+    return double*n
+
+@functools.lru_cache(maxsize=None)
+def _intArray(n):
+    return ctypes.c_int*n
+
+@functools.lru_cache(maxsize=256)
+def _axes(axes):
+    """-1 terminated C array of `axes` (a tuple). Shared between calls -
+    the library only reads it."""
+    return _intArray(len(axes) + 1)(*axes, -1)
+
+def _doubles(values):
+    """C double array with `values`."""
+    return _doubleArray(len(values))(*values)
+
+BUFFER_CACHE_SIZE = 256     # Largest array (elements) kept as a per-thread read buffer
+_POINTERS = {np.dtype(np.float64): ctypes.POINTER(double),
+             np.dtype(np.int32): ctypes.POINTER(ctypes.c_int)}
+
+class _Buffers(threading.local):
+    """Per-thread output buffers for the getters."""
+    def __init__(self):
+        self.real = double()
+        self.real_ref = byref(self.real)
+        self.int = ctypes.c_int()
+        self.int_ref = byref(self.int)
+        self.arrays = {}
+
+    def array(self, dtype, shape):
+        """(NumPy array, its data pointer) of `shape`; reused for small arrays."""
+        key = (dtype, shape)
+        buf = self.arrays.get(key)
+        if buf is None:
+            values = np.zeros(shape, dtype=dtype)
+            buf = (values, values.ctypes.data_as(_POINTERS[values.dtype]))
+            if values.size <= BUFFER_CACHE_SIZE:
+                self.arrays[key] = buf
+        return buf
+
+_out = _Buffers()
+
 # Define motion flags and constants
 AMF_WAIT = 0x00000001
 AMF_RELATIVE = 0x00000002
@@ -51,6 +112,7 @@ SYNCHRONOUS = None
 INVALID = -1
 IGNORE = -1
 ASYNCHRONOUS = -2
+INFINITE = -1       # Timeout of acsc_WaitForAsyncCall (0xFFFFFFFF)
 NONE = -1
 COUNTERCLOCKWISE = 1
 CLOCKWISE = -1
@@ -59,6 +121,135 @@ REAL_BINARY	 = 8
 INT_TYPE = 1
 REAL_TYPE = 2
 
+# Interrupts (setCallback). The callback gets a bit mask: axes for the motion
+# interrupts, buffers for INTR_PROGRAM_END, inputs for INTR_INPUT.
+INTR_PEG = 3
+INTR_EMERGENCY = 15
+INTR_PHYSICAL_MOTION_END = 16
+INTR_LOGICAL_MOTION_END = 17
+INTR_MOTION_FAILURE = 18
+INTR_MOTOR_FAILURE = 19
+INTR_PROGRAM_END = 20
+INTR_INPUT = 23
+INTR_MOTION_START = 24
+INTR_SYSTEM_ERROR = 28
+
+# Data collection flags
+DCF_TEMPORAL = 0x00000001
+DCF_CYCLIC = 0x00000002
+DCF_SYNC = 0x00000004
+DCF_WAIT = 0x00000008
+
+# Controller array used by startDataCollection (rows = variables, columns = samples)
+DC_ARRAY = "PYDC"
+DC_ROWS = 9         # TIME + FPOS/FVEL of up to 4 axes
+DC_SAMPLES = 20000  # 20 s at 1 ms servo period
+_collectionArrays = set()   # (hcomm, array) declared on the controller
+
+# Asynchronous calls. A function called with an ACSC_WAITBLOCK instead of
+# SYNCHRONOUS returns as soon as the request is sent; several requests are
+# in flight at once and each reply is collected by acsc_WaitForAsyncCall.
+# The output of such a call is its own (not the per-thread buffers above),
+# since it is filled in only when the reply arrives.
+class ACSC_WAITBLOCK(ctypes.Structure):
+    _fields_ = [("Event", ctypes.c_void_p),
+                ("Ret", ctypes.c_int)]
+
+class AsyncCall(object):
+    """Pending asynchronous call - a future of its result. result() waits
+    for the reply and returns the output converted by `convert`."""
+    def __init__(self, hcomm, name, buffer=None, pointer=None, convert=None):
+        self.hcomm = hcomm
+        self.name = name
+        self.buffer = buffer        # Output object, kept alive until the reply
+        self.pointer = pointer      # ... and the pointer passed to the call
+        self.convert = convert
+        self.wait = ACSC_WAITBLOCK()
+        self.wait_ref = byref(self.wait)
+        self._done = False
+        self._result = None
+
+    def done(self):
+        return self._done
+
+    def result(self, timeout=INFINITE):
+        """Waits for the reply (timeout - ms) and returns the result.
+        Raises RuntimeError if the wait or the call itself failed."""
+        if not self._done:
+            received = ctypes.c_int()
+            if not acs.acsc_WaitForAsyncCall(self.hcomm, self.pointer, byref(received),
+                                             self.wait_ref, timeout):
+                raise RuntimeError("%s: no reply, error %d" % (self.name, getLastError()))
+            self._done = True
+            if self.wait.Ret == 0:
+                raise RuntimeError("%s failed, error %d" % (self.name, getLastError()))
+            self._result = self.buffer if self.convert is None else self.convert(self.buffer)
+        return self._result
+
+    def cancel(self):
+        """Drops the call - its reply is not awaited any more."""
+        if not self._done:
+            acs.acsc_CancelOperation(self.hcomm, self.wait_ref)
+            self._done = True
+
+def _issue(function, hcomm, args, buffer=None, pointer=None, convert=None):
+    """Calls `function(hcomm, *args[, pointer], wait)` asynchronously."""
+    call = AsyncCall(hcomm, function.__name__, buffer, pointer, convert)
+    out = () if pointer is None else (pointer,)
+    if not function(hcomm, *(args + out + (call.wait_ref,))):
+        raise RuntimeError("%s failed, error %d" % (call.name, getLastError()))
+    return call
+
+def _scalar(buffer):
+    return buffer.value
+
+def waitAll(calls, timeout=INFINITE):
+    """Results of the AsyncCall's `calls`, in order. If one fails, the rest
+    are cancelled and the error is raised."""
+    try:
+        return [call.result(timeout) for call in calls]
+    except Exception:
+        for call in calls:
+            call.cancel()
+        raise
+
+# int WINAPI callback(unsigned __int64 Param, void* UserParameter)
+CALLBACK = getattr(ctypes, "WINFUNCTYPE", ctypes.CFUNCTYPE)(ctypes.c_int, ctypes.c_uint64,
+                                                            ctypes.c_void_p)
+_callbacks = {}     # (hcomm, interrupt) -> CALLBACK; the library holds only a raw pointer to it
+
+def axisMask(axes):
+    """Bit mask of `axes` (as in interrupt masks)."""
+    mask = 0
+    for axis in axes:
+        mask |= 1 << axis
+    return mask
+
+def maskAxes(mask):
+    """Axes whose bits are set in `mask`."""
+    return [axis for axis in range(64) if mask >> axis & 1]
+
+def setCallback(hcomm, interrupt, function, mask=None):
+    """Calls function(mask) on every `interrupt` (INTR_*), in the library's
+    callback thread, so `function` must be thread-safe and short. `mask`
+    limits the interrupt to these bits (e.g. axisMask(axes)).
+    function=None removes the callback."""
+    if function is None:
+        callback = None
+    else:
+        def _callback(param, context):
+            function(param)
+            return 0
+        callback = CALLBACK(_callback)
+    if not acs.acsc_SetCallbackExt(hcomm, callback, None, interrupt):
+        raise RuntimeError("acsc_SetCallbackExt(%d) failed, error %d" % (interrupt, getLastError()))
+    if callback is None:
+        _callbacks.pop((hcomm, interrupt), None)
+        return
+    _callbacks[(hcomm, interrupt)] = callback
+    if mask is not None:
+        errorHandling(acs.acsc_SetCallbackMask(hcomm, interrupt, mask))
+
 def openCommDirect():
     """Open simulator. Returns communication handle."""
     hcomm = acs.acsc_OpenCommDirect()
@@ -76,31 +267,29 @@ def openCommEthernetTCP(address="10.0.0.100", port=701):
 
 def setVelocity(hcomm, axis, vel, wait=SYNCHRONOUS):  #Скорость
     """Sets axis velocity."""
-    acs.acsc_SetVelocity(hcomm, axis, double(vel), wait)
+    acs.acsc_SetVelocity(hcomm, axis, vel, wait)
 
 def setAcceleration(hcomm, axis, acc, wait=SYNCHRONOUS):  #Ускорение
     """Sets axis acceleration."""
-    acs.acsc_SetAcceleration(hcomm, axis, double(acc), wait)
+    acs.acsc_SetAcceleration(hcomm, axis, acc, wait)
 
 # ! Just a fantasy
 def setKillDeceleration(hcomm, axis, kdec, wait=SYNCHRONOUS):
     """Sets axis kill deceleration."""
-    acs.acsc_SetKillDeceleration(hcomm, axis, double(kdec), wait)
+    acs.acsc_SetKillDeceleration(hcomm, axis, kdec, wait)
 # ! Just a fantasy
 
 def setDeceleration(hcomm, axis, dec, wait=SYNCHRONOUS):  #Замедление
     """Sets axis deceleration."""
-    acs.acsc_SetDeceleration(hcomm, axis, double(dec), wait)
+    acs.acsc_SetDeceleration(hcomm, axis, dec, wait)
 
 def setJerk(hcomm, axis, jerk, wait=SYNCHRONOUS):  #Рывок
-    acs.acsc_SetJerk(hcomm, axis, double(jerk), wait)
+    acs.acsc_SetJerk(hcomm, axis, jerk, wait)
 
 def getMotorEnabled(hcomm, axis, wait=SYNCHRONOUS):  #Провекра вкл или выкл двигатель на данной оси
     """Checks if motor is enabled."""
-    state = ctypes.c_int()
-    acs.acsc_GetMotorState(hcomm, axis, byref(state), wait)
-    state = state.value
-    return hex(state)[-1] == "1"  #Значение state преобразуется в шестнадцатеричный формат. Смотрим ласт символ ( 1 - вкл)
+    acs.acsc_GetMotorState(hcomm, axis, _out.int_ref, wait)
+    return bool(_out.int.value & MST_ENABLE)
 
 def getMotorState(hcomm, axis, wait=SYNCHRONOUS):
     """Gets the motor state. Returns a dictionary with the following keys:
@@ -109,13 +298,12 @@ def getMotorState(hcomm, axis, wait=SYNCHRONOUS):
       * "moving"
       * "accelerating"
     """
-    state = ctypes.c_int()
-    acs.acsc_GetMotorState(hcomm, axis, byref(state), wait)
-    state = state.value
-    mst = {"enabled" : hex(state)[-1] == "1",
-           "in position" : hex(state)[-2] == "1",
-           "moving" : hex(state)[-2] == "2",
-           "accelerating" : hex(state)[-2] == "4"}
+    acs.acsc_GetMotorState(hcomm, axis, _out.int_ref, wait)
+    state = _out.int.value
+    mst = {"enabled" : bool(state & MST_ENABLE),
+           "in position" : bool(state & MST_INPOS),
+           "moving" : bool(state & MST_MOVE),
+           "accelerating" : bool(state & MST_ACC)}
     return mst
 
 def getAxisState(hcomm, axis, wait=SYNCHRONOUS):
@@ -130,31 +318,77 @@ def getAxisState(hcomm, axis, wait=SYNCHRONOUS):
       * "vel lock"
       * "pos lock"
      """
-    state = ctypes.c_int()
-    acs.acsc_GetAxisState(hcomm, axis, byref(state), wait)
-    state = state.value
-    ast = {"lead" : hex(state)[-1] == "1",           #является ли ось ведущей 
-           "DC" : hex(state)[-1] == "2",             #находится ли ось в режиме постоянного тока
-           "PEG" : hex(state)[-1] == "4",            #активен ли режим PEG (Position Error Gate, задаёт удовлетворительный диапазон)
-           "PEGREADY" : hex(state)[-2] == "1",       #готов ли режим PEG
-           "moving" : hex(state)[-2] == "2",         #движется ли ось
-           "accelerating" : hex(state)[-2] == "4",   #ускоряется ли ось
-           "segment" : hex(state)[-2] == "8",        #активен ли сегментный режим
-           "vel lock" : hex(state)[-3] == "1",       #заблокирована ли скорость
-           "pos lock" : hex(state)[-3] == "2"}       #заблокирована ли позиция
+    acs.acsc_GetAxisState(hcomm, axis, _out.int_ref, wait)
+    state = _out.int.value
+    ast = {"lead" : bool(state & AST_LEAD),          #является ли ось ведущей 
+           "DC" : bool(state & AST_DC),              #идёт ли сбор данных (Data Collection) по оси
+           "PEG" : bool(state & AST_PEG),            #активен ли режим PEG (Position Event Generation)
+           "PEGREADY" : bool(state & AST_PEGREADY),  #готов ли режим PEG
+           "moving" : bool(state & AST_MOVE),        #движется ли ось
+           "accelerating" : bool(state & AST_ACC),   #ускоряется ли ось
+           "segment" : bool(state & AST_SEGMENT),    #активен ли сегментный режим
+           "vel lock" : bool(state & AST_VELLOCK),   #заблокирована ли скорость
+           "pos lock" : bool(state & AST_POSLOCK)}   #заблокирована ли позиция
     return ast
 
+# Record returned by getStateSnapshot, one row per axis
+SNAPSHOT_DTYPE = np.dtype([("axis", np.int32),
+                           ("fpos", np.float64),
+                           ("fvel", np.float64),
+                           ("mst", np.int32),
+                           ("ast", np.int32),
+                           ("fault", np.int32)])
+
+def getStateSnapshot(hcomm, axes, timeout=INFINITE):
+    """Reads FPOS, FVEL, MST, AST and FAULT of all `axes` at once.
+    Each standard variable is read as one array covering the axis range,
+    so the cost does not grow with the number of axes, and the five reads
+    are issued asynchronously together, so they take about one round trip.
+    Returns a NumPy record array (SNAPSHOT_DTYPE) with one row per axis;
+    test state bits with the MST_*/AST_* masks, e.g. snap["mst"] & MST_INPOS."""
+    axes = list(axes)
+    lo, hi = min(axes), max(axes)
+    idx = np.asarray(axes) - lo
+    calls = [readRealAsync(hcomm, NONE, "FPOS", lo, hi),
+             readRealAsync(hcomm, NONE, "FVEL", lo, hi),
+             readIntegerAsync(hcomm, NONE, "MST", lo, hi),
+             readIntegerAsync(hcomm, NONE, "AST", lo, hi),
+             readIntegerAsync(hcomm, NONE, "FAULT", lo, hi)]
+    fpos, fvel, mst, ast, fault = waitAll(calls, timeout)
+    snap = np.zeros(len(axes), dtype=SNAPSHOT_DTYPE)
+    snap["axis"] = axes
+    snap["fpos"] = fpos[idx]
+    snap["fvel"] = fvel[idx]
+    snap["mst"] = mst[idx]
+    snap["ast"] = ast[idx]
+    snap["fault"] = fault[idx]
+    return snap.view(np.recarray)
+
+def pollAxes(hcomm, axes, timeout=INFINITE):
+    """FPOS and FAULT of each of `axes`: all 2*len(axes) requests are issued
+    asynchronously before the first reply is awaited, so the poll takes about
+    one round trip instead of 2*len(axes). Returns a dictionary with
+      * "fpos" - array of feedback positions
+      * "fault" - array of FAULT bits
+    """
+    calls = ([getFPositionAsync(hcomm, axis) for axis in axes]
+             + [getFaultAsync(hcomm, axis) for axis in axes])
+    values = waitAll(calls, timeout)
+    n = len(calls)//2
+    return {"fpos": np.array(values[:n], dtype=np.float64),
+            "fault": np.array(values[n:], dtype=np.int32)}
+
 def registerEmergencyStop():
     """Register the software emergency stop."""
     acs.acsc_RegisterEmergencyStop()
 
 def jog(hcomm, flags, axis, vel, wait=SYNCHRONOUS):  #Флаги описывают режим движения
     """Jog move."""
-    acs.acsc_Jog(hcomm, flags, axis, double(vel), wait)
+    acs.acsc_Jog(hcomm, flags or 0, axis, vel, wait)
 
 def toPoint(hcomm, flags, axis, target, wait=SYNCHRONOUS):
     """Point to point move."""
-    acs.acsc_ToPoint(hcomm, flags, axis, double(target), wait)
+    acs.acsc_ToPoint(hcomm, flags or 0, axis, target, wait)
 
 def toPointM(hcomm, flags, axes, target, wait=SYNCHRONOUS):  #Выполняет многокоординатное движение
     """Initiates a multi-axis move to the specified target. Axes and target
@@ -162,69 +396,76 @@ def toPointM(hcomm, flags, axes, target, wait=SYNCHRONOUS):  #Выполняет
     if len(axes) != len(target):
         print("Number of axes and coordinates don't match!")
     else:
-        target_array = double*len(axes)
-        axes_array = ctypes.c_int*(len(axes) + 1)
-        target_c = target_array()
-        axes_c = axes_array()
-        for n in range(len(axes)):
-            target_c[n] = target[n]
-            axes_c[n] = axes[n]
-        axes_c[-1] = -1
-        errorHandling(acs.acsc_ToPointM(hcomm, flags, axes_c, target_c, wait))  #Обработка ошибок
+        errorHandling(acs.acsc_ToPointM(hcomm, flags or 0, _axes(tuple(axes)),
+                                        _doubles(target), wait))  #Обработка ошибок
 
 def enable(hcomm, axis, wait=SYNCHRONOUS):   #Включает указанную ось (активирует двигатель)
-    acs.acsc_Enable(hcomm, int32(axis), wait)
+    acs.acsc_Enable(hcomm, axis, wait)
 
 def disable(hcomm, axis, wait=SYNCHRONOUS):  #Выключает указанную ось (деактивирует двигатель)
-    acs.acsc_Disable(hcomm, int32(axis), wait)
+    acs.acsc_Disable(hcomm, axis, wait)
 
 def getRPosition(hcomm, axis, wait=SYNCHRONOUS):  #Возвращает текущую позицию указанной оси (Real Position)
-    pos = double()
-    acs.acsc_GetRPosition(hcomm, axis, p(pos), wait)
-    return pos.value
+    acs.acsc_GetRPosition(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getFPosition(hcomm, axis, wait=SYNCHRONOUS):  #Возвращает целевую позицию указанной оси (Final Position)
-    pos = double()
-    acs.acsc_GetFPosition(hcomm, axis, byref(pos), wait)
-    return pos.value
+    acs.acsc_GetFPosition(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getRVelocity(hcomm, axis, wait=SYNCHRONOUS):  #Возвращает текущую скорость указанной оси
-    rvel = double()
-    acs.acsc_GetRVelocity(hcomm, axis, byref(rvel), wait)
-    return rvel.value
+    acs.acsc_GetRVelocity(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getFVelocity(hcomm, axis, wait=SYNCHRONOUS):  #Возвращает целевую скорость указанной оси
-    vel = double()
-    acs.acsc_GetFVelocity(hcomm, axis, byref(vel), wait)
-    return vel.value
+    acs.acsc_GetFVelocity(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getVelocity(hcomm, axis, wait=SYNCHRONOUS):  #Возвращает текущую скорость указанной оси
     """Returns current velocity for specified axis."""
-    vel = double()
-    acs.acsc_GetVelocity(hcomm, axis, byref(vel), wait)
-    return vel.value
+    acs.acsc_GetVelocity(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getAcceleration(hcomm, axis, wait=SYNCHRONOUS):   #Возвращает текущее ускорение для указанной оси
     """Returns current acceleration for specified axis."""
-    val = double()
-    acs.acsc_GetAcceleration(hcomm, axis, byref(val), wait)
-    return val.value
+    acs.acsc_GetAcceleration(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getDeceleration(hcomm, axis, wait=SYNCHRONOUS):   #Возвращает текущее замедление для указанной оси
     """Returns current deceleration for specified axis."""
-    val = double()
-    acs.acsc_GetDeceleration(hcomm, axis, byref(val), wait)
-    return val.value
+    acs.acsc_GetDeceleration(hcomm, axis, _out.real_ref, wait)
+    return _out.real.value
 
 def getFault(hcomm, axis, wait=SYNCHRONOUS): #Возвращает набор битов, которые указывают на ошибки двигателя или системы
     "Get the set of bits that indicate the motor or system faults"
-    val = ctypes.c_long()
-    ret = acs.acsc_GetFault(hcomm, axis, byref(val), wait) #Скорее всего ret это просто опечатка и её надо убрать
+    val = ctypes.c_int()    # Возвращается сам объект (вызывающий код берёт .value), поэтому не общий буфер
+    acs.acsc_GetFault(hcomm, axis, byref(val), wait)
     return val
 
+def getFPositionAsync(hcomm, axis):
+    """Asynchronous getFPosition: an AsyncCall, result() - the position."""
+    pos = double()
+    return _issue(acs.acsc_GetFPosition, hcomm, (axis,), pos, byref(pos), _scalar)
+
+def getFVelocityAsync(hcomm, axis):
+    """Asynchronous getFVelocity: an AsyncCall, result() - the velocity."""
+    vel = double()
+    return _issue(acs.acsc_GetFVelocity, hcomm, (axis,), vel, byref(vel), _scalar)
+
+def getMotorStateAsync(hcomm, axis):
+    """Asynchronous motor state: an AsyncCall, result() - the MST bits."""
+    state = ctypes.c_int()
+    return _issue(acs.acsc_GetMotorState, hcomm, (axis,), state, byref(state), _scalar)
+
+def getFaultAsync(hcomm, axis):
+    """Asynchronous getFault: an AsyncCall, result() - the FAULT bits (int)."""
+    val = ctypes.c_int()
+    return _issue(acs.acsc_GetFault, hcomm, (axis,), val, byref(val), _scalar)
+
 def closeComm(hcomm):  #Закрывает соединение с контроллером
     """Closes communication with the controller."""
     acs.acsc_CloseComm(hcomm)
+    _collectionArrays.difference_update({key for key in _collectionArrays if key[0] == hcomm})
 
 def unregisterEmergencyStop():  #Отменяет регистрацию программной аварийной остановки
     acs.acsc_UnregisterEmergencyStop()
@@ -236,17 +477,16 @@ def runBuffer(hcomm, buffno, label=None, wait=SYNCHRONOUS): #Запускает
     """Runs a buffer in the controller."""
     if label is not None:
         label=label.encode()
-    acs.acsc_RunBuffer(hcomm, int32(buffno), label, wait)
+    acs.acsc_RunBuffer(hcomm, buffno, label, wait)
 
 def stopBuffer(hcomm, buffno, wait=SYNCHRONOUS):
     """Stops a buffer running in the controller."""
-    acs.acsc_StopBuffer(hcomm, int32(buffno), wait)
+    acs.acsc_StopBuffer(hcomm, buffno, wait)
 
 def getProgramState(hc, nbuf, wait=SYNCHRONOUS):  #Возвращает состояние программы (буфера) на контроллере
     """Returns program state"""
-    state = ctypes.c_int()
-    acs.acsc_GetProgramState(hc, nbuf, byref(state), wait)
-    return state.value
+    acs.acsc_GetProgramState(hc, nbuf, _out.int_ref, wait)
+    return _out.int.value
 
 def halt(hcomm, axis, wait=SYNCHRONOUS):  #Останавливает движение указанной оси (halt - остановка)
     """Halts motion on specified axis."""
@@ -256,12 +496,7 @@ def halt(hcomm, axis, wait=SYNCHRONOUS):  #Останавливает движе
 def haltM(hcomm, axes, wait=SYNCHRONOUS):  #Выполняет многокоординатное движение
     """The function terminates several motions using the full deceleration profile. Axes and target
     are entered as tuples. Set flags as None for absolute coordinates."""
-    axes_array = ctypes.c_int*(len(axes) + 1)
-    axes_c = axes_array()
-    for n in range(len(axes)):
-        axes_c[n] = axes[n]
-    axes_c[-1] = -1
-    errorHandling(acs.acsc_HaltM(hcomm, axes_c, wait))  #Обработка ошибок
+    errorHandling(acs.acsc_HaltM(hcomm, _axes(tuple(axes)), wait))  #Обработка ошибок
 #!!!!!! SelfMade
 #!!!!!! SelfMade
 def killAll(hcomm, wait=SYNCHRONOUS):  #Принудительно останавливает все оси (kill - убить)
@@ -270,49 +505,79 @@ def killAll(hcomm, wait=SYNCHRONOUS):  #Принудительно остана
 #!!!!!!! SelfMade
 
 def declareVariable(hcomm, vartype, varname, wait=SYNCHRONOUS):  #Объявляет переменную в контроллере
-    """Declare a variable in the controller."""
-    acs.acsc_DeclareVariable(hcomm, vartype, varname.encode(), wait)
+    """Declare a variable in the controller. Returns the library's result (0 - error)."""
+    return acs.acsc_DeclareVariable(hcomm, vartype, varname.encode(), wait)
 
-def readInteger(hcomm, buffno, varname, from1=None, to1=None, from2=None,
-                to2=None, wait=SYNCHRONOUS):
+def _readArray(function, dtype, hcomm, buffno, varname, from1, to1, from2, to2, wait):
+    """Reads a 1-D (from2 == NONE) or 2-D range through the thread's buffer."""
+    if from2 == NONE and to2 == NONE:
+        shape = (to1-from1+1,)
+    else:
+        shape = (to1-from1+1, to2-from2+1)
+    values, pointer = _out.array(dtype, shape)
+    function(hcomm, buffno, varname.encode(), from1, to1, from2, to2, pointer, wait)
+    # Small buffers are reused by the next read - hand out a copy
+    return values.copy() if values.size <= BUFFER_CACHE_SIZE else values
+
+def readInteger(hcomm, buffno, varname, from1=NONE, to1=NONE, from2=NONE,
+                to2=NONE, wait=SYNCHRONOUS):
     """Reads an integer(s) in the controller."""        #to1,2,  from1,2 - диапазоны дл чтения (опционально)
-    intread = ctypes.c_int()
-    acs.acsc_ReadInteger(hcomm, buffno, varname.encode(), from1, to1, from2,
-                         to2, p(intread), wait)
-    return intread.value
+    if from1 == NONE:
+        acs.acsc_ReadInteger(hcomm, buffno, varname.encode(), from1, to1, from2,
+                             to2, _out.int_ref, wait)
+        return _out.int.value
+    return _readArray(acs.acsc_ReadInteger, np.int32, hcomm, buffno, varname,
+                      from1, to1, from2, to2, wait)
 
 def writeInteger(hcomm, variable, val_to_write, nbuff=NONE, from1=NONE,
                  to1=NONE, from2=NONE, to2=NONE, wait=SYNCHRONOUS):
     """Writes an integer variable to the controller."""
     val = ctypes.c_int(val_to_write)
     acs.acsc_WriteInteger(hcomm, nbuff, variable.encode(), from1, to1,
-                          from2, to2, p(val), wait)
+                          from2, to2, byref(val), wait)
 
 def readReal(hcomm, buffno, varname, from1=NONE, to1=NONE, from2=NONE,
              to2=NONE, wait=SYNCHRONOUS):
     """Read real variable (scalar or array) from the controller."""
-    if from2 == NONE and to2 == NONE and from1 != NONE:
-        values = np.zeros((to1-from1+1), dtype=np.float64)
-        pointer = values.ctypes.data
-    elif from2 != NONE:
-        values = np.zeros((to1-from1+1, to2-from2+1), dtype=np.float64)
-        pointer = values.ctypes.data
-    else:
-        values = double()
-        pointer = byref(values)
-    acs.acsc_ReadReal(hcomm, buffno, varname.encode(), from1, to1, from2, to2,
-                      pointer, wait)
-    if from1 != NONE:
-        return values
-    else:
-        return values.value
+    if from1 == NONE:
+        acs.acsc_ReadReal(hcomm, buffno, varname.encode(), from1, to1, from2,
+                          to2, _out.real_ref, wait)
+        return _out.real.value
+    return _readArray(acs.acsc_ReadReal, np.float64, hcomm, buffno, varname,
+                      from1, to1, from2, to2, wait)
 
 def writeReal(hcomm, varname, val_to_write, nbuff=NONE, from1=NONE, to1=NONE,
               from2=NONE, to2=NONE, wait=SYNCHRONOUS):
-    """Writes a real value to the controller."""
-    val = ctypes.c_double(val_to_write)
+    """Writes a real value (scalar or array) to the controller."""
+    if np.ndim(val_to_write) > 0:
+        values = np.ascontiguousarray(val_to_write, dtype=np.float64)
+        pointer = values.ctypes.data_as(ctypes.POINTER(double))
+    else:
+        val = ctypes.c_double(val_to_write)
+        pointer = byref(val)
     acs.acsc_WriteReal(hcomm, nbuff, varname.encode(), from1, to1,
-                       from2, to2, p(val), wait)
+                       from2, to2, pointer, wait)
+
+def _readAsync(function, dtype, ctype, hcomm, buffno, varname, from1, to1, from2, to2):
+    args = (buffno, varname.encode(), from1, to1, from2, to2)
+    if from1 == NONE:
+        value = ctype()
+        return _issue(function, hcomm, args, value, byref(value), _scalar)
+    if from2 == NONE and to2 == NONE:
+        values = np.zeros(to1-from1+1, dtype=dtype)
+    else:
+        values = np.zeros((to1-from1+1, to2-from2+1), dtype=dtype)
+    return _issue(function, hcomm, args, values, values.ctypes.data_as(ctypes.POINTER(ctype)))
+
+def readRealAsync(hcomm, buffno, varname, from1=NONE, to1=NONE, from2=NONE, to2=NONE):
+    """Asynchronous readReal: an AsyncCall, result() - as readReal returns."""
+    return _readAsync(acs.acsc_ReadReal, np.float64, double, hcomm, buffno,
+                      varname, from1, to1, from2, to2)
+
+def readIntegerAsync(hcomm, buffno, varname, from1=NONE, to1=NONE, from2=NONE, to2=NONE):
+    """Asynchronous readInteger: an AsyncCall, result() - as readInteger returns."""
+    return _readAsync(acs.acsc_ReadInteger, np.int32, ctypes.c_int, hcomm, buffno,
+                      varname, from1, to1, from2, to2)
 
 def uploadDataFromController(hcomm, src, srcname, srcnumformat, from1, to1, #Загружает данные из контроллера в файл на компьютере
             from2, to2, destfilename, destnumformat, btranspose, wait=0):
@@ -321,10 +586,131 @@ def uploadDataFromController(hcomm, src, srcname, srcnumformat, from1, to1, #З
             btranspose, wait)
 
 
+def dataCollection(hcomm, flags, axis, array, nsample, period, variables,
+                   wait=SYNCHRONOUS):
+    """Starts data collection on the controller. `variables` is a list of
+    ACSPL+ expressions (e.g. ["FPOS(0)", "FVEL(0)"]) sampled every `period`
+    ms into the rows of the 2-D controller array `array`."""
+    varlist = "\r".join(variables).encode()
+    errorHandling(acs.acsc_DataCollectionExt(hcomm, flags, axis, array.encode(),
+                                             nsample, period, varlist,
+                                             wait))
+
+def stopCollect(hcomm, wait=SYNCHRONOUS):
+    """Terminates data collection."""
+    errorHandling(acs.acsc_StopCollect(hcomm, wait))
+
+def waitCollectEnd(hcomm, timeout):
+    """Waits for the end of data collection. Timeout - ms."""
+    errorHandling(acs.acsc_WaitCollectEnd(hcomm, timeout))
+
+def _declareCollectionArray(hcomm, array):
+    """Declares the data collection array once per connection. RuntimeError -
+    the controller has no such array and refused to declare it."""
+    if (hcomm, array) in _collectionArrays:
+        return
+    if not declareVariable(hcomm, REAL_TYPE, "%s(%d)(%d)" % (array, DC_ROWS, DC_SAMPLES)):
+        error = getLastError()
+        # Уже объявлен (например, прошлым запуском программы) - проверяем чтением последнего элемента
+        _, pointer = _out.array(np.float64, (1, 1))
+        probe = acs.acsc_ReadReal(hcomm, NONE, array.encode(), DC_ROWS-1, DC_ROWS-1,
+                                  DC_SAMPLES-1, DC_SAMPLES-1, pointer, SYNCHRONOUS)
+        if not probe:
+            raise RuntimeError("Cannot declare data collection array %s(%d)(%d): error %d"
+                               % (array, DC_ROWS, DC_SAMPLES, error))
+    _collectionArrays.add((hcomm, array))
+
+def collectionPeriod(duration, nsample=DC_SAMPLES):
+    """Shortest whole-millisecond sampling period (>= 1 ms) at which `nsample`
+    samples cover `duration` seconds."""
+    return max(1.0, float(np.ceil(duration*1000.0/min(nsample, DC_SAMPLES))))
+
+def startDataCollection(hcomm, axes, period=None, duration=None, nsample=DC_SAMPLES,
+                        array=DC_ARRAY):
+    """Records controller TIME and FPOS/FVEL of `axes` every `period` ms
+    into `array` on the controller. Returns the list of collected variables.
+    Without `period` it is chosen by collectionPeriod() so the record covers
+    `duration` seconds (1 ms if no duration is given); ValueError if the
+    record of `nsample` samples is shorter than `duration`.
+    Read the record back with stopDataCollection() once motion is over."""
+    variables = ["TIME"]
+    for axis in axes:
+        variables += ["FPOS(%d)" % axis, "FVEL(%d)" % axis]
+    if len(variables) > DC_ROWS:
+        raise ValueError("Data collection supports up to %d axes"
+                         % ((DC_ROWS - 1) // 2))
+    nsample = min(nsample, DC_SAMPLES)
+    if period is None:
+        period = collectionPeriod(duration, nsample) if duration is not None else 1.0
+    if duration is not None and duration*1000.0/period > nsample:
+        raise ValueError("Data collection of %d samples every %g ms is shorter than %g s"
+                         % (nsample, period, duration))
+    _declareCollectionArray(hcomm, array)
+    # Zero TIME row so the number of samples actually taken can be found after upload
+    writeReal(hcomm, array, np.zeros(nsample), from1=0, to1=0, from2=0,
+              to2=nsample-1)
+    # Without DCF_TEMPORAL: with it the controller derives the period from the collection time
+    dataCollection(hcomm, 0, NONE, array, nsample, period, variables)
+    return variables
+
+def stopDataCollection(hcomm, axes, nsample=DC_SAMPLES, array=DC_ARRAY):
+    """Stops data collection started by startDataCollection() and uploads
+    the record in one array transfer. Returns a dict with
+      * "time" - controller timestamps, s (from the first sample)
+      * "fpos" - array (len(axes), n) of feedback positions
+      * "fvel" - array (len(axes), n) of feedback velocities
+      * "full" - True if all `nsample` samples were taken (motion may have outlasted the record)
+    """
+    stopCollect(hcomm)
+    nsample = min(nsample, DC_SAMPLES)
+    rows = 1 + 2*len(axes)
+    data = readReal(hcomm, NONE, array, 0, rows-1, 0, nsample-1)
+    n = int(np.count_nonzero(data[0]))  # Samples are written in order, the rest keep zero TIME
+    data = data[:, :n]
+    return {"time": (data[0] - data[0, 0]) / 1000.0 if n else data[0],
+            "fpos": data[1::2],
+            "fvel": data[2::2],
+            "full": n >= nsample}
+
+
+#Position Event Generation (PEG) - аппаратные импульсы по положению оси
+def assignPeg(hcomm, axis, eng_to_enc_bitcode, gp_outs_bitcode, wait=SYNCHRONOUS):
+    """Connects the PEG engine of `axis` to its encoder and general purpose
+    outputs (bit codes as in the controller's PEG pin assignment table)."""
+    errorHandling(acs.acsc_AssignPegNT(hcomm, axis, eng_to_enc_bitcode,
+                                       gp_outs_bitcode, wait))
+
+def assignPegOutputs(hcomm, axis, output_index, bitcode, wait=SYNCHRONOUS):
+    """Routes PEG pulse/state signals of `axis` to physical output pins."""
+    errorHandling(acs.acsc_AssignPegOutputsNT(hcomm, axis, output_index,
+                                              bitcode, wait))
+
+def pegInc(hcomm, flags, axis, width, first_point, interval, last_point,
+           tb_number=NONE, tb_period=NONE, wait=SYNCHRONOUS):
+    """Incremental PEG: a pulse `width` ms long each time `axis` passes
+    first_point + k*interval (user units) up to last_point. The engine
+    fires only after startPeg(); waitPegReady() waits until it is loaded."""
+    errorHandling(acs.acsc_PegIncV2(hcomm, flags or 0, axis, width, first_point,
+                                    interval, last_point, tb_number, tb_period,
+                                    wait))
+
+def startPeg(hcomm, axis, wait=SYNCHRONOUS):
+    """Starts the PEG engine of `axis` (sets AST_PEG)."""
+    errorHandling(acs.acsc_StartPegNT(hcomm, axis, wait))
+
+def stopPeg(hcomm, axis, wait=SYNCHRONOUS):
+    """Stops the PEG engine of `axis`."""
+    errorHandling(acs.acsc_StopPegNT(hcomm, axis, wait))
+
+def waitPegReady(hcomm, axis, timeout):
+    """Waits until the PEG configuration is loaded (AST_PEGREADY). Timeout - ms."""
+    errorHandling(acs.acsc_WaitPegReadyNT(hcomm, axis, timeout))
+
+
 def loadBuffer(hcomm, buffnumber, program, count=512, wait=SYNCHRONOUS):  #Загружает программу (буфер) в контроллер
     """Load a buffer into the ACS controller."""
     prgbuff = ctypes.create_string_buffer(str(program).encode(), count)
-    rv = acs.acsc_LoadBuffer(hcomm, buffnumber, byref(prgbuff), count, wait)
+    rv = acs.acsc_LoadBuffer(hcomm, buffnumber, prgbuff, count, wait)
     errorHandling(rv)
 
 
@@ -334,24 +720,23 @@ def loadBuffersFromFile(hcomm, filename, wait=SYNCHRONOUS):
 
 
 def spline(hcomm, flags, axis, period, wait=SYNCHRONOUS):  #Можно через неё задавать плановое ускорение и замедление, сложные профили  скорости
-    rv = acs.acsc_Spline(hcomm, flags, axis, double(period), wait)
+    rv = acs.acsc_Spline(hcomm, flags or 0, axis, period, wait)
     errorHandling(rv)
 
 def addPVPoint(hcomm, axis, point, velocity, wait=SYNCHRONOUS):  #Добавляет точку PV (Position-Velocity) для указанной оси, задаёт позицию и скорость движения
-    acs.acsc_AddPVPoint(hcomm, axis, double(point), double(velocity), wait)
+    acs.acsc_AddPVPoint(hcomm, axis, point, velocity, wait)
 
 def addPVTPoint(hcomm, axis, point, velocity, dt, wait=SYNCHRONOUS):  #Ещё и время достижения точки
-    acs.acsc_AddPVTPoint(hcomm, axis, double(point), double(velocity),
-                         double(dt), wait)
+    acs.acsc_AddPVTPoint(hcomm, axis, point, velocity, dt, wait)
 
 def multiPoint(hcomm, flags, axis, dwell, wait=SYNCHRONOUS):  #многокоординатное движение для указанной оси с заданной задержкой
-    acs.acsc_MultiPoint(hcomm, flags, axis, double(dwell), wait) #dwell — это время задержки (ожидания) в конце движения
+    acs.acsc_MultiPoint(hcomm, flags or 0, axis, dwell, wait) #dwell — это время задержки (ожидания) в конце движения
 
 def addPoint(hcomm, axis, point, wait=SYNCHRONOUS):  #Добавляет точку для движения указанной оси
-    acs.acsc_AddPoint(hcomm, axis, double(point), wait)
+    acs.acsc_AddPoint(hcomm, axis, point, wait)
 
 def extAddPoint(hcomm, axis, point, rate, wait=SYNCHRONOUS):  #Добавляет точку для движения с указанной скоростью (rate)
-    acs.acsc_ExtAddPoint(hcomm, axis, double(point), double(rate), wait)
+    acs.acsc_ExtAddPoint(hcomm, axis, point, rate, wait)
 
 def endSequence(hcomm, axis, wait=SYNCHRONOUS):  #Завершает последовательность движения для указанной оси
     return acs.acsc_EndSequence(hcomm, axis, wait)
@@ -361,14 +746,13 @@ def go(hcomm, axis, wait=SYNCHRONOUS):  #Начинает движение ук
 
 # ! By myself
 def goM(hcomm, axes, wait=SYNCHRONOUS): #Начинает движение осей, ожидающих приказа, синхронно
-    acs.GoM(hcomm, axes, wait)
+    errorHandling(acs.acsc_GoM(hcomm, _axes(tuple(axes)), wait))
 # ! By myself
 
 def getOutput(hcomm, port, bit, wait=SYNCHRONOUS):  #Возвращает значение цифрового выхода контроллера
     """Returns the value of a digital output."""
-    val = int32()
-    acs.acsc_GetOutput(hcomm, port, bit, byref(val), wait)
-    return val.value
+    acs.acsc_GetOutput(hcomm, port, bit, _out.int_ref, wait)
+    return _out.int.value
 
 def setOutput(hcomm, port, bit, val, wait=SYNCHRONOUS):  #Устанавливает значение цифрового выхода контроллера
     """Sets the value of a digital output."""
@@ -386,14 +770,12 @@ def printLastError():
 
 def setRPosition(hcomm, axis, pos, wait=SYNCHRONOUS):  #Устанавливает реальную позицию (R Position) для указанной оси
     try:
-        pos = ctypes.c_double(pos)
         acs.acsc_SetRPosition(hcomm, axis, pos, wait)
     except:
         raise IOError("Error: cannot set R position of the controller")
 
 def setFPosition(hcomm, axis, pos, wait=SYNCHRONOUS):  #Устанавливает финальную позицию (F Position) для указанной оси
     try:
-        pos = ctypes.c_double(pos)
         acs.acsc_SetFPosition(hcomm, axis, pos, wait)
     except:
         raise IOError("Error: cannot set F position of the controller")
@@ -407,35 +789,159 @@ def smoothPointToPointMotion(hcomm, flags, axes, points, vel, wait=SYNCHRONOUS):
 #!!!ДОБАВИТЬ ОБРАБОТКУ ВХОДНЫХ АРГУМЕНТОВ (double, tuple и т.д.)
 def waitMotionEnd(hcomm, axis, timeout):
     """Waits for motion to end."""
-    acs.acsc_WaitMotionEnd(hcomm, axis, double(timeout))  # Timeout - ms
-
-
-# Add type definitions for the segmented motion functions
-acs.acsc_ExtendedSegmentedMotionV2.restype = ctypes.c_int
-acs.acsc_ExtendedSegmentedMotionV2.argtypes = [
-    ctypes.c_int,                     # hcomm
-    ctypes.c_int,                     # flags
-    ctypes.POINTER(ctypes.c_int),     # axes
-    ctypes.POINTER(ctypes.c_double),  # point
-    ctypes.POINTER(ctypes.c_double),  # vel
-    ctypes.POINTER(ctypes.c_double),  # endVel
-    ctypes.POINTER(ctypes.c_double),  # juncVel
-    ctypes.POINTER(ctypes.c_double),  # angle
-    ctypes.POINTER(ctypes.c_double),  # curveVel
-    ctypes.POINTER(ctypes.c_double),  # deviation
-    ctypes.POINTER(ctypes.c_double),  # radius
-    ctypes.POINTER(ctypes.c_double),  # maxLength
-    ctypes.POINTER(ctypes.c_double),  # starvMargin
-    ctypes.POINTER(ctypes.c_double),  # segments
-    ctypes.POINTER(ctypes.c_double),  # extLoopType
-    ctypes.POINTER(ctypes.c_double),  # minSegmentLength
-    ctypes.POINTER(ctypes.c_double),  # maxAllowedDeviation
-    ctypes.POINTER(ctypes.c_double),  # outputIndex
-    ctypes.POINTER(ctypes.c_double),  # bitNumber
-    ctypes.POINTER(ctypes.c_double),  # polarity
-    ctypes.POINTER(ctypes.c_double),  # motionDelay
-    ctypes.c_int                      # wait
-]
+    acs.acsc_WaitMotionEnd(hcomm, axis, int(timeout))  # Timeout - ms
+
+
+# Prototypes of the library functions: name -> (restype, argtypes).
+# Declared once at load (and on setBackend), so ctypes converts arguments by
+# the ready converters instead of guessing each argument's type on every call.
+_HANDLE = ctypes.c_int                       # Communication handle (as returned by acsc_OpenComm*)
+_INT = ctypes.c_int
+_DOUBLE = ctypes.c_double
+_STRING = ctypes.c_char_p
+_WAIT = ctypes.c_void_p                      # ACSC_WAITBLOCK* (None - synchronous call)
+_PINT = ctypes.POINTER(ctypes.c_int)
+_PDOUBLE = ctypes.POINTER(ctypes.c_double)
+
+_AXIS_SET = [_HANDLE, _INT, _DOUBLE, _WAIT]  # (hcomm, axis, value, wait)
+_AXIS_GET_REAL = [_HANDLE, _INT, _PDOUBLE, _WAIT]
+_AXIS_GET_INT = [_HANDLE, _INT, _PINT, _WAIT]
+_AXIS_CMD = [_HANDLE, _INT, _WAIT]
+_AXES_CMD = [_HANDLE, _PINT, _WAIT]
+_RANGE = [_HANDLE, _INT, _STRING, _INT, _INT, _INT, _INT]   # (hcomm, buffer, name, from1, to1, from2, to2)
+
+_PROTOTYPES = {
+    "acsc_OpenCommDirect": (_HANDLE, []),
+    "acsc_OpenCommEthernetTCP": (_HANDLE, [_STRING, _INT]),
+    "acsc_CloseComm": (_INT, [_HANDLE]),
+    "acsc_GetLastError": (_INT, []),
+    "acsc_WaitForAsyncCall": (_INT, [_HANDLE, ctypes.c_void_p, _PINT, _WAIT, _INT]),
+    "acsc_CancelOperation": (_INT, [_HANDLE, _WAIT]),
+    "acsc_SetCallbackExt": (_INT, [_HANDLE, CALLBACK, ctypes.c_void_p, _INT]),
+    "acsc_SetCallbackMask": (_INT, [_HANDLE, _INT, ctypes.c_uint64]),
+    "acsc_RegisterEmergencyStop": (_INT, []),
+    "acsc_UnregisterEmergencyStop": (_INT, []),
+    # Motion parameters and state
+    "acsc_SetVelocity": (_INT, _AXIS_SET),
+    "acsc_SetAcceleration": (_INT, _AXIS_SET),
+    "acsc_SetDeceleration": (_INT, _AXIS_SET),
+    "acsc_SetKillDeceleration": (_INT, _AXIS_SET),
+    "acsc_SetJerk": (_INT, _AXIS_SET),
+    "acsc_SetFPosition": (_INT, _AXIS_SET),
+    "acsc_SetRPosition": (_INT, _AXIS_SET),
+    "acsc_GetVelocity": (_INT, _AXIS_GET_REAL),
+    "acsc_GetAcceleration": (_INT, _AXIS_GET_REAL),
+    "acsc_GetDeceleration": (_INT, _AXIS_GET_REAL),
+    "acsc_GetFPosition": (_INT, _AXIS_GET_REAL),
+    "acsc_GetRPosition": (_INT, _AXIS_GET_REAL),
+    "acsc_GetFVelocity": (_INT, _AXIS_GET_REAL),
+    "acsc_GetRVelocity": (_INT, _AXIS_GET_REAL),
+    "acsc_GetMotorState": (_INT, _AXIS_GET_INT),
+    "acsc_GetAxisState": (_INT, _AXIS_GET_INT),
+    "acsc_GetFault": (_INT, _AXIS_GET_INT),
+    "acsc_GetProgramState": (_INT, _AXIS_GET_INT),
+    "acsc_Enable": (_INT, _AXIS_CMD),
+    "acsc_Disable": (_INT, _AXIS_CMD),
+    # Motion
+    "acsc_ToPoint": (_INT, [_HANDLE, _INT, _INT, _DOUBLE, _WAIT]),
+    "acsc_ToPointM": (_INT, [_HANDLE, _INT, _PINT, _PDOUBLE, _WAIT]),
+    "acsc_Jog": (_INT, [_HANDLE, _INT, _INT, _DOUBLE, _WAIT]),
+    "acsc_Go": (_INT, _AXIS_CMD),
+    "acsc_GoM": (_INT, _AXES_CMD),
+    "acsc_Halt": (_INT, _AXIS_CMD),
+    "acsc_HaltM": (_INT, _AXES_CMD),
+    "acsc_KillAll": (_INT, [_HANDLE, _WAIT]),
+    "acsc_WaitMotionEnd": (_INT, [_HANDLE, _INT, _INT]),
+    "acsc_Spline": (_INT, [_HANDLE, _INT, _INT, _DOUBLE, _WAIT]),
+    "acsc_MultiPoint": (_INT, [_HANDLE, _INT, _INT, _DOUBLE, _WAIT]),
+    "acsc_AddPoint": (_INT, _AXIS_SET),
+    "acsc_ExtAddPoint": (_INT, [_HANDLE, _INT, _DOUBLE, _DOUBLE, _WAIT]),
+    "acsc_AddPVPoint": (_INT, [_HANDLE, _INT, _DOUBLE, _DOUBLE, _WAIT]),
+    "acsc_AddPVTPoint": (_INT, [_HANDLE, _INT, _DOUBLE, _DOUBLE, _DOUBLE, _WAIT]),
+    "acsc_EndSequence": (_INT, _AXIS_CMD),
+    "acsc_EndSequenceM": (_INT, _AXES_CMD),
+    # Segmented motion
+    "acsc_ExtendedSegmentedMotionV2": (_INT, [
+        _HANDLE,                          # hcomm
+        _INT,                             # flags
+        _PINT,                            # axes
+        _PDOUBLE,                         # point
+        _DOUBLE,                          # vel
+        _DOUBLE,                          # endVel
+        _DOUBLE,                          # juncVel
+        _DOUBLE,                          # angle
+        _DOUBLE,                          # curveVel
+        _DOUBLE,                          # deviation
+        _DOUBLE,                          # radius
+        _DOUBLE,                          # maxLength
+        _DOUBLE,                          # starvMargin
+        _STRING,                          # segments (array name)
+        _INT,                             # extLoopType
+        _DOUBLE,                          # minSegmentLength
+        _DOUBLE,                          # maxAllowedDeviation
+        _INT,                             # outputIndex
+        _INT,                             # bitNumber
+        _INT,                             # polarity
+        _DOUBLE,                          # motionDelay
+        _WAIT]),                          # wait
+    "acsc_SegmentArc2V2": (_INT, [
+        _HANDLE,                          # hcomm
+        _INT,                             # flags
+        _PINT,                            # axes
+        _PDOUBLE,                         # center
+        _DOUBLE,                          # angle
+        _PDOUBLE,                         # finalPoints (secondary axes)
+        _DOUBLE,                          # vel
+        _DOUBLE,                          # endVel
+        _DOUBLE,                          # time
+        _STRING,                          # values (array name)
+        _STRING,                          # variables (array name)
+        _INT,                             # index
+        _STRING,                          # masks (array name)
+        _INT,                             # extLoopType
+        _DOUBLE,                          # minSegmentLength
+        _DOUBLE,                          # maxAllowedDeviation
+        _INT,                             # lciState
+        _WAIT]),                          # wait
+    # Variables and buffers
+    "acsc_ReadReal": (_INT, _RANGE + [_PDOUBLE, _WAIT]),
+    "acsc_ReadInteger": (_INT, _RANGE + [_PINT, _WAIT]),
+    "acsc_WriteReal": (_INT, _RANGE + [_PDOUBLE, _WAIT]),
+    "acsc_WriteInteger": (_INT, _RANGE + [_PINT, _WAIT]),
+    "acsc_DeclareVariable": (_INT, [_HANDLE, _INT, _STRING, _WAIT]),
+    "acsc_RunBuffer": (_INT, [_HANDLE, _INT, _STRING, _WAIT]),
+    "acsc_StopBuffer": (_INT, _AXIS_CMD),
+    "acsc_LoadBuffer": (_INT, [_HANDLE, _INT, _STRING, _INT, _WAIT]),
+    "acsc_LoadBuffersFromFile": (_INT, [_HANDLE, _STRING, _WAIT]),
+    # Data collection
+    "acsc_DataCollectionExt": (_INT, [_HANDLE, _INT, _INT, _STRING, _INT, _DOUBLE, _STRING, _WAIT]),
+    "acsc_StopCollect": (_INT, [_HANDLE, _WAIT]),
+    "acsc_WaitCollectEnd": (_INT, [_HANDLE, _INT]),
+    # PEG
+    "acsc_AssignPegNT": (_INT, [_HANDLE, _INT, _INT, _INT, _WAIT]),
+    "acsc_AssignPegOutputsNT": (_INT, [_HANDLE, _INT, _INT, _INT, _WAIT]),
+    "acsc_PegIncV2": (_INT, [_HANDLE, _INT, _INT, _DOUBLE, _DOUBLE, _DOUBLE,
+                             _DOUBLE, _INT, _DOUBLE, _WAIT]),
+    "acsc_StartPegNT": (_INT, _AXIS_CMD),
+    "acsc_StopPegNT": (_INT, _AXIS_CMD),
+    "acsc_WaitPegReadyNT": (_INT, [_HANDLE, _INT, _INT]),
+    # Digital I/O
+    "acsc_GetOutput": (_INT, [_HANDLE, _INT, _INT, _PINT, _WAIT]),
+    "acsc_SetOutput": (_INT, [_HANDLE, _INT, _INT, _INT, _WAIT]),
+}
+
+def _declarePrototypes(lib):
+    """Sets restype/argtypes of every function in _PROTOTYPES that the
+    library exports (older DLLs lack some of the *V2/*NT functions)."""
+    for name, (restype, argtypes) in _PROTOTYPES.items():
+        try:
+            function = getattr(lib, name)
+        except AttributeError:
+            continue
+        function.restype = restype
+        function.argtypes = argtypes
+
+_declarePrototypes(acs)
 
 def extendedSegmentedMotionV2(hcomm,
                               flags,
@@ -460,33 +966,29 @@ def extendedSegmentedMotionV2(hcomm,
                               motionDelay,
                               wait=SYNCHRONOUS
                               ):
-    n = len(axes)
-    axes_c = (ctypes.c_int * (n + 1))(*axes, -1)
-    point_c = (ctypes.c_double * n)(*point)
-
     result = acs.acsc_ExtendedSegmentedMotionV2(
         hcomm,
         int(flags),
-        axes_c,
-        point_c,
-        byref(double(vel)),
-        byref(double(endVel)),
-        byref(double(juncVel)),
-        byref(double(angle)),
-        byref(double(curveVel)),
-        byref(double(deviation)),
-        byref(double(radius)),
-        byref(double(maxLength)),
-        byref(double(starvMargin)),
-        byref(double(segments)),
-        byref(double(extLoopType)),
-        byref(double(minSegmentLength)),
-        byref(double(maxAllowedDeviation)),
-        byref(double(outputIndex)),
-        byref(double(bitNumber)),
-        byref(double(polarity)),
-        byref(double(motionDelay)),
-        wait if wait is not None else SYNCHRONOUS
+        _axes(tuple(axes)),
+        _doubles(point),
+        vel,
+        endVel,
+        juncVel,
+        angle,
+        curveVel,
+        deviation,
+        radius,
+        maxLength,
+        starvMargin,
+        segments.encode() if segments else None,
+        extLoopType,
+        minSegmentLength,
+        maxAllowedDeviation,
+        outputIndex,
+        bitNumber,
+        polarity,
+        motionDelay,
+        wait
     )
 
     if result == 0:
@@ -548,43 +1050,32 @@ def segmentArc2V2(hcomm,
                   maxAllowedDeviation,
                   lciState,
                   wait=SYNCHRONOUS):
-    center = double*len(axes)
-    axes_array = ctypes.c_int*(len(axes) + 1)
-    center_c = center()
-    axes_c = axes_array()
-    for n in range(len(axes)):
-        center_c[n] = center[n]
-        axes_c[n] = axes[n]
-    axes_c[-1] = -1
-    vel = double(vel) # double - float
-    angle = double(angle)
-    #* etc.
-    acs.acsc_SegmentArc2V2(hcomm,
-                           flags,
-                           axes_c,
-                           center_c,
-                           angle,
-                           finalPoints,
-                           vel,
-                           endVel,
-                           time,
-                           values,
-                           variables,
-                           index,
-                           masks,
-                           extLoopType,
-                           minSegmentLength,
-                           maxAllowedDeviation,
-                           lciState,
-                           wait)
+    if finalPoints is not None:
+        finalPoints = _doubles(finalPoints)
+    result = acs.acsc_SegmentArc2V2(hcomm,
+                                    flags or 0,
+                                    _axes(tuple(axes)),
+                                    _doubles(center),
+                                    angle,
+                                    finalPoints,
+                                    vel,
+                                    endVel,
+                                    time,
+                                    values,
+                                    variables,
+                                    index,
+                                    masks,
+                                    extLoopType,
+                                    minSegmentLength,
+                                    maxAllowedDeviation,
+                                    lciState,
+                                    wait)
+    if result == 0:
+        raise RuntimeError("acsc_SegmentArc2V2 failed, error %d" % getLastError())
 
 def endSequenceM(hcomm, axes, wait=SYNCHRONOUS):
-    axes_array = ctypes.c_int*(len(axes) + 1)
-    axes_c = axes_array()
-    for n in range(len(axes)):
-        axes_c[n] = axes[n]
-    axes_c[-1] = -1
-    acs.acsc_EndSequenceM(hcomm, axes_c, wait)
+    if acs.acsc_EndSequenceM(hcomm, _axes(tuple(axes)), wait) == 0:
+        raise RuntimeError("acsc_EndSequenceM failed, error %d" % getLastError())
 
 # def getAxisState(hcomm, axis, wait=SYNCHRONOUS):  #Провекра вкл или выкл двигатель на данной оси
 #     """Checks state of axis."""
@@ -598,10 +1089,81 @@ def endSequenceM(hcomm, axes, wait=SYNCHRONOUS):
 #     return mst
 
 
+def setBackend(backend, library=None):
+    """Switches all wrappers to another backend: "dll" or "sim".
+    A ready library object (e.g. acsc_sim.SimulatedLibrary with a virtual
+    clock) can be passed in `library`. Returns the library in use."""
+    global acs, BACKEND
+    acs = library if library is not None else _loadLibrary(backend)
+    BACKEND = backend
+    _declarePrototypes(acs)
+    _collectionArrays.clear()
+    return acs
+
+
+def _benchmark(hcomm, axes=(0, 1, 2, 3), repeat=2000):
+    """Per-call time, us, of the polling calls with the declared prototypes,
+    cached buffers and pipelined asynchronous reads against the former way:
+    no argtypes, a fresh output object, array type and NumPy pointer on every
+    call, one synchronous round trip per read. Returns {call: (former, now)}."""
+    import timeit
+    lo, hi = min(axes), max(axes)
+    target = [0.0]*len(axes)
+
+    def formerFPosition():
+        pos = double()
+        acs.acsc_GetFPosition(hcomm, axes[0], byref(pos), SYNCHRONOUS)
+        return pos.value
+
+    def formerRead(name, dtype, ctype):
+        values = np.zeros(hi - lo + 1, dtype=dtype)
+        function = acs.acsc_ReadReal if ctype is double else acs.acsc_ReadInteger
+        function(hcomm, NONE, name.encode(), lo, hi, NONE, NONE,
+                 values.ctypes.data_as(ctypes.POINTER(ctype)), SYNCHRONOUS)
+        return values
+
+    def formerSnapshot():
+        snap = np.zeros(len(axes), dtype=SNAPSHOT_DTYPE)
+        snap["axis"] = axes
+        for field, dtype, ctype in (("fpos", np.float64, double), ("fvel", np.float64, double),
+                                    ("mst", np.int32, ctypes.c_int), ("ast", np.int32, ctypes.c_int),
+                                    ("fault", np.int32, ctypes.c_int)):
+            snap[field] = formerRead(field.upper(), dtype, ctype)[np.asarray(axes) - lo]
+        return snap.view(np.recarray)
+
+    def formerPoll():               # FPOS and FAULT of every axis, one by one
+        return [formerFPosition() for _ in axes], [getFault(hcomm, axis).value for axis in axes]
+
+    def formerArrays():             # Arguments of toPointM without the call itself
+        target_c = (double*len(axes))()
+        axes_c = (ctypes.c_int*(len(axes) + 1))()
+        for n in range(len(axes)):
+            target_c[n] = target[n]
+            axes_c[n] = axes[n]
+        axes_c[-1] = -1
+        return axes_c, target_c
+
+    calls = {"getFPosition": (formerFPosition, lambda: getFPosition(hcomm, axes[0])),
+             "getStateSnapshot": (formerSnapshot, lambda: getStateSnapshot(hcomm, axes)),
+             "pollAxes": (formerPoll, lambda: pollAxes(hcomm, axes)),
+             "toPointM arguments": (formerArrays, lambda: (_axes(tuple(axes)), _doubles(target)))}
+    result = {}
+    for name, (former, now) in calls.items():
+        for function in _PROTOTYPES:            # The former calls go without prototypes
+            if hasattr(acs, function):
+                getattr(acs, function).argtypes = None
+        t_former = min(timeit.repeat(former, number=repeat, repeat=5))/repeat*1e6
+        _declarePrototypes(acs)
+        t_now = min(timeit.repeat(now, number=repeat, repeat=5))/repeat*1e6
+        result[name] = (t_former, t_now)
+    return result
+
+
 if __name__ == "__main__":  #Этот код выполнится только при запуске файла напрямую
-    """Some testing can go here"""
-    # hc = openCommEthernetTCP(address = "172.20.196.4")
-    # print(hc)
-    # print(getOutput(hc, 1, 16))
-    # closeComm(hc)
-    print("Type of flags:", type(AMF_VELOCITY))  # <- это должен быть <class 'int'>
\ No newline at end of file
+    # Микробенчмарк обёрток на текущем бэкенде (ACSC_BACKEND=sim - симулятор,
+    # на Windows с DLL - симулятор SPiiPlus через openCommDirect)
+    hc = openCommDirect()
+    print("Backend:", BACKEND)
+    for name, (former, now) in _benchmark(hc).items():
+        print("%-20s %8.2f us -> %8.2f us  (x%.1f)" % (name, former, now, former/now))
+    closeComm(hc)
@@ -0,0 +1,1112 @@
+# -*- coding: utf-8 -*-
+"""
+ACSC simulator
+--------------
+Pure-Python stand-in for the ACS C library (ACSCL_x64.dll).
+
+SimulatedLibrary exposes the same acsc_* functions that acsc_modified calls
+through ctypes, so every wrapper in acsc_modified works unchanged on top of
+it. Motions are integrated analytically from VEL/ACC/DEC/JERK: a trapezoidal
+velocity profile, smoothed into a jerk-limited S-curve by a moving average of
+width ACC/JERK. Time is either wall-clock (optionally scaled) or virtual, in
+which case every call costs `call_cost` seconds and waits jump straight to
+the end of the motion. Asynchronous calls (ACSC_WAITBLOCK) issued together
+share a single `call_cost`, paid by the first acsc_WaitForAsyncCall.
+
+Select it with ACSC_BACKEND=sim or acsc_modified.setBackend("sim").
+"""
+from __future__ import division, print_function
+import bisect
+import re
+import threading
+import time
+
+import numpy as np
+
+N_AXES = 8
+
+# Motion flags / state bits (same values as in acsc_modified)
+AMF_WAIT = 0x00000001
+AMF_RELATIVE = 0x00000002
+AMF_VELOCITY = 0x00000004
+
+AST_LEAD = 0x00000001
+AST_DC = 0x00000002
+AST_PEG = 0x00000004
+AST_PEGREADY = 0x00000010
+AST_MOVE = 0x00000020
+AST_ACC = 0x00000040
+AST_SEGMENT = 0x00000080
+
+MST_ENABLE = 0x00000001
+MST_INPOS = 0x00000010
+MST_MOVE = 0x00000020
+MST_ACC = 0x00000040
+
+SAFETY_RL = 0x00000001  # Right limit
+SAFETY_LL = 0x00000002  # Left limit
+
+NONE = -1
+
+# Simulator error codes returned by acsc_GetLastError (not the ACS numbering)
+ERR_DISABLED = 9001
+ERR_UNKNOWN_VARIABLE = 9002
+ERR_BAD_ARGUMENT = 9003
+
+PEG_RESOLUTION = 1e-4  # s, time step at which PEG crossings are resolved
+
+# Interrupts raised by the simulator (acsc_SetCallbackExt)
+INTR_PHYSICAL_MOTION_END = 16
+INTR_LOGICAL_MOTION_END = 17
+INTR_MOTION_FAILURE = 18
+INTR_MOTOR_FAILURE = 19
+INTERRUPT_PERIOD = 0.001  # s of wall time between interrupt checks
+
+DEFAULT_PARAMS = {"VEL": 10.0, "ACC": 100.0, "DEC": 100.0, "KDEC": 1000.0,
+                  "JERK": 1000.0}
+
+
+class SimClock(object):
+    """Simulation time source.
+
+    realtime=True  - wall clock multiplied by `time_scale`;
+    realtime=False - virtual time advanced by `call_cost` per library call
+                     and by sleep(); waits return immediately.
+    """
+    def __init__(self, realtime=True, time_scale=1.0, call_cost=0.001):
+        self.realtime = realtime
+        self.time_scale = time_scale
+        self.call_cost = call_cost
+        self._t_real0 = time.monotonic()
+        self._t = 0.0
+
+    def now(self):
+        if self.realtime:
+            return (time.monotonic() - self._t_real0) * self.time_scale
+        return self._t
+
+    def tick(self):
+        if not self.realtime:
+            self._t += self.call_cost
+
+    def sleep(self, dt):
+        if dt <= 0:
+            return
+        if self.realtime:
+            time.sleep(dt / self.time_scale)
+        else:
+            self._t += dt
+
+
+class _Profile(object):
+    """Motion profile along a path of length `length` (always >= 0).
+
+    The trapezoid (vel, acc, dec) is averaged over a window tj = max(acc, dec)/jerk,
+    which bounds the jerk by `jerk` and lengthens the move by tj. jerk=0
+    leaves the plain trapezoid.
+    """
+    def __init__(self, length, vel, acc, dec, jerk=0.0):
+        self.length = L = abs(float(length))
+        vel, acc, dec = abs(vel), abs(acc), abs(dec)
+        if L == 0 or vel == 0 or acc == 0 or dec == 0:
+            self.vp = self.t1 = self.t2 = self.t3 = 0.0
+            self.acc = self.dec = 0.0
+        else:
+            self.vp = min(vel, np.sqrt(2*L*acc*dec/(acc + dec)))
+            self.acc, self.dec = acc, dec
+            self.t1 = self.vp/acc
+            self.t3 = self.vp/dec
+            self.t2 = max(L - self.vp*self.t1/2 - self.vp*self.t3/2, 0.0)/self.vp
+        self.T = self.t1 + self.t2 + self.t3
+        self.tj = max(acc, dec)/jerk if jerk > 0 and self.T > 0 else 0.0
+        self.duration = self.T + self.tj
+        # Breakpoints of position and its time integral
+        self._s1 = self.vp*self.t1/2
+        self._s2 = self._s1 + self.vp*self.t2
+        self._P1 = self.acc*self.t1**3/6
+        self._P2 = self._P1 + self._s1*self.t2 + self.vp*self.t2**2/2
+        self._P3 = (self._P2 + self._s2*self.t3 + self.vp*self.t3**2/2
+                    - self.dec*self.t3**3/6)
+
+    def _phases(self, t):
+        t = np.asarray(t, dtype=float)
+        return t, t - self.t1, t - self.t1 - self.t2
+
+    def _trap_pos(self, t):
+        t, u2, u3 = self._phases(t)
+        return np.select([t <= 0, t < self.t1, u2 < self.t2, u3 < self.t3],
+                         [0.0, self.acc*t**2/2, self._s1 + self.vp*u2,
+                          self._s2 + self.vp*u3 - self.dec*u3**2/2],
+                         self.length)
+
+    def _trap_int(self, t):
+        t, u2, u3 = self._phases(t)
+        return np.select([t <= 0, t < self.t1, u2 < self.t2, u3 < self.t3],
+                         [0.0, self.acc*t**3/6,
+                          self._P1 + self._s1*u2 + self.vp*u2**2/2,
+                          self._P2 + self._s2*u3 + self.vp*u3**2/2 - self.dec*u3**3/6],
+                         self._P3 + self.length*(t - self.T))
+
+    def _trap_vel(self, t):
+        t, u2, u3 = self._phases(t)
+        return np.select([t <= 0, t < self.t1, u2 < self.t2, u3 < self.t3],
+                         [0.0, self.acc*t, self.vp, self.vp - self.dec*u3], 0.0)
+
+    def position(self, t):
+        if self.tj == 0:
+            return self._trap_pos(t)
+        return (self._trap_int(t) - self._trap_int(np.asarray(t) - self.tj))/self.tj
+
+    def velocity(self, t):
+        if self.tj == 0:
+            return self._trap_vel(t)
+        return (self._trap_pos(t) - self._trap_pos(np.asarray(t) - self.tj))/self.tj
+
+    def acceleration(self, t, dt=1e-4):
+        return (self.velocity(np.asarray(t) + dt) - self.velocity(np.asarray(t) - dt))/(2*dt)
+
+
+class _LinePath(object):
+    """Straight line in the space of the motion axes."""
+    def __init__(self, start, end):
+        self.start = np.asarray(start, dtype=float)
+        self.end = np.asarray(end, dtype=float)
+        self.length = float(np.linalg.norm(self.end - self.start))
+        self._dir = (self.end - self.start)/self.length if self.length else 0*self.start
+
+    def position(self, s):
+        s = np.asarray(s, dtype=float)
+        return self.start[:, None] + self._dir[:, None]*np.atleast_1d(s)[None, :]
+
+    def tangent(self, s):
+        return np.repeat(self._dir[:, None], np.atleast_1d(s).size, axis=1)
+
+
+class _ArcPath(object):
+    """Arc in the plane of the first two motion axes around `center`,
+    secondary axes move linearly to `final` (or stay)."""
+    def __init__(self, start, center, angle, final=None):
+        self.start = np.asarray(start, dtype=float)
+        self.center = np.asarray(center[:2], dtype=float)
+        self.angle = float(angle)
+        rel = self.start[:2] - self.center
+        self.radius = float(np.hypot(*rel))
+        self.phi0 = float(np.arctan2(rel[1], rel[0]))
+        self.end_secondary = (self.start[2:] if final is None
+                              else np.asarray(final, dtype=float)[2:len(self.start)])
+        self.length = float(np.hypot(self.radius*abs(self.angle),
+                                     np.linalg.norm(self.end_secondary - self.start[2:])))
+
+    def _k(self, s):
+        return np.atleast_1d(np.asarray(s, dtype=float))/self.length if self.length else 0*np.atleast_1d(s)
+
+    def position(self, s):
+        k = self._k(s)
+        phi = self.phi0 + self.angle*k
+        out = np.empty((self.start.size, k.size))
+        out[0] = self.center[0] + self.radius*np.cos(phi)
+        out[1] = self.center[1] + self.radius*np.sin(phi)
+        out[2:] = self.start[2:, None] + (self.end_secondary - self.start[2:])[:, None]*k[None, :]
+        return out
+
+    def tangent(self, s):
+        k = self._k(s)
+        phi = self.phi0 + self.angle*k
+        out = np.empty((self.start.size, k.size))
+        scale = self.radius*self.angle/self.length if self.length else 0.0
+        out[0] = -scale*np.sin(phi)
+        out[1] = scale*np.cos(phi)
+        out[2:] = ((self.end_secondary - self.start[2:])/self.length if self.length else 0.0)[:, None]
+        return out
+
+
+class _SegmentedPath(object):
+    """Chain of line/arc segments starting at `start`."""
+    def __init__(self, start):
+        self.start = np.asarray(start, dtype=float)
+        self.segments = []
+        self.bounds = [0.0]
+
+    @property
+    def end(self):
+        if not self.segments:
+            return self.start
+        return self.segments[-1].position(self.segments[-1].length)[:, 0]
+
+    @property
+    def length(self):
+        return self.bounds[-1]
+
+    def add(self, segment):
+        if segment.length > 0:
+            self.segments.append(segment)
+            self.bounds.append(self.bounds[-1] + segment.length)
+
+    def _eval(self, s, what):
+        s = np.atleast_1d(np.asarray(s, dtype=float))
+        if not self.segments:
+            return self.start[:, None].repeat(s.size, axis=1) if what == "position" else 0*self.start[:, None].repeat(s.size, axis=1)
+        idx = np.clip(np.searchsorted(self.bounds, s, side="right") - 1, 0, len(self.segments) - 1)
+        out = np.empty((self.start.size, s.size))
+        for i in np.unique(idx):
+            sel = idx == i
+            out[:, sel] = getattr(self.segments[i], what)(s[sel] - self.bounds[i])
+        return out
+
+    def position(self, s):
+        return self._eval(s, "position")
+
+    def tangent(self, s):
+        return self._eval(s, "tangent")
+
+
+class _Motion(object):
+    """One (possibly multi-axis) motion along `path` started at `t0`."""
+    def __init__(self, axes, path, profile, t0, segmented=False):
+        self.axes = list(axes)
+        self.path = path
+        self.profile = profile
+        self.t0 = t0
+        self.t_end = t0 + profile.duration
+        self.segmented = segmented
+
+    def positions(self, t):
+        return self.path.position(self.profile.position(np.asarray(t) - self.t0))
+
+    def velocities(self, t):
+        u = np.asarray(t) - self.t0
+        return self.path.tangent(self.profile.position(u))*np.atleast_1d(self.profile.velocity(u))[None, :]
+
+    def accelerating(self, t):
+        return abs(float(self.profile.acceleration(t - self.t0))) > 1e-9
+
+    @property
+    def end(self):
+        return self.path.position(self.path.length)[:, 0]
+
+
+class _Axis(object):
+    """Per-axis parameters and motion history: a list of (t_start, motion, rest)."""
+    def __init__(self, number):
+        self.number = number
+        self.enabled = False
+        self.params = dict(DEFAULT_PARAMS)
+        self.track = [(-np.inf, None, 0.0)]
+        self.limits = (-np.inf, np.inf)
+        self.fault = 0
+        self.pending = None  # motion prepared with AMF_WAIT
+        self.peg = None      # incremental PEG configuration and fired pulse times
+
+    def _entry(self, t):
+        i = bisect.bisect_right([e[0] for e in self.track], t) - 1
+        return self.track[max(i, 0)]
+
+    def position(self, t):
+        t0, motion, rest = self._entry(t)
+        if motion is None:
+            return rest
+        return float(motion.positions(min(t, motion.t_end))[motion.axes.index(self.number), 0])
+
+    def velocity(self, t):
+        t0, motion, rest = self._entry(t)
+        if motion is None or t >= motion.t_end:
+            return 0.0
+        return float(motion.velocities(t)[motion.axes.index(self.number), 0])
+
+    def positions(self, times):
+        """Vectorised position history for DC uploads."""
+        times = np.asarray(times, dtype=float)
+        starts = np.array([e[0] for e in self.track])
+        idx = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, None)
+        out = np.empty(times.size)
+        for i in np.unique(idx):
+            sel = idx == i
+            t0, motion, rest = self.track[i]
+            if motion is None:
+                out[sel] = rest
+            else:
+                out[sel] = motion.positions(np.minimum(times[sel], motion.t_end))[motion.axes.index(self.number)]
+        return out
+
+    def velocities(self, times):
+        times = np.asarray(times, dtype=float)
+        starts = np.array([e[0] for e in self.track])
+        idx = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, None)
+        out = np.zeros(times.size)
+        for i in np.unique(idx):
+            sel = idx == i
+            t0, motion, rest = self.track[i]
+            if motion is not None:
+                v = motion.velocities(times[sel])[motion.axes.index(self.number)]
+                out[sel] = np.where(times[sel] < motion.t_end, v, 0.0)
+        return out
+
+    def motion_at(self, t):
+        t0, motion, rest = self._entry(t)
+        if motion is not None and t < motion.t_end:
+            return motion
+        return None
+
+    def last_end(self):
+        """Time and position at which the last queued motion ends."""
+        t0, motion, rest = self.track[-1]
+        if motion is None:
+            return t0, rest
+        return motion.t_end, float(motion.end[motion.axes.index(self.number)])
+
+    def stop(self, t):
+        """Stops the axis where it is at time t, dropping queued motions."""
+        pos = self.position(t)
+        self.track = [e for e in self.track if e[0] <= t]
+        self.track.append((t, None, pos))
+        del self.track[:-256]
+
+    def start(self, motion):
+        self.track.append((motion.t0, motion, None))
+        del self.track[:-256]
+
+
+class _SimFunction(object):
+    """Callable standing in for a ctypes function pointer: accepts (and
+    ignores) argtypes/restype and serialises access to the simulator.
+    A call with an ACSC_WAITBLOCK as its last argument is asynchronous: it
+    is executed at once, its result goes to the block's Ret and the round
+    trip is paid by acsc_WaitForAsyncCall (see SimulatedLibrary._issue)."""
+    def __init__(self, name, impl, lock, clock, blocking=False, issue=None):
+        self.__name__ = name
+        self.impl = impl
+        self.lock = lock
+        self.clock = clock
+        self.blocking = blocking
+        self.issue = issue
+        self.argtypes = None
+        self.restype = None
+
+    def __call__(self, *args):
+        if self.blocking:
+            return self.impl(*args)
+        wait = _wait_block(args[-1]) if args else None
+        with self.lock:
+            if wait is None:
+                self.clock.tick()
+                return self.impl(*args)
+            wait.Ret = self.impl(*args)
+            self.issue(wait)
+            return 1
+
+
+def _wait_block(arg):
+    """ACSC_WAITBLOCK passed by byref()/pointer() as the wait argument, else None."""
+    arg = getattr(arg, "_obj", arg)
+    if hasattr(arg, "contents"):
+        arg = arg.contents
+    return arg if hasattr(arg, "Ret") else None
+
+
+def _value(arg):
+    """Python value of a ctypes argument (c_double, byref(...), plain number)."""
+    if hasattr(arg, "_obj"):
+        arg = arg._obj
+    if hasattr(arg, "value"):
+        return arg.value
+    return arg
+
+
+def _store(ptr, values):
+    """Writes output values through byref()/pointer()/array arguments."""
+    if hasattr(ptr, "_obj"):
+        ptr._obj.value = values
+        return
+    values = np.ravel(values)
+    for i, v in enumerate(values):
+        ptr[i] = v
+
+
+def _int_list(arr):
+    """Axis list from a -1 terminated C int array (or a plain sequence)."""
+    out = []
+    for a in arr:
+        if a == -1:
+            break
+        out.append(int(a))
+    return out
+
+
+def _text(arg):
+    arg = _value(arg)
+    if isinstance(arg, bytes):
+        return arg.decode()
+    return arg
+
+
+class SimulatedLibrary(object):
+    """In-process simulated SPiiPlus controller with the acsc_* call surface."""
+
+    _BLOCKING = ("WaitMotionEnd", "WaitCollectEnd", "WaitForAsyncCall")
+
+    def __init__(self, n_axes=N_AXES, clock=None):
+        self.clock = clock if clock is not None else SimClock()
+        self.lock = threading.RLock()
+        self.axes = [_Axis(n) for n in range(n_axes)]
+        self.variables = {}
+        self.outputs = {}
+        self.last_error = 0
+        self.sequences = {}  # Segmented motions being defined, by tuple of axes
+        self.dc = None
+        self._handles = 0
+        self._functions = {}
+        self._pending = set()   # ACSC_WAITBLOCKs (by id) of asynchronous calls not yet waited for
+        self._batch = False     # Asynchronous calls issued since the last round trip
+        self.callbacks = {}     # interrupt -> [callback, context, mask]
+        self._faults = 0        # Axes with FAULT bits at the last interrupt check
+        self._interrupt_thread = None
+
+    def __getattr__(self, name):
+        if not name.startswith("acsc_"):
+            raise AttributeError(name)
+        fn = self._functions.get(name)
+        if fn is None:
+            impl = getattr(self, "_" + name[5:], None)
+            if impl is None:
+                impl = self._unsupported
+            fn = _SimFunction(name, impl, self.lock, self.clock,
+                              blocking=name[5:] in self._BLOCKING,
+                              issue=self._issue)
+            self._functions[name] = fn
+        return fn
+
+    # --- helpers used by tests, benchmarks and other simulators ---
+
+    def now(self):
+        return self.clock.now()
+
+    def axis_positions(self, axes, t=None):
+        """Feedback positions of `axes` at time t (default: now); an array of
+        times gives an array of shape (len(axes), len(t))."""
+        t = self.clock.now() if t is None else t
+        with self.lock:
+            if np.ndim(t):
+                return np.array([self.axes[a].positions(t) for a in axes])
+            return np.array([self.axes[a].position(t) for a in axes])
+
+    def axis_velocities(self, axes, t=None):
+        t = self.clock.now() if t is None else t
+        with self.lock:
+            if np.ndim(t):
+                return np.array([self.axes[a].velocities(t) for a in axes])
+            return np.array([self.axes[a].velocity(t) for a in axes])
+
+    def peg_pulses(self, axis, t=None):
+        """Times of the PEG pulses fired by `axis` up to time t (default: now)."""
+        t = self.clock.now() if t is None else t
+        with self.lock:
+            peg = self.axes[axis].peg
+            if peg is None:
+                return np.empty(0)
+            self._fill_peg(self.axes[axis], t)
+            times = np.array(peg["times"])
+        return times[times <= t]
+
+    def set_limits(self, axis, left=-np.inf, right=np.inf):
+        """Configures limit switches: the axis stops and FAULT is set beyond them."""
+        self.axes[axis].limits = (left, right)
+
+    def _error(self, code):
+        self.last_error = code
+        return 0
+
+    def _unsupported(self, *args):
+        return 1
+
+    def _check_limits(self, t):
+        for ax in self.axes:
+            left, right = ax.limits
+            pos = ax.position(t)
+            fault = (SAFETY_RL if pos >= right else 0) | (SAFETY_LL if pos <= left else 0)
+            if fault and not ax.fault:
+                motion = ax.motion_at(t)
+                for a in (motion.axes if motion else [ax.number]):
+                    self.axes[a].stop(t)
+            ax.fault = fault
+
+    # --- communication ---
+
+    def _OpenCommDirect(self):
+        self._handles += 1
+        return self._handles
+
+    def _OpenCommEthernetTCP(self, address, port):
+        self._handles += 1
+        return self._handles
+
+    def _CloseComm(self, hcomm):
+        return 1
+
+    def _GetLastError(self):
+        return self.last_error
+
+    # --- interrupts ---
+
+    def _SetCallbackExt(self, hcomm, callback, context, interrupt):
+        """Registers callback(mask, context) for `interrupt`; a NULL callback
+        removes it. Callbacks run in the simulator's interrupt thread."""
+        interrupt = int(_value(interrupt))
+        if callback is None:
+            self.callbacks.pop(interrupt, None)
+            return 1
+        self.callbacks[interrupt] = [callback, _value(context), ~0]
+        if self._interrupt_thread is None:
+            self._interrupt_thread = threading.Thread(target=self._interrupt_loop,
+                                                      name="acsc-sim-interrupts", daemon=True)
+            self._interrupt_thread.start()
+        return 1
+
+    def _SetCallbackMask(self, hcomm, interrupt, mask):
+        entry = self.callbacks.get(int(_value(interrupt)))
+        if entry is None:
+            return self._error(ERR_BAD_ARGUMENT)
+        entry[2] = int(_value(mask))
+        return 1
+
+    def _interrupts(self, t0, t):
+        """(interrupt, axis mask) pairs raised in (t0, t]: motion ends - also
+        stops by halt/kill/limit - and new FAULT bits."""
+        self._check_limits(t)
+        ended = 0
+        for ax in self.axes:
+            if t0 < ax.last_end()[0] <= t:
+                ended |= 1 << ax.number
+        faults = 0
+        for ax in self.axes:
+            faults |= (1 << ax.number) if ax.fault else 0
+        failed = faults & ~self._faults
+        self._faults = faults
+        return [(INTR_PHYSICAL_MOTION_END, ended), (INTR_LOGICAL_MOTION_END, ended),
+                (INTR_MOTION_FAILURE, failed), (INTR_MOTOR_FAILURE, failed)]
+
+    def _interrupt_loop(self):
+        with self.lock:
+            t_prev = self.clock.now()
+        while True:
+            time.sleep(INTERRUPT_PERIOD)
+            with self.lock:
+                if not self.callbacks:
+                    self._interrupt_thread = None
+                    return
+                t = self.clock.now()
+                events = self._interrupts(t_prev, t)
+                t_prev = t
+                callbacks = dict(self.callbacks)
+            for interrupt, mask in events:   # Outside the lock: callbacks may call the library
+                entry = callbacks.get(interrupt)
+                if entry is not None and mask & entry[2]:
+                    entry[0](mask & entry[2], entry[1])
+
+    # --- asynchronous calls ---
+
+    def _issue(self, wait):
+        self._pending.add(id(wait))
+        self._batch = True
+
+    def _WaitForAsyncCall(self, hcomm, buf, received, wait, timeout=None):
+        """Completes an asynchronous call. All calls issued before the first
+        wait share one round trip (one call_cost), as pipelined requests do
+        on the real controller."""
+        wait = _wait_block(wait)
+        with self.lock:
+            if wait is None or id(wait) not in self._pending:
+                return self._error(ERR_BAD_ARGUMENT)
+            if self._batch:
+                self.clock.tick()
+                self._batch = False
+            self._pending.discard(id(wait))
+            return 1
+
+    def _CancelOperation(self, hcomm, wait):
+        wait = _wait_block(wait)
+        with self.lock:
+            if wait is not None:
+                self._pending.discard(id(wait))
+            return 1
+
+    # --- motion parameters ---
+
+    def _set_param(self, name, axis, value):
+        self.axes[int(_value(axis))].params[name] = float(_value(value))
+        return 1
+
+    def _SetVelocity(self, hcomm, axis, vel, wait=None):
+        return self._set_param("VEL", axis, vel)
+
+    def _SetAcceleration(self, hcomm, axis, acc, wait=None):
+        return self._set_param("ACC", axis, acc)
+
+    def _SetDeceleration(self, hcomm, axis, dec, wait=None):
+        return self._set_param("DEC", axis, dec)
+
+    def _SetKillDeceleration(self, hcomm, axis, kdec, wait=None):
+        return self._set_param("KDEC", axis, kdec)
+
+    def _SetJerk(self, hcomm, axis, jerk, wait=None):
+        return self._set_param("JERK", axis, jerk)
+
+    def _get_param(self, name, axis, out):
+        _store(out, self.axes[int(_value(axis))].params[name])
+        return 1
+
+    def _GetVelocity(self, hcomm, axis, out, wait=None):
+        return self._get_param("VEL", axis, out)
+
+    def _GetAcceleration(self, hcomm, axis, out, wait=None):
+        return self._get_param("ACC", axis, out)
+
+    def _GetDeceleration(self, hcomm, axis, out, wait=None):
+        return self._get_param("DEC", axis, out)
+
+    # --- state ---
+
+    def _Enable(self, hcomm, axis, wait=None):
+        self.axes[int(_value(axis))].enabled = True
+        return 1
+
+    def _Disable(self, hcomm, axis, wait=None):
+        ax = self.axes[int(_value(axis))]
+        ax.stop(self.clock.now())
+        ax.enabled = False
+        return 1
+
+    def _mst(self, axis, t):
+        ax = self.axes[axis]
+        motion = ax.motion_at(t)
+        state = MST_ENABLE if ax.enabled else 0
+        if motion is None:
+            state |= MST_INPOS
+        else:
+            state |= MST_MOVE | (MST_ACC if motion.accelerating(t) else 0)
+        return state
+
+    def _ast(self, axis, t):
+        motion = self.axes[axis].motion_at(t)
+        state = 0
+        if motion is not None:
+            state |= AST_MOVE | (AST_ACC if motion.accelerating(t) else 0)
+            state |= AST_LEAD if motion.axes[0] == axis else 0
+            state |= AST_SEGMENT if motion.segmented else 0
+        if self.dc is not None and t < self.dc["t_end"] and axis in self.dc["axes"]:
+            state |= AST_DC
+        peg = self.axes[axis].peg
+        if peg is not None:
+            self._fill_peg(self.axes[axis], t)
+            if len(peg["times"]) < peg["n"] and peg["t_stop"] is None:
+                state |= AST_PEGREADY
+                state |= AST_PEG if peg["t_start"] is not None else 0
+        return state
+
+    def _GetMotorState(self, hcomm, axis, out, wait=None):
+        t = self.clock.now()
+        self._check_limits(t)
+        _store(out, self._mst(int(_value(axis)), t))
+        return 1
+
+    def _GetAxisState(self, hcomm, axis, out, wait=None):
+        t = self.clock.now()
+        self._check_limits(t)
+        _store(out, self._ast(int(_value(axis)), t))
+        return 1
+
+    def _GetFault(self, hcomm, axis, out, wait=None):
+        self._check_limits(self.clock.now())
+        _store(out, self.axes[int(_value(axis))].fault)
+        return 1
+
+    def _GetFPosition(self, hcomm, axis, out, wait=None):
+        t = self.clock.now()
+        self._check_limits(t)
+        _store(out, self.axes[int(_value(axis))].position(t))
+        return 1
+
+    _GetRPosition = _GetFPosition
+
+    def _GetFVelocity(self, hcomm, axis, out, wait=None):
+        _store(out, self.axes[int(_value(axis))].velocity(self.clock.now()))
+        return 1
+
+    _GetRVelocity = _GetFVelocity
+
+    def _SetFPosition(self, hcomm, axis, pos, wait=None):
+        ax = self.axes[int(_value(axis))]
+        ax.stop(self.clock.now())
+        ax.track[-1] = (ax.track[-1][0], None, float(_value(pos)))
+        return 1
+
+    _SetRPosition = _SetFPosition
+
+    # --- point-to-point motion ---
+
+    def _start_motion(self, axes, target, flags, path_factory=None):
+        flags = _value(flags) or 0
+        if not all(self.axes[a].enabled for a in axes):
+            return self._error(ERR_DISABLED)
+        t = self.clock.now()
+        ends = [self.axes[a].last_end() for a in axes]
+        t0 = max([t] + [e[0] for e in ends])  # Motion queue: start after the current motion
+        start = np.array([e[1] for e in ends])
+        target = np.asarray(target, dtype=float)
+        if flags & AMF_RELATIVE:
+            target = start + target
+        leader = self.axes[axes[0]].params
+        path = _LinePath(start, target)
+        profile = _Profile(path.length, leader["VEL"], leader["ACC"], leader["DEC"], leader["JERK"])
+        motion = _Motion(axes, path, profile, t0)
+        if flags & AMF_WAIT:
+            for a in axes:
+                self.axes[a].pending = motion
+            return 1
+        for a in axes:
+            self.axes[a].start(motion)
+        return 1
+
+    def _ToPoint(self, hcomm, flags, axis, target, wait=None):
+        return self._start_motion([int(_value(axis))], [_value(target)], flags)
+
+    def _ToPointM(self, hcomm, flags, axes, target, wait=None):
+        axes = _int_list(axes)
+        return self._start_motion(axes, [target[i] for i in range(len(axes))], flags)
+
+    def _go(self, axes):
+        started = set()
+        for a in axes:
+            motion = self.axes[a].pending
+            if motion is None or id(motion) in started:
+                continue
+            shift = max(self.clock.now() - motion.t0, 0.0)
+            motion.t0 += shift
+            motion.t_end += shift
+            for b in motion.axes:
+                self.axes[b].pending = None
+                self.axes[b].start(motion)
+            started.add(id(motion))
+        return 1
+
+    def _Go(self, hcomm, axis, wait=None):
+        return self._go([int(_value(axis))])
+
+    def _GoM(self, hcomm, axes, wait=None):
+        return self._go(_int_list(axes))
+
+    def _Halt(self, hcomm, axis, wait=None):
+        t = self.clock.now()
+        motion = self.axes[int(_value(axis))].motion_at(t)
+        for a in (motion.axes if motion else [int(_value(axis))]):
+            self.axes[a].stop(t)
+        return 1
+
+    _Kill = _Halt
+
+    def _HaltM(self, hcomm, axes, wait=None):
+        for a in _int_list(axes):
+            self._Halt(hcomm, a)
+        return 1
+
+    _KillM = _HaltM
+
+    def _KillAll(self, hcomm, wait=None):
+        t = self.clock.now()
+        for ax in self.axes:
+            ax.stop(t)
+            ax.pending = None
+        self.sequences = {}
+        return 1
+
+    def _WaitMotionEnd(self, hcomm, axis, timeout):
+        deadline = self.clock.now() + float(_value(timeout))/1000.0
+        while True:
+            with self.lock:
+                self.clock.tick()
+                t = self.clock.now()
+                self._check_limits(t)
+                t_end = self.axes[int(_value(axis))].last_end()[0]
+            if t >= t_end:
+                return 1
+            if t >= deadline:
+                return 0
+            if self.clock.realtime:
+                self.clock.sleep(min(t_end, deadline) - t if t_end - t < 0.01 else 0.01)
+            else:
+                self.clock.sleep(min(t_end, deadline) - t)
+
+    # --- segmented motion ---
+
+    def _sequence(self, axes):
+        return self.sequences.get(tuple(_int_list(axes)))
+
+    def _ExtendedSegmentedMotionV2(self, hcomm, flags, axes, point, vel, *rest):
+        axes = _int_list(axes)
+        if not all(self.axes[a].enabled for a in axes):
+            return self._error(ERR_DISABLED)
+        current = np.array([self.axes[a].last_end()[1] for a in axes])
+        path = _SegmentedPath(current)
+        start = np.array([point[i] for i in range(len(axes))], dtype=float)
+        path.add(_LinePath(current, start))
+        flags = _value(flags) or 0
+        vel = _value(vel)
+        if not (flags & AMF_VELOCITY) or vel is None or vel <= 0:
+            vel = self.axes[axes[0]].params["VEL"]
+        self.sequences[tuple(axes)] = {"axes": axes, "path": path, "vel": vel, "flags": flags}
+        return 1
+
+    def _SegmentLineV2(self, hcomm, flags, axes, point, *rest):
+        seg = self._sequence(axes)
+        if seg is None:
+            return self._error(ERR_BAD_ARGUMENT)
+        path = seg["path"]
+        end = np.array([point[i] for i in range(path.start.size)], dtype=float)
+        path.add(_LinePath(path.end, end))
+        return 1
+
+    def _SegmentArc2V2(self, hcomm, flags, axes, center, angle, final_point, *rest):
+        seg = self._sequence(axes)
+        if seg is None:
+            return self._error(ERR_BAD_ARGUMENT)
+        path = seg["path"]
+        final = None
+        if final_point is not None:
+            final = [final_point[i] for i in range(path.start.size)]
+        path.add(_ArcPath(path.end, [center[0], center[1]], _value(angle), final))
+        return 1
+
+    def _EndSequenceM(self, hcomm, axes, wait=None):
+        seg = self.sequences.pop(tuple(_int_list(axes)), None)
+        if seg is None:
+            return self._error(ERR_BAD_ARGUMENT)
+        axes = seg["axes"]
+        t0 = max([self.clock.now()] + [self.axes[a].last_end()[0] for a in axes])
+        leader = self.axes[axes[0]].params
+        profile = _Profile(seg["path"].length, seg["vel"], leader["ACC"],
+                           leader["DEC"], leader["JERK"])
+        motion = _Motion(axes, seg["path"], profile, t0, segmented=True)
+        if seg["flags"] & AMF_WAIT:  # Started by GoM together with other sequences
+            for a in axes:
+                self.axes[a].pending = motion
+            return 1
+        for a in axes:
+            self.axes[a].start(motion)
+        return 1
+
+    _EndSequence = _EndSequenceM
+
+    # --- variables ---
+
+    _STANDARD = ("FPOS", "RPOS", "FVEL", "RVEL", "VEL", "ACC", "DEC", "KDEC",
+                 "JERK", "MST", "AST", "FAULT", "TIME")
+
+    def _standard(self, name, t):
+        if name in ("FPOS", "RPOS"):
+            return np.array([ax.position(t) for ax in self.axes])
+        if name in ("FVEL", "RVEL"):
+            return np.array([ax.velocity(t) for ax in self.axes])
+        if name in ("VEL", "ACC", "DEC", "KDEC", "JERK"):
+            return np.array([ax.params[name] for ax in self.axes])
+        if name == "MST":
+            return np.array([self._mst(a, t) for a in range(len(self.axes))])
+        if name == "AST":
+            return np.array([self._ast(a, t) for a in range(len(self.axes))])
+        if name == "FAULT":
+            return np.array([ax.fault for ax in self.axes])
+        if name == "TIME":
+            return np.array(1000.0*t + 1.0)  # ms, never zero
+
+    def _variable(self, name):
+        t = self.clock.now()
+        self._check_limits(t)
+        if name in self._STANDARD:
+            return self._standard(name, t)
+        if self.dc is not None and name == self.dc["array"]:
+            self._fill_dc(t)
+        return self.variables.get(name)
+
+    @staticmethod
+    def _select(value, from1, to1, from2, to2):
+        value = np.asarray(value)
+        if from1 == NONE:
+            return value
+        if from2 == NONE:
+            return value[from1:to1 + 1] if value.ndim == 1 else value[from1:to1 + 1, 0]
+        return value[from1:to1 + 1, from2:to2 + 1]
+
+    def _read(self, buffno, varname, from1, to1, from2, to2, out):
+        value = self._variable(_text(varname))
+        if value is None:
+            return self._error(ERR_UNKNOWN_VARIABLE)
+        ranges = [NONE if r is None else int(_value(r)) for r in (from1, to1, from2, to2)]
+        _store(out, self._select(value, *ranges))
+        return 1
+
+    def _ReadReal(self, hcomm, buffno, varname, from1, to1, from2, to2, out, wait=None):
+        return self._read(buffno, varname, from1, to1, from2, to2, out)
+
+    def _ReadInteger(self, hcomm, buffno, varname, from1, to1, from2, to2, out, wait=None):
+        return self._read(buffno, varname, from1, to1, from2, to2, out)
+
+    def _write(self, varname, from1, to1, from2, to2, ptr):
+        name = _text(varname)
+        if name in ("VEL", "ACC", "DEC", "KDEC", "JERK") and from1 != NONE:
+            values = np.ctypeslib.as_array(ptr, shape=(to1 - from1 + 1,))
+            for a, v in zip(range(from1, to1 + 1), values):
+                self.axes[a].params[name] = float(v)
+            return 1
+        value = self.variables.get(name)
+        if value is None:
+            return self._error(ERR_UNKNOWN_VARIABLE)
+        if from1 == NONE:
+            view = value.reshape(-1)[:1]
+        elif from2 == NONE:
+            view = value[from1:to1 + 1] if value.ndim == 1 else value[from1:to1 + 1, 0]
+        else:
+            view = value[from1:to1 + 1, from2:to2 + 1]
+        view[...] = np.ctypeslib.as_array(ptr, shape=(view.size,)).reshape(view.shape)
+        return 1
+
+    def _WriteReal(self, hcomm, buffno, varname, from1, to1, from2, to2, ptr, wait=None):
+        ranges = [NONE if r is None else int(_value(r)) for r in (from1, to1, from2, to2)]
+        return self._write(varname, *(ranges + [ptr]))
+
+    _WriteInteger = _WriteReal
+
+    def _DeclareVariable(self, hcomm, vartype, name, wait=None):
+        match = re.match(r"\s*(\w+)\s*((?:\(\s*\d+\s*\))*)", _text(name))
+        if match is None:
+            return self._error(ERR_BAD_ARGUMENT)
+        shape = tuple(int(d) for d in re.findall(r"\d+", match.group(2)))
+        dtype = np.float64 if _value(vartype) == 2 else np.int32
+        current = self.variables.get(match.group(1))
+        if current is None or current.shape != shape:
+            self.variables[match.group(1)] = np.zeros(shape, dtype=dtype)
+        return 1
+
+    # --- data collection ---
+
+    def _DataCollectionExt(self, hcomm, flags, axis, array, nsample, period, variables, wait=None):
+        name = _text(array)
+        if name not in self.variables:
+            return self._error(ERR_UNKNOWN_VARIABLE)
+        names = [v for v in _text(variables).split("\r") if v]
+        sources = []
+        for v in names:
+            match = re.match(r"(\w+)(?:\((\d+)\))?$", v.strip())
+            if match is None or match.group(1) not in self._STANDARD:
+                return self._error(ERR_UNKNOWN_VARIABLE)
+            sources.append((match.group(1), int(match.group(2) or 0)))
+        period = float(_value(period))/1000.0
+        nsample = int(_value(nsample))
+        t0 = self.clock.now()
+        self.dc = {"array": name, "sources": sources, "t0": t0, "period": period,
+                   "nsample": nsample, "t_end": t0 + nsample*period, "filled": 0,
+                   "axes": {a for n, a in sources if n != "TIME"}}
+        return 1
+
+    _DataCollection = _DataCollectionExt
+
+    def _fill_dc(self, t):
+        dc = self.dc
+        n = min(int((min(t, dc["t_end"]) - dc["t0"])/dc["period"]) + 1, dc["nsample"])
+        if n <= dc["filled"]:
+            return
+        times = dc["t0"] + dc["period"]*np.arange(dc["filled"], n)
+        array = self.variables[dc["array"]]
+        for row, (name, axis) in enumerate(dc["sources"]):
+            if name == "TIME":
+                values = 1000.0*times + 1.0
+            elif name in ("FPOS", "RPOS"):
+                values = self.axes[axis].positions(times)
+            elif name in ("FVEL", "RVEL"):
+                values = self.axes[axis].velocities(times)
+            else:
+                values = self._standard(name, t)[axis]
+            array[row, dc["filled"]:n] = values
+        dc["filled"] = n
+
+    def _StopCollect(self, hcomm, wait=None):
+        if self.dc is not None:
+            t = self.clock.now()
+            self._fill_dc(t)
+            self.dc["t_end"] = min(self.dc["t_end"], t)
+        return 1
+
+    def _WaitCollectEnd(self, hcomm, timeout):
+        with self.lock:
+            if self.dc is None:
+                return 1
+            remaining = self.dc["t_end"] - self.clock.now()
+        if remaining > float(_value(timeout))/1000.0:
+            self.clock.sleep(float(_value(timeout))/1000.0)
+            return 0
+        self.clock.sleep(remaining)
+        with self.lock:
+            self._fill_dc(self.clock.now())
+        return 1
+
+    # --- PEG ---
+
+    def _AssignPegNT(self, hcomm, axis, eng_to_enc, gp_outs, wait=None):
+        return 1
+
+    def _AssignPegOutputsNT(self, hcomm, axis, output_index, bitcode, wait=None):
+        return 1
+
+    def _PegIncV2(self, hcomm, flags, axis, width, first, interval, last,
+                  tb_number=None, tb_period=None, wait=None):
+        first, interval, last = float(_value(first)), float(_value(interval)), float(_value(last))
+        if interval == 0 or (last - first)*interval < 0:
+            return self._error(ERR_BAD_ARGUMENT)
+        self.axes[int(_value(axis))].peg = {
+            "first": first, "interval": interval,
+            "n": int(np.floor((last - first)/interval + 1e-9)) + 1,
+            "t_start": None, "t_stop": None, "scanned": None, "times": []}
+        return 1
+
+    def _StartPegNT(self, hcomm, axis, wait=None):
+        peg = self.axes[int(_value(axis))].peg
+        if peg is None:
+            return self._error(ERR_BAD_ARGUMENT)
+        peg.update(t_start=self.clock.now(), t_stop=None, times=[])
+        peg["scanned"] = peg["t_start"]
+        return 1
+
+    def _StopPegNT(self, hcomm, axis, wait=None):
+        ax = self.axes[int(_value(axis))]
+        if ax.peg is not None and ax.peg["t_start"] is not None:
+            t = self.clock.now()
+            self._fill_peg(ax, t)
+            ax.peg["t_stop"] = t
+        return 1
+
+    def _WaitPegReadyNT(self, hcomm, axis, timeout):
+        return 1  # The configuration is loaded by PegIncV2 itself
+
+    def _fill_peg(self, ax, t):
+        """Fires the pulses whose positions the axis has passed by time t."""
+        peg = ax.peg
+        if peg["t_start"] is None:
+            return
+        if peg["t_stop"] is not None:
+            t = min(t, peg["t_stop"])
+        fired = len(peg["times"])
+        if t <= peg["scanned"] or fired >= peg["n"]:
+            return
+        grid = np.append(np.arange(peg["scanned"], t, PEG_RESOLUTION), t)
+        passed = np.floor((ax.positions(grid) - peg["first"])/peg["interval"]) + 1
+        count = np.maximum.accumulate(np.clip(passed, fired, peg["n"]))
+        idx = np.searchsorted(count, np.arange(fired + 1, int(count[-1]) + 1))
+        peg["times"].extend(grid[idx])
+        peg["scanned"] = t
+
+    # --- I/O ---
+
+    def _GetOutput(self, hcomm, port, bit, out, wait=None):
+        _store(out, self.outputs.get((int(_value(port)), int(_value(bit))), 0))
+        return 1
+
+    def _SetOutput(self, hcomm, port, bit, val, wait=None):
+        self.outputs[(int(_value(port)), int(_value(bit)))] = int(_value(val))
+        return 1
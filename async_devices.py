@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Async devices
+-------------
+asyncio-обёртки над newACS.newAcsController/acsAxis и Keithley2182A.
+Блокирующие вызовы ctypes/VISA каждого прибора выполняются в собственном
+однопоточном executor'е: вызовы к одному прибору идут строго по очереди,
+а к разным приборам - одновременно. Поэтому
+
+    t, pos, eds = await sample(controller, nano, axes)
+
+читает координаты и ЭДС параллельно (asyncio.gather), и период выборки
+определяется самым медленным прибором, а не суммой их задержек.
+"""
+from __future__ import division, print_function
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import acsc_modified as acsc
+import interrupts
+
+
+class DeviceExecutor(object):
+    """Однопоточный executor прибора: блокирующие вызовы в порядке поступления."""
+    def __init__(self, name):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    async def call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class AsyncController(object):
+    """Асинхронный фасад newAcsController. Оси - AsyncAxis в self.axes."""
+    def __init__(self, controller):
+        self.controller = controller
+        self.executor = DeviceExecutor("acs")
+        self.axes = [AsyncAxis(self, axis) for axis in controller.axes]
+
+    async def call(self, fn, *args):
+        """Любой блокирующий вызов acsc_modified в потоке контроллера."""
+        return await self.executor.call(fn, *args)
+
+    async def snapshot(self, axes=None):
+        return await self.call(self.controller.snapshot, axes)
+
+    async def positions(self, axes):
+        """FPOS осей одним чтением массива (оси min(axes)..max(axes))."""
+        lo, hi = min(axes), max(axes)
+        fpos = await self.call(acsc.readReal, self.controller.hc, acsc.NONE, "FPOS", lo, hi)
+        return np.atleast_1d(fpos)[np.asarray(axes) - lo]
+
+    async def to_point_m(self, flags, axes, target):
+        await self.call(acsc.toPointM, self.controller.hc, flags, tuple(axes), tuple(target))
+
+    async def wait_motion(self, axis, poll=0.05, timeout=None):
+        """Ждёт окончания движения оси, не блокируя цикл событий: прерыванием
+        (interrupts.attach), иначе - опросом состояния каждые poll с."""
+        intr = interrupts.get(self.controller.hc)
+        if intr is not None:
+            ended = intr.motion_end_future(axis)
+            try:
+                if await self.axes[axis].is_moving():
+                    await asyncio.wait_for(ended, timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Ось {axis} не остановилась за {timeout} с")
+            finally:
+                ended.cancel()
+            return
+        t_end = None if timeout is None else time.time() + timeout
+        while await self.axes[axis].is_moving():
+            if t_end is not None and time.time() > t_end:
+                raise TimeoutError(f"Ось {axis} не остановилась за {timeout} с")
+            await asyncio.sleep(poll)
+
+    async def kill_all(self):
+        await self.call(acsc.killAll, self.controller.hc)
+
+    def close(self):
+        """Останавливает поток контроллера (соединение остаётся открытым)."""
+        self.executor.shutdown()
+
+
+class AsyncAxis(object):
+    """Асинхронный фасад acsAxis; вызовы идут через executor контроллера."""
+    def __init__(self, controller, axis):
+        self.controller = controller
+        self.axis = axis
+        self.axisno = axis.axisno
+
+    async def get_pos(self):
+        return await self.controller.call(self.axis.get_pos)
+
+    async def get_velocity(self):
+        return await self.controller.call(self.axis.get_FVelosity)
+
+    async def motor_state(self):
+        return await self.controller.call(acsc.getMotorState, self.controller.controller.hc, self.axisno)
+
+    async def is_moving(self):
+        return (await self.motor_state())['moving']
+
+    async def set_speed(self, speed):
+        await self.controller.call(self.axis.set_speed, speed)
+
+    async def stop(self):
+        await self.controller.call(self.axis.stop)
+
+
+class AsyncKeithley(object):
+    """Асинхронный фасад Keithley2182A со своим потоком GPIB."""
+    def __init__(self, nano):
+        self.nano = nano
+        self.executor = DeviceExecutor("keithley")
+
+    async def get_voltage(self):
+        return await self.executor.call(self.nano.get_voltage)
+
+    async def start_buffer(self, *args):
+        await self.executor.call(self.nano.start_buffer, *args)
+
+    async def buffer_count(self):
+        return await self.executor.call(self.nano.buffer_count)
+
+    async def read_buffer(self):
+        return await self.executor.call(self.nano.read_buffer)
+
+    async def close(self):
+        await self.executor.call(self.nano.close)
+        self.executor.shutdown()
+
+
+async def sample(controller, nano, axes):
+    """Одна точка: координаты axes и ЭДС, прочитанные одновременно.
+    Время - середина интервала чтения (time.time())."""
+    t0 = time.time()
+    pos, eds = await asyncio.gather(controller.positions(axes), nano.get_voltage())
+    return (t0 + time.time())/2, pos, eds
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Emergency
+---------
+Аварийная остановка, не зависящая от цикла событий GUI и от потока скана.
+EmergencyWatchdog - поток со своим соединением с контроллером, который не
+занят ничем, кроме ожидания запроса остановки и опроса FAULT раз в period.
+Запрос - kill() из любого потока, датаграмма KILL на UDP-порт kill_port
+(127.0.0.1) или сигнал процесса (install_signal) - будит поток сразу, и
+killAll уходит не позже чем через один незаконченный вызов библиотеки
+(чтение FAULT) - задержка ограничена, что бы ни делали окно и скан.
+
+Там же отслеживаются концевики и отказы осей (faults.FaultMonitor - один
+запрос FAULT на все оси): новый бит концевика (faults.LIMIT_FAULTS)
+останавливает ось (halt), любой другой новый бит FAULT - все оси (killAll).
+Переходы FAULT получают и подписчики монитора (dog.faults.subscribe). Программная аварийная остановка библиотеки
+(registerEmergencyStop) регистрируется на время работы потока.
+
+    dog = EmergencyWatchdog(stand.ip, stand.port, axes=range(4), on_stop=print)
+    dog.start()
+    dog.kill("кнопка")                # из любого потока
+    dog.install_signal()              # из главного потока; kill -USR1 <pid>
+    # echo KILL | nc -u -w0 127.0.0.1 7010
+    dog.stop()
+"""
+from __future__ import division, print_function
+import collections
+import select
+import signal
+import socket
+import threading
+import time
+
+import numpy as np
+
+import acsc_modified as acsc
+import faults
+
+PERIOD = 0.01              # Период опроса FAULT, с (он же - наибольшее время сна потока)
+KILL_PORT = 7010           # UDP-порт запросов остановки на 127.0.0.1 (None - без порта)
+KILL_MESSAGE = b"KILL"
+KILL_SIGNAL = getattr(signal, "SIGUSR1", getattr(signal, "SIGBREAK", None))
+
+
+class EmergencyWatchdog(object):
+    """
+    Поток аварийной остановки осей axes контроллера address:port.
+    on_stop(причина, оси) вызывается в потоке сторожа после каждой остановки.
+    last_latency - время от последнего запроса до конца killAll, с.
+    """
+    def __init__(self, address, port, axes, period=PERIOD, kill_port=KILL_PORT, on_stop=None):
+        self.address = address
+        self.port = port
+        self.axes = list(axes)
+        self.period = period
+        self.kill_port = kill_port
+        self.on_stop = on_stop or (lambda reason, axes: None)
+        self.hc = None
+        self.last_latency = None
+        self._requests = collections.deque()        # (время запроса, причина)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)          # Так требует signal.set_wakeup_fd
+        self._udp = None
+        self._signum = None
+        self._previous = None       # (обработчик сигнала, wakeup fd) до install_signal
+        self.faults = faults.FaultMonitor(None, self.axes)      # Опрашивается потоком сторожа
+        self.faults.subscribe(self._on_faults)
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Открывает своё соединение с контроллером и запускает поток.
+        RuntimeError - соединение не открылось."""
+        self.hc = acsc.openCommEthernetTCP(self.address, self.port)
+        if self.hc == -1:
+            raise RuntimeError(f"Сторож: нет соединения с контроллером {self.address}:{self.port}")
+        if self.kill_port is not None:
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                udp.bind(("127.0.0.1", self.kill_port))
+                udp.setblocking(False)
+                self._udp = udp
+            except OSError as e:
+                print(f"Сторож: порт {self.kill_port} недоступен ({e}), остановка - без UDP")
+                udp.close()
+        acsc.registerEmergencyStop()
+        self.faults.hc = self.hc
+        self.faults.reset()
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, name="acs-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает поток и закрывает его соединение (после install_signal -
+        из главного потока)."""
+        self._running.clear()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        acsc.unregisterEmergencyStop()
+        self.remove_signal()
+        if self._udp is not None:
+            self._udp.close()
+            self._udp = None
+        if self.hc is not None:
+            acsc.closeComm(self.hc)
+            self.hc = None
+
+    def kill(self, reason="запрос"):
+        """Запрос остановки всех осей. Безопасен из любого потока и обработчика сигнала."""
+        self._requests.append((time.perf_counter(), reason))
+        self._wake()
+
+    def install_signal(self, signum=KILL_SIGNAL):
+        """Остановка по сигналу процесса signum (только из главного потока).
+        Номер сигнала пишет в сокет сторожа сам обработчик сигналов Python
+        (signal.set_wakeup_fd), поэтому поток просыпается сразу, даже когда
+        главный поток занят циклом событий Qt и не исполняет код Python."""
+        if signum is None or self._signum is not None:
+            return
+        handler = signal.signal(signum, lambda s, frame: None)    # Запрос принимает поток сторожа
+        fd = signal.set_wakeup_fd(self._wake_w.fileno(), warn_on_full_buffer=False)
+        self._signum, self._previous = signum, (handler, fd)
+
+    def remove_signal(self):
+        """Возвращает обработчик сигнала и wakeup fd, бывшие до install_signal."""
+        if self._signum is None:
+            return
+        handler, fd = self._previous
+        signal.set_wakeup_fd(fd)
+        signal.signal(self._signum, handler if handler is not None else signal.SIG_DFL)
+        self._signum = self._previous = None
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"!")
+        except OSError:        # Буфер пары сокетов полон - поток и так проснётся
+            pass
+
+    def _run(self):
+        sockets = [self._wake_r] + ([self._udp] if self._udp is not None else [])
+        while self._running.is_set():
+            readable, _, _ = select.select(sockets, [], [], self.period)
+            self._receive(readable)
+            if self._requests:
+                self._kill_all()
+            try:
+                self.faults.poll()
+            except Exception as e:          # Поток сторожа не должен умирать от ошибки чтения
+                print(f"Сторож: ошибка чтения FAULT: {e}")
+
+    def _receive(self, readable):
+        if self._wake_r in readable:
+            try:
+                data = self._wake_r.recv(4096)
+            except BlockingIOError:
+                data = b""
+            signum = self._signum
+            if signum is not None and signum in data:         # Байт с номером сигнала - от set_wakeup_fd
+                self._requests.append((time.perf_counter(), f"сигнал {signum}"))
+        if self._udp is not None and self._udp in readable:
+            while True:
+                try:
+                    data, address = self._udp.recvfrom(64)
+                except BlockingIOError:
+                    break
+                if data.strip().upper() == KILL_MESSAGE:
+                    self._requests.append((time.perf_counter(), f"UDP {address[0]}:{address[1]}"))
+
+    def _kill_all(self):
+        reasons, t_request = [], None
+        while self._requests:
+            t, reason = self._requests.popleft()
+            t_request = t if t_request is None else min(t_request, t)
+            reasons.append(reason)
+        acsc.killAll(self.hc)
+        self.last_latency = time.perf_counter() - t_request
+        self.on_stop("; ".join(reasons), list(self.axes))
+
+    def _on_faults(self, events):
+        raised = events[events["raised"] != 0]
+        if not raised.size:
+            return
+        axes = [int(a) for a in raised["axis"]]
+        if np.any(raised["raised"] & ~np.uint32(faults.LIMIT_FAULTS)):
+            acsc.killAll(self.hc)
+            self.on_stop(f"Отказ осей ({faults.describe(raised)})", axes)
+        else:
+            for axis in axes:
+                acsc.halt(self.hc, axis)
+            self.on_stop(f"Концевик ({faults.describe(raised)})", axes)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Faults
+------
+Слово FAULT осей - битовая маска отказов и концевиков. FaultMonitor читает
+FAULT всех осей одним запросом (readInteger массива FAULT), раскладывает все
+документированные биты сразу для всех осей операциями NumPy и сравнивает с
+прошлым опросом: подписчикам уходят только переходы (поднятые и снятые биты),
+а в кольцевой истории остаются время, ось, слово и переход.
+
+    monitor = FaultMonitor(hc, axes=range(4))
+    monitor.subscribe(lambda events: print(describe(events)))
+    monitor.poll()                        # один запрос на все оси
+    monitor.flags                         # (оси x биты) bool, столбцы - FAULT_NAMES
+    monitor.blocked(1)                    # концевик X1 - без запроса к контроллеру
+    monitor.history['raised']
+
+Опрашивает монитор тот, у кого есть свой поток (emergency.EmergencyWatchdog);
+остальные берут последнее слово (word) или подписываются на переходы.
+"""
+from __future__ import division, print_function
+import threading
+import time
+
+import numpy as np
+
+import acsc_modified as acsc
+from acquisition_buffer import AcquisitionBuffer
+
+# Биты FAULT (SAFETY) по документации ACS
+SAFETY_RL = 0x00000001        # Правый концевик
+SAFETY_LL = 0x00000002        # Левый концевик
+SAFETY_NETWORK = 0x00000004   # Ошибка сети EtherCAT
+SAFETY_HOT = 0x00000010       # Перегрев двигателя
+SAFETY_SRL = 0x00000020       # Правый программный предел
+SAFETY_SLL = 0x00000040       # Левый программный предел
+SAFETY_ENCNC = 0x00000080     # Энкодер не подключён
+SAFETY_ENC2NC = 0x00000100    # Второй энкодер не подключён
+SAFETY_DRIVE = 0x00000200     # Отказ привода
+SAFETY_ENC = 0x00000400       # Ошибка энкодера
+SAFETY_ENC2 = 0x00000800      # Ошибка второго энкодера
+SAFETY_PE = 0x00001000        # Ошибка положения
+SAFETY_CPE = 0x00002000       # Критическая ошибка положения
+SAFETY_VL = 0x00004000        # Предел скорости
+SAFETY_AL = 0x00008000        # Предел ускорения
+SAFETY_CL = 0x00010000        # Предел тока
+SAFETY_SP = 0x00020000        # Сервопроцессор
+SAFETY_TEMP = 0x01000000      # Перегрев MPU
+SAFETY_PROG = 0x02000000      # Ошибка программы
+SAFETY_MEM = 0x04000000       # Переполнение памяти
+SAFETY_TIME = 0x08000000      # Переполнение времени цикла
+SAFETY_ES = 0x10000000        # Аварийная остановка (вход ES)
+SAFETY_INT = 0x20000000       # Ошибка сервопрерывания
+SAFETY_INTGR = 0x40000000     # Ошибка целостности
+SAFETY_FAILURE = 0x80000000   # Прочие отказы
+
+FAULT_NAMES = ("RL", "LL", "NETWORK", "HOT", "SRL", "SLL", "ENCNC", "ENC2NC", "DRIVE",
+               "ENC", "ENC2", "PE", "CPE", "VL", "AL", "CL", "SP", "TEMP", "PROG", "MEM",
+               "TIME", "ES", "INT", "INTGR", "FAILURE")
+FAULT_MASKS = np.array([globals()["SAFETY_" + name] for name in FAULT_NAMES], dtype=np.uint32)
+LIMIT_FAULTS = SAFETY_RL | SAFETY_LL    # Концевики: ось останавливается (halt), остальное - killAll
+
+HISTORY = 4096                # Переходов в истории монитора
+HISTORY_FIELDS = [("time", "<f8"), ("axis", "<i4"), ("word", "<u4"),
+                  ("raised", "<u4"), ("cleared", "<u4")]
+
+
+def words(values):
+    """Слова FAULT как uint32 (readInteger отдаёт int32 - бит 31 знаковый)."""
+    return np.asarray(values).astype(np.uint32)
+
+
+def decode(values):
+    """Биты слов FAULT: bool-массив формы values.shape + (len(FAULT_NAMES),)."""
+    return (words(values)[..., None] & FAULT_MASKS) != 0
+
+
+def names(word):
+    """Имена поднятых битов одного слова FAULT."""
+    return [name for name, bit in zip(FAULT_NAMES, decode(word)) if bit]
+
+
+def describe(events):
+    """Переходы (записи HISTORY_FIELDS) строкой: 'ось 1: +PE -RL; ...'."""
+    parts = []
+    for e in events:
+        change = ["+" + n for n in names(e["raised"])] + ["-" + n for n in names(e["cleared"])]
+        parts.append(f"ось {int(e['axis'])}: {' '.join(change)}")
+    return "; ".join(parts)
+
+
+class FaultMonitor(object):
+    """
+    FAULT осей axes контроллера hc: poll() - один запрос, разбор и рассылка переходов.
+    Подписчик fn(events) вызывается в потоке poll() со структурированным массивом
+    переходов (поля HISTORY_FIELDS), только если хоть один бит изменился.
+    hc можно задать позже (до первого poll).
+    """
+    def __init__(self, hc, axes, history=HISTORY):
+        self.hc = hc
+        self.axes = np.asarray(list(axes), dtype=np.int32)
+        self._lo, self._hi = int(self.axes.min()), int(self.axes.max())
+        self._index = {int(a): i for i, a in enumerate(self.axes)}
+        self.words = np.zeros(len(self.axes), dtype=np.uint32)   # Слова последнего опроса
+        self.flags = decode(self.words)                          # Их биты (оси x FAULT_NAMES)
+        self.time = None                                         # Время последнего опроса
+        self.history = AcquisitionBuffer(HISTORY_FIELDS, capacity=history, ring=True)
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, fn):
+        with self._lock:
+            self._subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+    def read(self):
+        """Слова FAULT осей axes одним запросом."""
+        values = acsc.readInteger(self.hc, acsc.NONE, "FAULT", self._lo, self._hi)
+        return words(values[self.axes - self._lo])
+
+    def poll(self):
+        """Опрос: возвращает переходы (пустой массив, если ничего не изменилось)."""
+        current = self.read()
+        now = time.time()
+        changed = current ^ self.words
+        idx = np.flatnonzero(changed)
+        events = np.zeros(idx.size, dtype=self.history.dtype)
+        if idx.size:
+            events["time"] = now
+            events["axis"] = self.axes[idx]
+            events["word"] = current[idx]
+            events["raised"] = changed[idx] & current[idx]
+            events["cleared"] = changed[idx] & self.words[idx]
+            self.flags = decode(current)
+        self.words, self.time = current, now
+        if idx.size:
+            self.history.extend(events)
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for fn in subscribers:
+                fn(events)
+        return events
+
+    def reset(self):
+        """Принимает текущие слова за исходные без рассылки (после подключения)."""
+        self.words, self.time = self.read(), time.time()
+        self.flags = decode(self.words)
+
+    def word(self, axis, max_age=None):
+        """Последнее слово FAULT оси или None, если ось не под монитором или он
+        не опрашивался за последние max_age секунд."""
+        i = self._index.get(axis)
+        if i is None or self.time is None or (max_age is not None and time.time() - self.time > max_age):
+            return None
+        return int(self.words[i])
+
+    def blocked(self, axis):
+        """Ось стоит на концевике (по последнему опросу)."""
+        return bool(self.words[self._index[axis]] & LIMIT_FAULTS)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Interrupts
+----------
+Прерывания контроллера (acsc_modified.setCallback) вместо опроса состояния
+осей: конец движения и отказы приходят от самого контроллера за миллисекунды
+и не нагружают канал связи запросами MST каждые 50-125 мс.
+
+Библиотека вызывает обработчики в своём потоке. Interrupts раздаёт маску осей
+подписчикам: сканам в потоке - threading.Event (motion_end), asyncio - future
+(motion_end_future), окну - сигналы Qt (qt_interrupts.QtInterrupts).
+
+    intr = interrupts.attach(hc)          # один раз после подключения
+    with intr.motion_end(axis) as ended:  # подписка до проверки состояния - конец не теряется
+        if acsc.getMotorState(hc, axis)['moving']:
+            ended.wait(30.0)
+"""
+from __future__ import division, print_function
+import asyncio
+import contextlib
+import functools
+import threading
+
+import acsc_modified as acsc
+
+MOTION_END = acsc.INTR_PHYSICAL_MOTION_END
+FAILURES = (acsc.INTR_MOTION_FAILURE, acsc.INTR_MOTOR_FAILURE)
+
+_attached = {}    # hc -> Interrupts
+
+
+class Interrupts(object):
+    """Обработчики прерываний `interrupts` контроллера hc и подписчики на них.
+    Подписчик fn(interrupt, mask) вызывается в потоке библиотеки."""
+    def __init__(self, hc, interrupts=(MOTION_END,) + FAILURES):
+        self.hc = hc
+        self.interrupts = tuple(interrupts)
+        self._lock = threading.Lock()
+        self._subscribers = []
+        for interrupt in self.interrupts:
+            acsc.setCallback(hc, interrupt, functools.partial(self._dispatch, interrupt))
+
+    def subscribe(self, fn):
+        with self._lock:
+            self._subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+    def _dispatch(self, interrupt, mask):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for fn in subscribers:
+            fn(interrupt, mask)
+
+    @contextlib.contextmanager
+    def motion_end(self, axis):
+        """threading.Event, которое ставится концом движения оси (или её отказом)
+        на время блока with."""
+        ended = threading.Event()
+        bit = 1 << axis
+
+        def on_interrupt(interrupt, mask):
+            if mask & bit:
+                ended.set()
+        self.subscribe(on_interrupt)
+        try:
+            yield ended
+        finally:
+            self.unsubscribe(on_interrupt)
+
+    def motion_end_future(self, axis):
+        """asyncio future текущего цикла событий: результат - номер прерывания,
+        которым закончилось движение оси. Отмена future снимает подписку."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        bit = 1 << axis
+
+        def resolve(interrupt):
+            if not future.done():
+                future.set_result(interrupt)
+
+        def on_interrupt(interrupt, mask):
+            if mask & bit:
+                loop.call_soon_threadsafe(resolve, interrupt)
+        self.subscribe(on_interrupt)
+        future.add_done_callback(lambda f: self.unsubscribe(on_interrupt))
+        return future
+
+    def close(self):
+        """Снимает обработчики с контроллера."""
+        for interrupt in self.interrupts:
+            acsc.setCallback(self.hc, interrupt, None)
+        with self._lock:
+            self._subscribers = []
+
+
+def attach(hc):
+    """Interrupts контроллера hc (создаётся при первом вызове).
+    RuntimeError - библиотека не принимает обработчики прерываний."""
+    intr = _attached.get(hc)
+    if intr is None:
+        intr = _attached[hc] = Interrupts(hc)
+    return intr
+
+
+def get(hc):
+    """Interrupts контроллера hc или None, если прерывания не подключены (тогда - опрос)."""
+    return _attached.get(hc)
+
+
+def detach(hc):
+    intr = _attached.pop(hc, None)
+    if intr is not None:
+        intr.close()
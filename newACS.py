@@ -4,14 +4,16 @@
 
 # NEW:
 # - is_blocked() now works well
-# - motor auto-stops if limit switch is pushed
+# - motor auto-stops if limit switch is pushed (emergency.EmergencyWatchdog)
 # - motor won't start if blocked
+# - is_blocked() takes the FAULT word from faults.FaultMonitor when one is polled
 
 """
 This module contains an [incomplete] object for communicating with an ACS controller.
 """
 from __future__ import division, print_function
 import acsc_modified as acsc
+import faults
 import time
 
 '''ACS config'''
@@ -24,6 +26,7 @@ test_axis_numbers = [0,] #a list of axes used in demo.py
 test_axis_number = test_axis_numbers[0] #a single demo axis used in newACS's __main__
 acs_flags = None
 acs_wait = acsc.SYNCHRONOUS
+fault_max_age = 0.1 #s - older FAULT words of controller.faults are read again
 
 class newAcsController(object):
 	def __init__(self, ip, port, new_axis_names = dict(), contype="simulator", n_axes=8):
@@ -31,6 +34,7 @@ class newAcsController(object):
 		self.ip = ip
 		self.port = port
 		self.hc = None  # Инициализируем атрибут hc
+		self.faults = None  # faults.FaultMonitor, который кто-то опрашивает (например, сторож)
 		print('Connecting to ACS controller...')
 		self.connect(ip, port)
 		print('The action is completed')
@@ -63,6 +67,12 @@ class newAcsController(object):
 		for a in self.axes:
 			a.disable()
 		
+	def snapshot(self, axes=None):
+		"""Returns FPOS/FVEL/MST/AST/FAULT of all (or given) axes as one record array."""
+		if axes is None:
+			axes = [a.axisno for a in self.axes]
+		return acsc.getStateSnapshot(self.hc, axes)
+
 	def disconnect(self):
 		acsc.closeComm(self.hc)
 		
@@ -126,23 +136,15 @@ class acsAxis(object):
 		acsc.halt(self.controller.hc, self.axisno)
 		
 	def is_moving(self): #CHECK IF MOVING #ANY MOTOR
-		moving = not(self.motor_state["in position"]) # NOT (self.motor_state["moving"] or self.motor_state["accelerating"])
-		blocked = self.is_blocked()
-		if moving and blocked:
-			self.stop() # AUTO-STOP
-			print('ACS motor', self.name, ': LIMIT EXCEEDED. Auto-stop!')
-			print('Rotate the axis MANUALLY to re-engage the motor.')
-			print("NOTE: You don't have to stop the program to do it")
-			return False
-		else:
-			return 'moving' #! ТУТ Я САМ ПОСТАВИЛ КАВЫЧКИ
+		# Остановку на концевике делает сторож (emergency.EmergencyWatchdog) в своём потоке
+		return not(self.motor_state["in position"]) # NOT (self.motor_state["moving"] or self.motor_state["accelerating"])
 		
 	def is_blocked(self): #END-SWITCH ERROR CHECK #ANY MOTOR
-		fault = acsc.getFault(self.controller.hc, self.axisno)
-		fault_int = fault.value
-		left_limit = fault_int % 2 # 1st bit of fault_int is left limit - CHECK RIGHT/LEFT, PROBABLY CONFUSED
-		right_limit = ((fault_int - left_limit) // 2) % 2 # 2nd bit of fault_int is right limit - CHECK RIGHT/LEFT, PROBABLY CONFUSED
-		return (right_limit or left_limit)
+		monitor = self.controller.faults
+		word = monitor.word(self.axisno, fault_max_age) if monitor is not None else None
+		if word is None: # no fresh poll - one request
+			word = acsc.getFault(self.controller.hc, self.axisno).value
+		return bool(word & faults.LIMIT_FAULTS) # bit 0 - right limit, bit 1 - left limit
 		
 	def set_speed(self, speed): #ANY MOTOR
 		acsc.setVelocity(self.controller.hc, self.axisno, speed)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Qt interrupts
+-------------
+Прерывания контроллера (interrupts.Interrupts) сигналами Qt. Сигналы
+испускаются в потоке библиотеки и доходят до окна через очередь событий GUI,
+поэтому слоты могут трогать виджеты.
+
+    intr = QtInterrupts(stand.hc, parent=window)
+    intr.motion_end.connect(window.on_motion_end)      # маска осей
+    intr.failure.connect(window.on_axis_failure)       # (прерывание, маска осей)
+"""
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import interrupts
+
+
+class QtInterrupts(QObject):
+    """Сигналы motion_end(маска осей) и failure(прерывание, маска осей)."""
+    motion_end = pyqtSignal(int)
+    failure = pyqtSignal(int, int)
+
+    def __init__(self, hc, parent=None):
+        super().__init__(parent)
+        self.interrupts = interrupts.attach(hc)
+        self.interrupts.subscribe(self._emit)
+
+    def _emit(self, interrupt, mask):
+        if interrupt == interrupts.MOTION_END:
+            self.motion_end.emit(mask)
+        elif interrupt in interrupts.FAILURES:
+            self.failure.emit(interrupt, mask)
+
+    def close(self):
+        self.interrupts.unsubscribe(self._emit)
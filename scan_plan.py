@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Scan plan
+---------
+Порядок обхода точек карты первого интеграла. В каждой точке (x, y) нить
+проходит отрезок длины distance вдоль оси прохода ('X' или 'Y') с центром
+в точке; проход можно вести в любую сторону - интеграл от направления не
+зависит. Холостой переход - один toPointM всех четырёх осей от конца
+предыдущего прохода к началу следующего, его время пропорционально
+евклидову расстоянию.
+
+    points = grid_points(np.linspace(-10, 10, 5), np.linspace(-5, 5, 3))
+    order, signs = plan_path(points, distance=20.0, axis='X', method='serpentine')
+    starts, ends = stroke_ends(points[order], signs, 20.0, 'X')
+"""
+import numpy as np
+
+METHODS = ("serpentine", "nearest")
+
+
+def grid_points(x, y):
+    """Точки прямоугольной сетки: массив (len(y)*len(x), 2), строка за строкой по y."""
+    gx, gy = np.meshgrid(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.column_stack([gx.ravel(), gy.ravel()])
+
+
+def _along(axis):
+    if axis not in ("X", "Y"):
+        raise ValueError("Ось прохода - 'X' или 'Y'")
+    return np.array([1.0, 0.0]) if axis == "X" else np.array([0.0, 1.0])
+
+
+def stroke_ends(points, signs, distance, axis):
+    """Начала и концы проходов через points в направлениях signs (+1/-1)."""
+    half = np.asarray(signs, dtype=float)[:, None]*_along(axis)*abs(distance)/2
+    points = np.asarray(points, dtype=float)
+    return points - half, points + half
+
+
+def path_length(points, signs, distance, axis, start=None):
+    """Суммарная длина холостых переходов (мм) от start через все проходы по порядку."""
+    starts, ends = stroke_ends(points, signs, distance, axis)
+    gaps = np.linalg.norm(starts[1:] - ends[:-1], axis=1).sum()
+    if start is not None:
+        gaps += np.linalg.norm(starts[0] - np.asarray(start, dtype=float))
+    return gaps
+
+
+def _serpentine(points, axis):
+    """Строки по второй координате, внутри строки - вдоль оси прохода, через строку навстречу.
+    Направления проходов чередуются: каждый начинается там, где кончился предыдущий,
+    со сдвигом на шаг сетки (и на шаг между строками на переходе строк)."""
+    k = 0 if axis == "X" else 1
+    rows = np.unique(np.round(points[:, 1 - k], 9), return_inverse=True)[1]
+    order = np.lexsort((points[:, k], rows))
+    row = rows[order]
+    # Номер строки по порядку (0, 1, 2...) - нечётные идут в обратную сторону
+    rank = np.concatenate([[0], np.cumsum(row[1:] != row[:-1])])
+    for r in np.unique(rank[rank % 2 == 1]):
+        sel = np.flatnonzero(rank == r)
+        order[sel] = order[sel[::-1]]
+    signs = np.where(np.arange(len(order)) % 2 == 0, 1, -1)
+    return order, signs
+
+
+def _nearest(points, distance, axis, start):
+    """Жадный обход: следующий - проход (точка и направление) с ближайшим началом."""
+    half = _along(axis)*abs(distance)/2
+    left = np.ones(len(points), dtype=bool)
+    current = points[0] - half if start is None else np.asarray(start, dtype=float)
+    order = np.empty(len(points), dtype=np.int64)
+    signs = np.empty(len(points), dtype=np.int64)
+    for i in range(len(points)):
+        # Расстояния до начал проходов в обе стороны: (точки x 2)
+        cost = np.stack([np.linalg.norm(points - half - current, axis=1),
+                         np.linalg.norm(points + half - current, axis=1)], axis=1)
+        cost[~left] = np.inf
+        j, side = np.unravel_index(np.argmin(cost), cost.shape)
+        order[i], signs[i] = j, 1 - 2*side
+        left[j] = False
+        current = points[j] + signs[i]*half
+    return order, signs
+
+
+def plan_path(points, distance, axis="X", method="serpentine", start=None):
+    """
+    Порядок обхода points (массив (n, 2) координат x, y, мм) и направления проходов.
+    method: 'serpentine' - змейкой по строкам сетки, проходы попеременно туда и обратно
+    (холостой ход - шаги сетки), 'nearest' - ближайший сосед от start (для произвольного набора точек).
+    Возвращает (order - индексы points по порядку, signs - +1/-1 для каждого прохода).
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    _along(axis)
+    if method == "serpentine":
+        return _serpentine(points, axis)
+    if method == "nearest":
+        return _nearest(points, distance, axis, start)
+    raise ValueError(f"Порядок обхода - один из {METHODS}")
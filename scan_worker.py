@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Scan worker
+-----------
+Запуск процедур из scans.py в отдельном QThread. Окно GUI остаётся отзывчивым,
+а скан не теряет точки из-за перерисовки: прогресс, частичные данные и результат
+приходят в поток GUI сигналами.
+
+    worker = ScanWorker(scans.ffi_scan, stand, params, live=live_plot.feed)
+    worker.finished.connect(on_result)
+    worker.stopped.connect(on_stopped)   # поток завершён, worker и поток удаляются (deleteLater)
+    worker.start(parent)
+    ...
+    worker.cancel()      # скан заканчивается сигналом failed("Сканирование прервано")
+"""
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+from scans import ScanContext, ScanCancelled
+
+
+class ScanWorker(QObject):
+    """Выполняет scan(context, *args) в собственном QThread.
+    Сигналы: progress(доля, сообщение), data(словарь частичных данных),
+    finished(результат скана), failed(сообщение об ошибке или отмене),
+    stopped() - поток скана завершён; после него worker и поток удаляются.
+    live - необязательный приёмник частичных данных, вызывается прямо в потоке
+    скана (кольцевой буфер живого графика), без очереди событий GUI."""
+    progress = pyqtSignal(float, str)
+    data = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    stopped = pyqtSignal()
+
+    def __init__(self, scan, *args, live=None):
+        super().__init__()
+        self.scan = scan
+        self.args = args
+        self.live = live
+        self.context = ScanContext(progress=self.progress.emit, data=self._data)
+        self._thread = None
+
+    def _data(self, chunk):
+        if self.live is not None:
+            self.live(chunk)
+        self.data.emit(chunk)
+
+    def start(self, parent=None):
+        """Запускает скан. Сигналы нужно подключить до вызова."""
+        self._thread = QThread(parent)
+        self.moveToThread(self._thread)
+        self._thread.started.connect(self.run)
+        self.finished.connect(self._thread.quit)
+        self.failed.connect(self._thread.quit)
+        self._thread.finished.connect(self.stopped)
+        self._thread.finished.connect(self.deleteLater)
+        self._thread.finished.connect(self._thread.deleteLater)
+        self._thread.start()
+
+    def run(self):
+        try:
+            result = self.scan(self.context, *self.args)
+        except ScanCancelled as e:
+            self.failed.emit(str(e))
+        except Exception as e:
+            self.failed.emit(f"{type(e).__name__}: {e}")
+        else:
+            self.finished.emit(result)
+
+    def cancel(self):
+        """Просит скан остановиться на ближайшем опросе."""
+        self.context.cancel()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.isRunning()
+
+    def wait(self, timeout_ms=5000):
+        """Ждёт завершения потока скана. Возвращает False по таймауту."""
+        return self._thread is None or self._thread.wait(timeout_ms)
@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+"""
+Сканы стенда
+------------
+Процедуры измерений без привязки к GUI. Каждая получает ScanContext,
+контроллер (newACS.newAcsController) и словарь параметров, сама создаёт
+и закрывает вольтметр и возвращает словарь с результатом. Прогресс, частичные данные и отмена идут
+через ScanContext, поэтому одна и та же процедура работает и в потоке
+scan_worker.ScanWorker, и из скрипта.
+"""
+from __future__ import division, print_function
+import asyncio
+import contextlib
+import os
+import threading
+import time
+
+import numpy as np
+
+import acsc_modified as acsc
+import async_devices
+import interrupts
+import scan_plan
+from acquisition_buffer import AcquisitionBuffer, acquisition_fields
+from Calculation import harmonics, runfile
+from Keithley_2182A.keithley import Keithley2182A as ktl, BUFFER_SIZE, LINE_FREQUENCY
+
+PEG_PULSE_WIDTH = 0.01     # Длительность импульса, мс (Trigger Link требует > 2 мкс)
+
+FFI_FIELDS = [("time", "<f8"), ("x_pos", "<f8"), ("y_pos", "<f8"), ("eds", "<f8")]
+
+CIRCULAR_BINS = 128        # Угловых бинов на оборот в скане по окружности
+CIRCULAR_LOG_SIZE = 4096   # Опросов в кольцевом логе скана по окружности
+MAX_TURNS = 49             # Дуг в одном сегментном движении (без массива Segments - до 50 сегментов)
+
+
+class ScanCancelled(Exception):
+    """Скан прерван пользователем"""
+
+
+class ScanContext(object):
+    """Связь процедуры скана с вызывающей стороной.
+    progress(доля, сообщение) и data(словарь) - обратные вызовы, cancel() - отмена,
+    которую процедура замечает в check()/sleep()/wait_motion()."""
+    poll = 0.05  # Период опроса во время движения, с
+
+    def __init__(self, progress=None, data=None):
+        self._cancel = threading.Event()
+        self._progress = progress or (lambda fraction, message: None)
+        self._data = data or (lambda chunk: None)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise ScanCancelled("Сканирование прервано")
+
+    def sleep(self, dt):
+        if self._cancel.wait(dt):
+            raise ScanCancelled("Сканирование прервано")
+
+    def progress(self, fraction, message=""):
+        self._progress(float(fraction), message)
+
+    def data(self, chunk):
+        self._data(chunk)
+
+    def wait_motion(self, hc, axis, timeout=30.0, on_poll=None):
+        """Ждёт окончания движения оси (timeout в с), проверяя отмену.
+        on_poll вызывается каждые poll с - для прогресса и частичных данных.
+        Если к hc подключены прерывания (interrupts.attach), конец движения
+        приходит прерыванием, и состояние оси читается только один раз."""
+        intr = interrupts.get(hc)
+        if intr is None:
+            ended = contextlib.nullcontext(None)
+        else:
+            ended = intr.motion_end(axis)
+        t_end = time.time() + timeout
+        with ended as event:
+            moving = acsc.getMotorState(hc, axis)['moving']
+            while moving:
+                if on_poll is not None:
+                    on_poll()
+                if time.time() > t_end:
+                    raise TimeoutError(f"Ось {axis} не остановилась за {timeout} с")
+                if event is None:
+                    self.sleep(self.poll)
+                    moving = acsc.getMotorState(hc, axis)['moving']
+                else:
+                    moving = not event.wait(self.poll)
+                    self.check()
+
+
+def _ffi_target(ffi, distance):
+    """Смещения осей прохода: directions (по умолчанию (1, 1)) - знаки для концов нити."""
+    return tuple(distance*sign for sign in ffi.get('directions', (1, 1)))
+
+
+def _ffi_duration(ffi, distance):
+    """Оценка длительности прохода с запасом, с: speed - векторная скорость toPointM,
+    длина пути - по всем осям сразу."""
+    return np.hypot(*_ffi_target(ffi, distance))/ffi['speed']*1.1 + 0.5
+
+
+def _dc_check(dc, until):
+    """Запись контроллера заполнена до конца раньше момента until (с от начала) -
+    дальше np.interp молча повторял бы последнее положение."""
+    if dc['full'] and until > dc['time'][-1]:
+        raise RuntimeError(f"Запись координат контроллера ({dc['time'][-1]:.1f} с) "
+                           f"короче прохода ({until:.1f} с)")
+
+
+def _ffi_start(ctx, hc, ffi):
+    """Выводит нить в начало прохода: на -distance/2 от текущего положения."""
+    ctx.progress(0.0, "Выход в начало прохода")
+    acsc.toPointM(hc, acsc.AMF_RELATIVE, tuple(ffi['axes']), _ffi_target(ffi, -ffi['distance']/2),
+                  acsc.SYNCHRONOUS)
+    ctx.wait_motion(hc, ffi['leader'], timeout=20.0)
+
+
+def _ffi_run(ffi, fields=FFI_FIELDS, **meta):
+    """Файл прогона для прохода (Calculation.runfile), если в параметрах есть run_file."""
+    if not ffi.get('run_file'):
+        return None
+    meta.update({key: ffi[key] for key in ('distance', 'speed', 'axes', 'leader', 'resource',
+                                          'pos_key', 'other_pos', 'directions', 'repeats') if key in ffi})
+    meta['started'] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return runfile.RunWriter(ffi['run_file'], fields, meta)
+
+
+def _ffi_record(ffi, time, pos, eds):
+    """Поля записи прохода: вторая координата нити за проход не меняется."""
+    return {'time': time, ffi['pos_key']: pos, ffi['other_key']: ffi['other_pos'], 'eds': eds}
+
+
+def _buffer_poll(ctx, hc, nano, leader, start_time):
+    """Опрос во время прохода: счётчик буфера Keithley и положение лидера."""
+    n = nano.buffer_count()
+    ctx.progress(n/nano.buffer_points, f"ЭДС: {n} из {nano.buffer_points}")
+    ctx.data({'time': time.time() - start_time, 'pos': acsc.getFPosition(hc, leader)})
+
+
+def _ffi_stroke(ctx, hc, nano, ffi, distance):
+    """
+    Один записанный проход на distance от текущего положения. Координаты пишет
+    сам контроллер (Data Collection) с периодом сервоцикла, ЭДС - вольтметр в свой
+    внутренний буфер; обе записи выгружаются одним запросом в конце.
+    Возвращает (time, pos, eds, dc); время - от начала движения.
+    """
+    axes, leader = ffi['axes'], ffi['leader']
+    duration = _ffi_duration(ffi, distance)
+    nano.start_buffer(BUFFER_SIZE, nplc=duration/BUFFER_SIZE*LINE_FREQUENCY)
+    acsc.startDataCollection(hc, axes, duration=duration)             # Период записи - под длительность
+    start_time = time.time()
+    try:
+        acsc.toPointM(hc, acsc.AMF_RELATIVE, tuple(axes), _ffi_target(ffi, distance), acsc.SYNCHRONOUS)
+        ctx.wait_motion(hc, leader, timeout=2*duration + 10,
+                        on_poll=lambda: _buffer_poll(ctx, hc, nano, leader, start_time))
+    finally:
+        dc = acsc.stopDataCollection(hc, axes)                         # time, fpos, fvel с контроллера
+    nano.wait_buffer(timeout=duration)
+    eds_time, eds = nano.read_buffer()
+    eds_time = eds_time - start_time                                   # Время с момента начала движения
+    _dc_check(dc, eds_time[-1] if eds_time.size else 0.0)
+    # Позиция оси-лидера в моменты измерения ЭДС (по записи контроллера)
+    pos = np.interp(eds_time, dc['time'], dc['fpos'][0])
+    return eds_time, pos, eds, dc
+
+
+def ffi_scan(ctx, stand, ffi):
+    """
+    Проход для первого интеграла (_ffi_stroke на distance).
+    ffi: distance, speed, axes, leader, resource; directions - знаки смещения
+    концов нити (по умолчанию (1, 1), навстречу - (1, -1)).
+    Возвращает {'params', 'time', 'pos', 'eds', 'dc'}.
+    """
+    hc = stand.hc
+    _ffi_start(ctx, hc, ffi)
+    nano = ktl(resource=ffi['resource'], mode='buffer')
+    try:
+        eds_time, pos, eds, dc = _ffi_stroke(ctx, hc, nano, ffi, ffi['distance'])
+    finally:
+        nano.close()
+    run = _ffi_run(ffi, scan='ffi', nplc=nano.nplc, trigger='IMM')
+    if run is not None:                                                # ЭДС приходит из буфера прибора целиком
+        run.extend(_ffi_record(ffi, eds_time, pos, eds))
+        run.close()
+    return {'params': ffi, 'time': eds_time, 'pos': pos, 'eds': eds, 'dc': dc}
+
+
+def ffi_bidir_scan(ctx, stand, ffi):
+    """
+    Первый интеграл проходами туда и обратно: после выхода в начало записываются
+    все 2*repeats проходов (+distance, -distance, ...), нить возвращается в начало.
+    Термо-ЭДС и смещение нуля вольтметра входят в проходы разных направлений
+    с разными знаками и сокращаются при совместной обработке
+    (Calculation.Calc_integrals_func.bidirectional_field_integral).
+    ffi: параметры ffi_scan и repeats (по умолчанию 1). Файл прогона - все
+    проходы подряд, поле stroke - номер прохода.
+    Возвращает {'params', 'time', 'pos', 'eds', 'dc'} со списками по проходам
+    и 'direction' - знаки проходов.
+    """
+    hc = stand.hc
+    repeats = ffi.get('repeats', 1)
+    direction = np.tile([1, -1], repeats)
+    _ffi_start(ctx, hc, ffi)
+    run = _ffi_run(ffi, FFI_FIELDS + [("stroke", "<i4")], scan='ffi_bidir', trigger='IMM')
+    strokes = []
+    complete = False
+    nano = ktl(resource=ffi['resource'], mode='buffer')
+    try:
+        for i, sign in enumerate(direction):
+            ctx.check()
+            ctx.progress(i/direction.size, f"Проход {i + 1} из {direction.size}")
+            strokes.append(_ffi_stroke(ctx, hc, nano, ffi, sign*ffi['distance']))
+            if run is not None:
+                eds_time, pos, eds, dc = strokes[-1]
+                run.extend(dict(_ffi_record(ffi, eds_time, pos, eds), stroke=i))
+        complete = True
+    finally:
+        nano.close()
+        if run is not None:                                            # NPLC известен после первого прохода
+            run.close(complete=complete, nplc=nano.nplc)
+    eds_time, pos, eds, dc = (list(c) for c in zip(*strokes))
+    return {'params': ffi, 'time': eds_time, 'pos': pos, 'eds': eds, 'dc': dc, 'direction': direction}
+
+
+def map_scan(ctx, stand, mp):
+    """
+    Карта первого интеграла: проходы _ffi_stroke через все точки mp['points']
+    подряд, с одним вольтметром. Порядок точек и направления проходов -
+    scan_plan.plan_path (method: 'serpentine' - змейкой по сетке, 'nearest' -
+    ближайший сосед), так что холостые переходы минимальны. Переход - один
+    абсолютный toPointM всех четырёх осей к началу следующего прохода.
+    mp: параметры ffi_scan (distance, speed, axes, leader, resource, pos_key,
+    other_key), points - массив (n, 2) координат (x, y) нити, мм; method.
+    Файл прогона - все проходы подряд, поле point - номер точки в points.
+    Возвращает {'params', 'time', 'pos', 'eds', 'dc'} - списки в порядке points,
+    'order', 'signs' - порядок обхода и направления, 'dead_path' - длина холостых переходов, мм.
+    """
+    hc = stand.hc
+    points = np.asarray(mp['points'], dtype=float).reshape(-1, 2)
+    axis, distance = ('X' if mp['pos_key'] == 'x_pos' else 'Y'), mp['distance']
+    here = (acsc.getFPosition(hc, 1), acsc.getFPosition(hc, 0))       # Текущие (X1, Y1)
+    order, signs = scan_plan.plan_path(points, distance, axis, mp.get('method', 'serpentine'), start=here)
+    starts, _ = scan_plan.stroke_ends(points[order], signs, distance, axis)
+    dead_path = scan_plan.path_length(points[order], signs, distance, axis, start=here)
+    # Оси перехода: сначала оси прохода - их скорость задаёт векторную скорость toPointM
+    move_axes = list(mp['axes']) + [a for a in range(4) if a not in mp['axes']]
+    run = _ffi_run(mp, FFI_FIELDS + [("point", "<i4")], scan='map', method=mp.get('method', 'serpentine'),
+                   points=points.tolist(), order=order.tolist(), signs=signs.tolist())
+    strokes = [None]*len(points)
+    complete = False
+    nano = ktl(resource=mp['resource'], mode='buffer')
+    try:
+        last = np.array(here)
+        for i, (j, sign, start) in enumerate(zip(order, signs, starts)):
+            ctx.check()
+            ctx.progress(i/len(order), f"Точка {i + 1} из {len(order)}")
+            target = {0: start[1], 1: start[0], 2: start[1], 3: start[0]}      # Оси 0, 2 - Y, 1, 3 - X
+            acsc.toPointM(hc, 0, move_axes, [target[a] for a in move_axes], acsc.SYNCHRONOUS)
+            ctx.wait_motion(hc, move_axes[0], timeout=2*np.linalg.norm(start - last)/mp['speed'] + 10)
+            point = dict(mp, other_pos=points[j][1 if axis == 'X' else 0])
+            strokes[j] = _ffi_stroke(ctx, hc, nano, point, sign*distance)
+            last = start + sign*distance*(np.array([1.0, 0.0]) if axis == 'X' else np.array([0.0, 1.0]))
+            if run is not None:
+                eds_time, pos, eds, dc = strokes[j]
+                run.extend(dict(_ffi_record(point, eds_time, pos, eds), point=j))
+        complete = True
+    finally:
+        nano.close()
+        if run is not None:                                            # Отмена или ошибка - прогон не завершён
+            run.close(complete=complete)
+    eds_time, pos, eds, dc = (list(c) for c in zip(*strokes))
+    return {'params': mp, 'time': eds_time, 'pos': pos, 'eds': eds, 'dc': dc,
+            'order': order, 'signs': signs, 'dead_path': dead_path}
+
+
+def ffi_peg_scan(ctx, stand, ffi):
+    """
+    Проход для первого интеграла с аппаратной синхронизацией: контроллер
+    выдаёт импульсы PEG через равные шаги по координате оси-лидера, каждый импульс
+    запускает одно измерение Keithley (:TRIG:SOUR EXT) в его внутренний буфер.
+    k-е значение ЭДС соответствует k-й точке PEG без программных задержек.
+    Параметры и результат - как у ffi_scan; peg_bitcodes - (энкодер -> PEG engine,
+    PEG engine -> выходы) для AssignPegNT по схеме стенда, без них скан не запускается.
+    RuntimeError - вольтметр принял не все импульсы (соответствие ЭДС точкам потеряно).
+    """
+    hc = stand.hc
+    distance, speed, axes, leader = ffi['distance'], ffi['speed'], ffi['axes'], ffi['leader']
+    if ffi.get('peg_bitcodes') is None:
+        raise ValueError("Не задано подключение PEG к Trigger Link вольтметра (peg_bitcodes по схеме стенда)")
+    engine_bitcode, outputs_bitcode = ffi['peg_bitcodes']
+    _ffi_start(ctx, hc, ffi)
+
+    # Точки PEG - середины BUFFER_SIZE равных отрезков прохода
+    interval = distance/BUFFER_SIZE
+    first_point = acsc.getFPosition(hc, leader) + interval/2
+    last_point = first_point + (BUFFER_SIZE - 1)*interval
+    nano = ktl(resource=ffi['resource'], mode='buffer')
+    try:
+        # Измерение должно закончиться до следующего импульса
+        nano.start_buffer(BUFFER_SIZE, nplc=0.8*abs(interval)/speed*LINE_FREQUENCY, trigger="EXT")
+        acsc.assignPeg(hc, leader, engine_bitcode, outputs_bitcode)
+        acsc.pegInc(hc, 0, leader, PEG_PULSE_WIDTH, first_point, interval, last_point)
+        acsc.waitPegReady(hc, leader, 5000)
+        acsc.startPeg(hc, leader)
+        acsc.startDataCollection(hc, axes, duration=_ffi_duration(ffi, distance))
+        start_time = time.time()
+        try:
+            acsc.toPointM(hc, acsc.AMF_RELATIVE, tuple(axes), _ffi_target(ffi, distance), acsc.SYNCHRONOUS)
+            ctx.wait_motion(hc, leader, timeout=2*abs(distance)/speed + 10,
+                            on_poll=lambda: _buffer_poll(ctx, hc, nano, leader, start_time))
+        finally:
+            dc = acsc.stopDataCollection(hc, axes)
+            acsc.stopPeg(hc, leader)
+        if not nano.wait_buffer(timeout=1.0):
+            raise RuntimeError(f"Keithley принял {nano.buffer_count()} из {BUFFER_SIZE} импульсов PEG")
+        _, eds = nano.read_buffer()
+        if eds.size != BUFFER_SIZE:
+            raise RuntimeError(f"В буфере Keithley {eds.size} из {BUFFER_SIZE} измерений по импульсам PEG")
+    finally:
+        nano.close()
+
+    pos = first_point + np.arange(eds.size)*interval                   # Координаты импульсов PEG
+    # Время прохождения точек - по записи контроллера (координата монотонна за проход)
+    if dc['full'] and not min(dc['fpos'][0]) <= last_point <= max(dc['fpos'][0]):
+        raise RuntimeError("Запись координат контроллера кончилась раньше последней точки PEG")
+    order = np.argsort(dc['fpos'][0])
+    eds_time = np.interp(pos, dc['fpos'][0][order], dc['time'][order])
+    run = _ffi_run(ffi, scan='ffi_peg', nplc=nano.nplc, trigger='EXT', peg_interval=interval,
+                   peg_first=first_point)
+    if run is not None:
+        run.extend(_ffi_record(ffi, eds_time, pos, eds))
+        run.close()
+    return {'params': ffi, 'time': eds_time, 'pos': pos, 'eds': eds, 'dc': dc}
+
+
+def ffi_stream_scan(ctx, stand, ffi):
+    """
+    Проход для первого интеграла без буфера прибора: Keithley в режиме fetch,
+    координаты и ЭДС читаются одновременно (async_devices.sample), пока ось
+    движется. Число точек не ограничено буфером, период выборки - задержка
+    самого медленного прибора. Параметры и результат - как у ffi_scan.
+    """
+    _ffi_start(ctx, stand.hc, ffi)
+    return asyncio.run(_ffi_stream(ctx, stand, ffi))
+
+
+async def _ffi_stream(ctx, stand, ffi):
+    distance, axes, leader = ffi['distance'], ffi['axes'], ffi['leader']
+    controller = async_devices.AsyncController(stand)
+    nano = async_devices.AsyncKeithley(ktl(resource=ffi['resource'], mode='fetch'))
+    run = _ffi_run(ffi, scan='ffi_stream', nplc=nano.nano.nplc, trigger='IMM')
+    samples = []
+    complete = False
+    try:
+        acsc.startDataCollection(stand.hc, axes, duration=_ffi_duration(ffi, distance))
+        start_time = time.time()
+        try:
+            await controller.to_point_m(acsc.AMF_RELATIVE, axes, _ffi_target(ffi, distance))
+            moving = asyncio.ensure_future(controller.wait_motion(leader, poll=ctx.poll))
+            while not moving.done():
+                ctx.check()
+                t, pos, eds = await async_devices.sample(controller, nano, [leader])
+                samples.append((t - start_time, pos[0], eds))
+                if run is not None:                                # Пишем по ходу скана, порциями
+                    run.append(**_ffi_record(ffi, t - start_time, pos[0], eds))
+                if len(samples) % 20 == 0:                        # Частичные данные - последние 20 точек
+                    ctx.progress(min((pos[0] - samples[0][1])/distance, 1.0), f"ЭДС: {len(samples)} точек")
+                    ctx.data(dict(zip(('time', 'pos', 'eds'), (np.array(c) for c in zip(*samples[-20:])))))
+            await moving
+        finally:
+            dc = acsc.stopDataCollection(stand.hc, axes)
+        complete = True
+    finally:
+        await nano.close()
+        controller.close()
+        if run is not None:                                            # Отмена или ошибка - прогон не завершён
+            run.close(complete=complete)
+    eds_time, pos, eds = (np.array(c) for c in zip(*samples)) if samples else (np.empty(0),)*3
+    return {'params': ffi, 'time': eds_time, 'pos': pos, 'eds': eds, 'dc': dc}
+
+
+def sfi_scan(ctx, stand, sfi):
+    """
+    Второй интеграл: проход ffi_scan с концами нити в одну сторону (первый
+    интеграл), возврат и такой же проход с концами навстречу друг другу -
+    ось-лидер на +distance, вторая ось на -distance.
+    sfi: параметры ffi_scan; каждый проход пишет свой файл прогона
+    (run_file с суффиксом _ffi для первого).
+    Возвращает результат встречного прохода (как у ffi_scan) и 'first' - результат первого.
+    """
+    first_params = dict(sfi, directions=(1, 1))
+    if sfi.get('run_file'):
+        base, ext = os.path.splitext(sfi['run_file'])
+        first_params['run_file'] = base + "_ffi" + ext
+    first = ffi_scan(ctx, stand, first_params)
+    ctx.progress(0.0, "Возврат в центр прохода")
+    acsc.toPointM(stand.hc, acsc.AMF_RELATIVE, tuple(sfi['axes']), _ffi_target(first_params, -sfi['distance']/2),
+                  acsc.SYNCHRONOUS)
+    ctx.wait_motion(stand.hc, sfi['leader'], timeout=20.0)
+    result = ffi_scan(ctx, stand, dict(sfi, directions=(1, -1)))
+    result['first'] = first
+    return result
+
+
+def _circular_sequence(hc, axes, center, start, velocity, turns):
+    """
+    Сегментное движение пары осей конца нити: turns дуг по 360 градусов вокруг
+    center из точки start. Движение ждёт goM (AMF_WAIT), чтобы оба конца нити
+    стартовали одновременно. Ошибка контроллера - RuntimeError (уходит в ScanWorker.failed).
+    """
+    acsc.extendedSegmentedMotionV2(hc, acsc.AMF_VELOCITY | acsc.AMF_WAIT,
+                                   axes, start,
+                                   velocity, #? Tangential velocity 😎😎😎!!!!! (мб 10 мм/с)
+                                   acsc.NONE, # EndVelocity
+                                   acsc.NONE, # JunctionVelocity
+                                   acsc.NONE, # Angle
+                                   acsc.NONE, # CurveVelocity
+                                   acsc.NONE, # Deviation
+                                   acsc.NONE, # Radius
+                                   acsc.NONE, # MaxLength
+                                   acsc.NONE, # StarvationMargin
+                                   None,      # Segments (имя массива, если нужно > 50 сегм.)
+                                   acsc.NONE, # ExtLoopType
+                                   acsc.NONE, # MinSegmentLength
+                                   acsc.NONE, # MaxAllowedDeviation
+                                   acsc.NONE, # OutputIndex
+                                   acsc.NONE, # BitNumber
+                                   acsc.NONE, # Polarity
+                                   acsc.NONE, # MotionDelay
+                                   None       # Wait (синхронный вызов планирования)
+                                   )
+
+    for _ in range(turns):
+        '''Добавляем дугу (360 градусов окружнсоть) 😊😊😊😊😊'''
+        acsc.segmentArc2V2(hc,
+                           acsc.AMF_VELOCITY,
+                           axes,
+                           center,
+                           2*np.pi,        # Whole circle
+                           None,           # FinalPoint (для вторичных осей, если есть)
+                           velocity,       #? Using the previous velosity we input
+                           acsc.NONE,      # EndVelocity
+                           acsc.NONE,      # Time
+                           None,           # Values (для user variables)
+                           None,           # Variables (для user variables)
+                           acsc.NONE,      # Index (для user variables)
+                           None,           # Masks (для user variables)
+                           acsc.NONE,      # ExtLoopType
+                           acsc.NONE,      # MinSegmentLength
+                           acsc.NONE,      # MaxAllowedDeviation
+                           acsc.NONE,      # LciState
+                           None            # Wait (синхронный вызов планирования)
+                           )
+
+    acsc.endSequenceM(hc, axes, None)
+    '''The function informs the controller, that no more points
+    or segments will be specified for the current multi-axis motion.
+    Эта функция сигнализирует контроллеру: "Все, описание траектории закончено.
+    Больше сегментов не будет.'''
+
+
+def circular_scan(ctx, stand, circ):
+    """
+    Движение нити по окружности: turns оборотов (по умолчанию 1) одним сегментным
+    движением на каждый конец нити (оси 0, 1 и 2, 3), концы стартуют вместе по goM,
+    так что нить остаётся параллельной себе.
+    circ: radius, velocity, resource; turns, bins - число угловых бинов (степень двойки).
+    Координаты и ЭДС читаются одновременно (как в ffi_stream_scan); dФ/dtheta = ЭДС/omega
+    сразу добавляется в harmonics.AngleBins - среднее и дисперсия по бинам угла
+    копятся за все обороты, сырые отсчёты не хранятся.
+    Возвращает {'params', 'center', 'log', 'bins'}; log - кольцевой AcquisitionBuffer
+    последних CIRCULAR_LOG_SIZE опросов (time, fpos, fvel, eds, status, theta нити),
+    bins - накопитель AngleBins.
+    """
+    hc = stand.hc
+    vector_velocity, radius = circ['velocity'], circ['radius']
+    turns = circ.get('turns', 1)
+    if not 1 <= turns <= MAX_TURNS:
+        raise ValueError(f"Число оборотов должно быть от 1 до {MAX_TURNS}")
+    axesM = [0, 1, 2, 3]  # List of axes to move (all) for toPointM
+
+    center_x = acsc.getFPosition(hc, 1)  # Получаем текущую позицию оси 1
+    center_y = acsc.getFPosition(hc, 0)  # Получаем текущую позицию оси 0
+    start_points = [center_y, center_x + radius, center_y, center_x + radius]
+
+    ctx.progress(0.0, "Выход в начальную точку")
+    acsc.toPointM(hc, 0, axesM, start_points, acsc.SYNCHRONOUS)   # Абсолютные координаты
+    ctx.wait_motion(hc, axesM[0])
+
+    ctx.check()
+    for axes in (axesM[:2], axesM[2:]):     # Дуга лежит в плоскости первых двух осей (Y, X)
+        _circular_sequence(hc, axes, [center_y, center_x], start_points[:2], vector_velocity, turns)
+    return asyncio.run(_circular_stream(ctx, stand, circ, axesM, (center_x, center_y)))
+
+
+async def _circular_stream(ctx, stand, circ, axesM, center):
+    center_x, center_y = center
+    radius, turns = circ['radius'], circ.get('turns', 1)
+    omega = circ['velocity']/radius                         # Угловая скорость на окружности, рад/с
+    bins = harmonics.AngleBins(circ.get('bins', CIRCULAR_BINS))
+    log = AcquisitionBuffer(acquisition_fields(len(axesM), extra=[("theta", "<f8")]),
+                            capacity=CIRCULAR_LOG_SIZE, ring=True)
+    controller = async_devices.AsyncController(stand)
+    nano = async_devices.AsyncKeithley(ktl(resource=circ['resource'], mode='fetch'))
+    turn = 0.0        # Развёрнутый угол нити
+    try:
+        start_time = time.time()
+        await controller.call(acsc.goM, stand.hc, axesM)
+        moving = asyncio.ensure_future(controller.wait_motion(axesM[0], poll=ctx.poll,
+                                                              timeout=2*np.pi*turns/omega*2 + 30))
+        while not moving.done():
+            ctx.check()
+            t0 = time.time()
+            snap, eds = await asyncio.gather(controller.snapshot(axesM), nano.get_voltage())
+            t = (t0 + time.time())/2 - start_time
+            # Середина нити: оси 0, 2 - Y концов, 1, 3 - X
+            y, x = (snap.fpos[:2] + snap.fpos[2:])/2 - (center_y, center_x)
+            vy, vx = (snap.fvel[:2] + snap.fvel[2:])/2
+            theta = np.arctan2(y, x)
+            turn += (theta - turn + np.pi) % (2*np.pi) - np.pi
+            log.append(time=t, fpos=snap.fpos, fvel=snap.fvel, eds=eds, status=snap.mst, theta=turn)
+            w = (x*vy - y*vx)/(x*x + y*y)
+            if abs(w) > 0.5*omega:                          # Разгон и торможение не накапливаем
+                bins.update(turn, eds/w)
+            done = abs(turn)/(2*np.pi)
+            ctx.progress(min(done/turns, 1.0), f"Оборот {min(int(done) + 1, turns)} из {turns}")
+            ctx.data({'time': t, 'x_pos': snap.fpos[1], 'y_pos': snap.fpos[0]})
+        await moving
+    finally:
+        await nano.close()
+        controller.close()
+    return {'params': circ, 'center': center, 'log': log, 'bins': bins}
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""Модули стенда лежат в корне репозитория, тесты - рядом, в tests/."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Лог измерения в структурированном массиве (acquisition_buffer)."""
+import numpy as np
+
+from acquisition_buffer import AcquisitionBuffer, acquisition_fields
+
+FIELDS = [("time", "<f8"), ("value", "<i8")]
+
+
+def _block(start, n):
+    return {"time": np.arange(start, start + n, dtype=float), "value": np.arange(start, start + n)}
+
+
+def test_ring_extend_wraparound():
+    buf = AcquisitionBuffer(FIELDS, capacity=8, ring=True)
+    buf.extend(_block(0, 5))
+    assert buf._start == 0 and len(buf) == 5
+    buf.extend(_block(5, 6))                    # Переполнение на 3 - самые старые уходят
+    assert buf._start == 3 and len(buf) == 8 and buf.total == 11
+    np.testing.assert_array_equal(buf["value"], np.arange(3, 11))
+    buf.append(11.0, 11)
+    assert buf._start == 4
+    np.testing.assert_array_equal(buf["time"], np.arange(4, 12))
+    buf.extend(_block(12, 3))
+    assert buf._start == 7
+    np.testing.assert_array_equal(buf["value"], np.arange(7, 15))
+    buf.extend(_block(15, 20))                  # Больше ёмкости - остаются последние capacity
+    assert buf._start == 0 and buf.total == 35
+    np.testing.assert_array_equal(buf["value"], np.arange(27, 35))
+    assert np.shares_memory(buf.view(), buf._data)
+
+
+def test_grow():
+    buf = AcquisitionBuffer(acquisition_fields(2), capacity=4)
+    for i in range(5):
+        buf.append(time=i, fpos=[i, -i], status=[1, 2])
+    assert buf.capacity == 8 and len(buf) == 5
+    buf.extend(time=np.arange(5, 30), fpos=np.column_stack([np.arange(5, 30), -np.arange(5, 30)]))
+    assert buf.capacity == 32 and len(buf) == buf.total == 30
+    np.testing.assert_array_equal(buf["time"], np.arange(30))
+    np.testing.assert_array_equal(buf["fpos"][:, 1], -np.arange(30))
+    np.testing.assert_array_equal(buf["status"][:5], [[1, 2]]*5)
+    assert not buf["status"][5:].any() and not buf["eds"].any()
+    assert np.shares_memory(buf.view(), buf._data)
+    buf.clear()
+    assert len(buf) == 0 and buf.capacity == 32
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Монитор FAULT (faults.FaultMonitor) с подставным чтением контроллера."""
+import numpy as np
+import pytest
+
+import faults
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Очередь ответов readInteger "FAULT": int32-слова осей lo..hi, как отдаёт контроллер."""
+    queue = []
+
+    def read_integer(hc, buffer, name, lo, hi, *args):
+        assert name == "FAULT"
+        values = np.asarray(queue.pop(0), dtype=np.int32)
+        assert values.size == hi - lo + 1
+        return values
+    monkeypatch.setattr(faults.acsc, "readInteger", read_integer)
+    return queue
+
+
+def test_decode_negative_words():
+    # Бит 31 (FAILURE) в int32 - отрицательное число
+    word = np.int32(-0x7FFFFFFF - 1) | np.int32(faults.SAFETY_ES | faults.SAFETY_LL)
+    assert word < 0
+    assert faults.words(word) == faults.SAFETY_FAILURE | faults.SAFETY_ES | faults.SAFETY_LL
+    assert faults.names(word) == ["LL", "ES", "FAILURE"]
+    flags = faults.decode(np.array([[word, 0], [-1, faults.SAFETY_PE]], dtype=np.int32))
+    assert flags.shape == (2, 2, len(faults.FAULT_NAMES))
+    assert flags[1, 0].all() and flags[1, 1].sum() == 1 and not flags[0, 1].any()
+
+
+def test_transitions_only(reads):
+    monitor = faults.FaultMonitor(None, axes=[1, 3])
+    published = []
+    monitor.subscribe(published.append)
+    reads.extend([[0, 0, 0], [0, 0, 0],                 # Оси 1, 2, 3 - мониторятся 1 и 3
+                  [faults.SAFETY_RL, 0, 0],
+                  [faults.SAFETY_RL, 0, 0],
+                  [faults.SAFETY_RL | faults.SAFETY_PE, -1, np.int32(-0x80000000)],
+                  [faults.SAFETY_PE, 0, 0]])
+
+    monitor.reset()
+    assert monitor.poll().size == 0
+    events = monitor.poll()
+    assert events.size == 1 and events["axis"][0] == 1 and events["raised"][0] == faults.SAFETY_RL
+    assert monitor.blocked(1) and not monitor.blocked(3)
+    assert monitor.poll().size == 0                      # Без изменений - без рассылки
+    events = monitor.poll()                              # Ось 2 вне монитора - не видна
+    assert list(events["axis"]) == [1, 3]
+    assert events["raised"][0] == faults.SAFETY_PE and events["raised"][1] == faults.SAFETY_FAILURE
+    assert monitor.word(3) == faults.SAFETY_FAILURE
+    events = monitor.poll()
+    assert list(events["axis"]) == [1, 3]
+    assert events["cleared"][0] == faults.SAFETY_RL and events["cleared"][1] == faults.SAFETY_FAILURE
+    assert not monitor.blocked(1)
+
+    assert len(published) == 3 and len(monitor.history) == 5
+    assert faults.describe(published[1]) == "ось 1: +PE; ось 3: +FAILURE"
+    assert monitor.flags[0, faults.FAULT_NAMES.index("PE")] and not monitor.flags[1].any()
+    assert monitor.word(2) is None and monitor.word(1, max_age=0.0) is None
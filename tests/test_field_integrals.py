@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Интегралы поля (Calculation.Calc_integrals_func) на синтетических сканах с известным ответом."""
+import numpy as np
+import pytest
+
+from Calculation import Calc_integrals_func as calc
+
+B1 = 1e-3                 # Тл*м
+I1 = B1*1e-3              # Первый интеграл, В*с/мм
+
+
+def _stroke(n=201, speed=20.0, start=-10.0, integral=I1):
+    """Равномерный проход: ЭДС = I1*v, В при v в мм/с."""
+    t = np.linspace(0.0, 1.0, n)
+    x = start + speed*t
+    return t, x, np.full(n, integral*speed)
+
+
+def test_uniform_field_units():
+    t, x, e = _stroke()
+    res = calc.first_field_integral(t, x, e, eds_noise=0.0, pos_noise=0.0)
+    assert res['integral'] == pytest.approx(I1, rel=1e-12)
+    assert res['integral']*1e3 == pytest.approx(B1, rel=1e-12)       # 1 В*с/мм = 1e3 Тл*м
+    assert np.allclose(res['local'], I1, rtol=1e-12)
+    assert res['valid'].all() and res['pos'].shape == (t.size - 1,)
+    # Проход в обратную сторону даёт тот же интеграл
+    back = calc.first_field_integral(t, x[::-1], -e, eds_noise=0.0, pos_noise=0.0)
+    assert back['integral'] == pytest.approx(I1, rel=1e-12)
+
+
+def test_ragged_scans():
+    scans = [_stroke(n=101, speed=10.0), _stroke(n=151, speed=30.0, integral=2*I1)]
+    t, x, e = (list(c) for c in zip(*scans))
+    res = calc.first_field_integral(t, x, e, eds_noise=0.0)
+    assert res['integral'] == pytest.approx([I1, 2*I1], rel=1e-12)
+    assert res['valid'].shape == (2, 150)
+    # Короткий скан дополнен NaN - его хвост в маске не участвует
+    assert res['valid'][0].sum() == 100 and res['valid'][1].all()
+    assert np.isnan(res['local'][0, 100:]).all()
+
+
+def test_nan_and_low_velocity_masked():
+    t, x, e = _stroke(n=301)
+    e[40] = np.nan                                   # Пропущенный отсчёт вольтметра
+    x[200:] = x[200]                                 # Остановка нити в конце прохода
+    e[201:] = 1e-3                                   # ... с большой ЭДС (наводка), которая не должна попасть в интеграл
+    res = calc.first_field_integral(t, x, e, eds_noise=0.0, pos_noise=0.0)
+    assert not res['valid'][39] and not res['valid'][40]
+    assert not res['valid'][200:].any() and res['valid'][:39].all()
+    assert res['integral'] == pytest.approx(I1, rel=1e-12)
+    # Медленный, но не нулевой участок отсекается порогом min_velocity
+    slow = x.copy()
+    slow[200:] = x[200] + 1e-4*(t[200:] - t[200])
+    res = calc.first_field_integral(t, slow, e, eds_noise=0.0, min_velocity=1e-2)
+    assert not res['valid'][200:].any()
+    assert res['integral'] == pytest.approx(I1, rel=1e-12)
+
+
+def test_uncertainty_propagation():
+    n, runs, sigma, pos_noise = 201, 4000, 1e-6, 1e-3
+    t, x, e = _stroke(n=n)
+    res = calc.first_field_integral(t, x, e, eds_noise=sigma, pos_noise=pos_noise)
+    dt, shift = np.diff(t), x[-1] - x[0]
+    expected = np.hypot(sigma*np.sqrt(np.sum(dt**2)), I1*np.sqrt(2)*pos_noise)/shift
+    assert res['integral_err'] == pytest.approx(expected, rel=1e-12)
+
+    # Разброс по повторам с шумом ЭДС совпадает с погрешностью, оценённой по шуму самого скана
+    rng = np.random.default_rng(0)
+    noisy = e + rng.normal(0.0, sigma, (runs, n))
+    stack = calc.first_field_integral(np.tile(t, (runs, 1)), np.tile(x, (runs, 1)), noisy, pos_noise=0.0)
+    assert np.std(stack['integral']) == pytest.approx(np.median(stack['integral_err']), rel=0.1)
+    assert np.mean(stack['integral']) == pytest.approx(I1, abs=3*np.std(stack['integral'])/np.sqrt(runs))
+
+
+def _counter_stroke(a, b, wire_length, dx=5.0, n=20001):
+    """
+    Встречный проход в поле a + b*z, z - от второго конца нити: смещение точки
+    нити z - s*(2z/L - 1), где s(t) = dx*(1 - cos(pi*t))/2 - смещение ведущего конца.
+    Поток Ф = s*(2/L*I2 - I1), ЭДС = dФ/dt.
+    """
+    first = a*wire_length + b*wire_length**2/2           # I1 = int(By dz)
+    second = a*wire_length**2/2 + b*wire_length**3/3     # I2 = int(z*By dz)
+    t = np.linspace(0.0, 1.0, n)
+    s = dx*(1 - np.cos(np.pi*t))/2
+    eds = dx*np.pi/2*np.sin(np.pi*t)*(2/wire_length*second - first)
+    return t, 100.0 + s, eds, first, second
+
+
+def test_second_integral_chunked():
+    t, x, e, first, _ = _counter_stroke(1e-9, 2e-12, 3000.0, n=10001)
+    e = e + np.random.default_rng(1).normal(0.0, 1e-9, e.size)
+    whole = calc.second_field_integral(t, x, e, first, 3000.0, eds_noise=1e-9, chunk=t.size)
+    for chunk in (1, 7, 4096):
+        part = calc.second_field_integral(t, x, e, first, 3000.0, eds_noise=1e-9, chunk=chunk)
+        np.testing.assert_allclose(part['flux'], whole['flux'], rtol=1e-12, atol=1e-18)
+        assert part['integral'] == pytest.approx(whole['integral'], rel=1e-12)
+        assert part['integral_err'] == pytest.approx(whole['integral_err'], rel=1e-12)
+
+
+def test_second_integral_non_uniform():
+    # Поле растёт к ведущему концу: I2 != I1*L/2, так что ошибка знака Ф/dx или
+    # выбор не того конца нити (I2' = L*I1 - I2) меняют ответ
+    wire_length = 3000.0
+    t, x, e, first, second = _counter_stroke(1e-9, 2e-12, wire_length)
+    assert abs(second - first*wire_length/2) > 0.1*second
+    res = calc.second_field_integral(t, x, e, first, wire_length, eds_noise=0.0)
+    assert res['integral'] == pytest.approx(second, rel=1e-6)
+    assert res['flux'][-1] == pytest.approx(5.0*(2/wire_length*second - first), rel=1e-6)
+    # Однородное поле: Ф = 0, I2 = I1*L/2
+    t, x, e, first, second = _counter_stroke(1e-9, 0.0, wire_length)
+    res = calc.second_field_integral(t, x, e, first, wire_length, eds_noise=0.0)
+    assert res['integral'] == pytest.approx(first*wire_length/2, rel=1e-9)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Мультиполи (Calculation.harmonics) по синтетическим сканам с известными b_n, a_n."""
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from Calculation import Calc_integrals_func as calc, harmonics
+
+R_REF, RADIUS = 10.0, 5.0                                  # мм
+C = {1: 1e-3, 2: 5e-4 + 2e-4j, 3: -1e-5 + 3e-5j}           # C_n = b_n + i*a_n, Тл*м
+
+
+def _scan(theta):
+    """Время и ЭДС скана по углам нити theta: dФ/dtheta при скорости 1 рад/с с пульсацией."""
+    time = np.cumsum(np.r_[0.0, np.abs(np.diff(theta))*(1 + 0.3*np.sin(theta[1:]))])
+    rate = np.gradient(theta, time)
+    z = RADIUS*np.exp(1j*theta)/R_REF
+    dflux = sum(1j*c*R_REF*harmonics.LENGTH_UNIT*z**n for n, c in C.items()).real
+    return time, dflux*rate
+
+
+def _check(res, scan=0, rel=1e-3):
+    c = res['c'][scan]
+    scale = abs(C[1])
+    for n in range(1, c.size + 1):
+        expected = C.get(n, 0.0)*(RADIUS/R_REF)**(n - 1)               # На радиусе скана
+        assert c[n - 1].real == pytest.approx(expected.real, abs=rel*scale)
+        assert c[n - 1].imag == pytest.approx(np.imag(expected), abs=rel*scale)
+
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_known_multipoles(direction):
+    theta = 0.3 + direction*np.linspace(0.0, 2*np.pi, 4001)
+    time, eds = _scan(theta)
+    res = harmonics.multipoles(theta, time, eds, radius=RADIUS, r_ref=RADIUS, n_max=6, bins=256)
+    _check(res)
+    assert res['main'][0] == 1
+    # Приведение к r_ref: b_n(r_ref) = b_n(r)*(r_ref/r)^(n-1)
+    ref = harmonics.multipoles(theta, time, eds, radius=RADIUS, r_ref=R_REF, n_max=3, bins=256)
+    assert ref['c'][0] == pytest.approx(np.array([C[1], C[2], C[3]]), abs=1e-3*abs(C[1]))
+
+
+def test_non_monotonic_angle():
+    # Дрожание энкодера на малой скорости: угол местами идёт назад
+    rng = np.random.default_rng(2)
+    theta = np.linspace(0.0, 2*np.pi + 0.05, 8001)
+    jitter = theta + rng.normal(0.0, 2e-4, theta.size)
+    time, eds = _scan(theta)
+    res = harmonics.multipoles(jitter, time, eds, radius=RADIUS, n_max=4, bins=256)
+    _check(res, rel=5e-3)
+
+
+def test_scan_short_of_full_turn():
+    bins = 64
+    short = 2*np.pi*(1 - 0.3/bins)                 # Не доходит до 2*pi на треть бина
+    theta = [np.linspace(0.0, short, 101), np.linspace(1.0, 1.0 + 2*np.pi, 151)]
+    values = [3*theta[0] + 100.0, -theta[1]]      # Линейны по углу - экстраполяция точна
+    samples, theta0, drift = harmonics.resample_angle(theta, values, bins)
+    assert drift == pytest.approx([6*np.pi, -2*np.pi], rel=1e-12)
+    np.testing.assert_allclose(samples[0], 100.0, rtol=1e-12)
+    np.testing.assert_allclose(samples[1], -1.0, rtol=1e-12)
+
+    # Соседний скан в общем вызове не влияет на результат
+    scans = [np.linspace(0.0, short, 2001), np.linspace(0.0, 2*np.pi, 3001)]
+    time, eds = zip(*(_scan(th) for th in scans))
+    together = harmonics.multipoles(scans, list(time), list(eds), radius=RADIUS, n_max=4, bins=bins)
+    alone = harmonics.multipoles(scans[0], time[0], eds[0], radius=RADIUS, n_max=4, bins=bins)
+    np.testing.assert_allclose(together['c'][0], alone['c'][0], rtol=1e-12)
+    assert together['drift'][0] == pytest.approx(alone['drift'][0], rel=1e-12)
+    _check(together, scan=0, rel=1e-2)
+    _check(together, scan=1)
+
+
+def test_harmonic_analysis_returns_table(capsys):
+    theta = np.linspace(0.0, 2*np.pi, 4001)
+    time, eds = _scan(theta)
+    x, y = 3.0 + RADIUS*np.cos(theta), -2.0 + RADIUS*np.sin(theta)     # Центр окружности подбирается
+    fig, res = calc.harmonicAnalysis(x, x, y, y, time, eds, r_ref=R_REF, n_max=4)
+    plt.close(fig)
+    assert capsys.readouterr().out == ""
+    assert res['n'].tolist() == [1, 2, 3, 4]
+    assert res['c'][0][:3] == pytest.approx(np.array([C[1], C[2], C[3]]), abs=1e-3*abs(C[1]))
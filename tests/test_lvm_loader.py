@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Загрузка файлов LabVIEW (Calculation.lvm_loader) на копиях файлов стенда."""
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from Calculation import lvm_loader
+
+SOURCES = os.path.join(os.path.dirname(__file__), os.pardir, "Calculation", "Исходники")
+
+
+@pytest.fixture
+def lvm(tmp_path):
+    path = tmp_path / "file957.txt"
+    shutil.copy(os.path.join(SOURCES, "file957.txt"), path)
+    return str(path)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Счётчик разборов текста (мимо кэша)."""
+    calls = []
+    parse = lvm_loader._parse
+    monkeypatch.setattr(lvm_loader, "_parse", lambda *args: calls.append(args) or parse(*args))
+    return calls
+
+
+def test_decimal_comma(lvm):
+    run = lvm_loader.load_lvm(lvm, cache=False)
+    assert len(run) == 254
+    assert run["Time, s"][1] == pytest.approx(0.088002)
+    assert run["Y1 position, mm"][0] == -10.0
+    assert run["Signal, Volt"][:2] == pytest.approx([2.494450e-6, 2.272167e-6])
+    assert run.header["Decimal_Separator"] == ","
+    assert run.header["Time"] == "10:00:23,9307994842529296875"      # Время остаётся строкой
+
+
+def test_channel_header(lvm):
+    run = lvm_loader.load_lvm(lvm, cache=False)
+    assert run.columns == ["Time, s", "X1 position, mm", "Y1 position, mm", "X2 position, mm",
+                           "Y2 position, mm", "Signal, Volt"]
+    assert run.data.shape == (254, 6)
+    assert run.channels["Channels"] == 6
+    assert run.channels["Samples"] == [254]*6
+    assert run.channels["Delta_X"] == [1.0]*6
+    assert run.settings["1й интеграл поля I_y"] == pytest.approx(-5.2848e-6)
+    assert run.settings[":SENS:CHAN"] == 2
+
+
+def test_cache_invalidation(lvm, parses, monkeypatch):
+    first = lvm_loader.load_lvm(lvm)
+    assert os.path.exists(lvm + lvm_loader.CACHE_SUFFIX) and len(parses) == 1
+    cached = lvm_loader.load_lvm(lvm)
+    assert len(parses) == 1
+    np.testing.assert_array_equal(cached.data, first.data)
+    assert cached.settings == first.settings and cached.channels == first.channels
+
+    stat = os.stat(lvm)
+    os.utime(lvm, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))    # Файл пересохранён
+    lvm_loader.load_lvm(lvm)
+    assert len(parses) == 2
+
+    stat = os.stat(lvm)
+    with open(lvm, "ab") as f:                                        # Дописана строка, mtime прежний
+        f.write(b"\t9,0\t0\t0\t0\t0\t1,0E-6\r\n")
+    os.utime(lvm, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(lvm_loader.load_lvm(lvm)) == 255
+    assert len(parses) == 3
+
+    monkeypatch.setattr(lvm_loader, "CACHE_VERSION", lvm_loader.CACHE_VERSION + 1)
+    lvm_loader.load_lvm(lvm)
+    assert len(parses) == 4
+    lvm_loader.load_lvm(lvm)
+    assert len(parses) == 4
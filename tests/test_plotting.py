@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Прореживание живого графика, кэш отрисовок и размещение PlotView (Calculation.plotting)."""
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6 import QtWidgets
+
+from Calculation import plotting
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def _check_buckets(dec, t, y):
+    """Корзины подряд покрывают все точки, min/max и время - по своим отсчётам."""
+    assert dec.n.sum() == y.size
+    assert (dec.n[:-1] == dec.size).all() and 0 < dec.n[-1] <= dec.size
+    assert dec.n.size <= 2*dec.columns
+    start = np.r_[0, np.cumsum(dec.n)[:-1]]
+    for k, (i, n) in enumerate(zip(start, dec.n)):
+        assert dec.t[k] == t[i]
+        assert dec.lo[k] == np.nanmin(y[i:i + n]) and dec.hi[k] == np.nanmax(y[i:i + n])
+
+
+def test_decimator_partial_bucket():
+    dec = plotting.MinMaxDecimator(columns=2)
+    t = np.arange(13.0)
+    y = np.r_[np.arange(10.0), 100.0, -5.0, 7.0]
+    dec.add(t[:10], y[:10])
+    # 10 корзин по 1 -> 5 по 2 -> 3 по 4, последняя неполная
+    assert dec.size == 4 and dec.n.tolist() == [4, 4, 2]
+    _check_buckets(dec, t[:10], y[:10])
+    dec.add(t[10:], y[10:])               # Два отсчёта дополняют хвост, третий - новая корзина
+    assert dec.n.tolist() == [4, 4, 4, 1]
+    assert dec.lo[2] == -5.0 and dec.hi[2] == 100.0
+    _check_buckets(dec, t, y)
+    x, v = dec.curve()
+    assert x.size == v.size == 8 and v[4:6].tolist() == [-5.0, 100.0]
+
+
+def test_decimator_chunks():
+    rng = np.random.default_rng(3)
+    t = np.arange(5000.0)
+    y = rng.normal(size=t.size)
+    y[rng.integers(0, t.size, 50)] = np.nan
+    dec = plotting.MinMaxDecimator(columns=50)
+    edges = np.r_[0, np.sort(rng.integers(0, t.size, 40)), t.size]      # Порции кадров разной длины
+    for a, b in zip(edges[:-1], edges[1:]):
+        dec.add(t[a:b], y[a:b])
+    _check_buckets(dec, t, y)
+
+
+def test_render_cache_lru():
+    cache = plotting.RenderCache(maxsize=2)
+    renders = []
+
+    def render(key):
+        return lambda: renders.append(key) or key.upper()
+    assert cache.get("a", render("a")) == "A"
+    cache.get("b", render("b"))
+    assert cache.get("a", render("a")) == "A"         # Попадание - "a" становится свежим
+    cache.get("c", render("c"))                       # Вытесняется давний "b"
+    assert len(cache) == 2 and renders == ["a", "b", "c"]
+    cache.get("a", render("a"))
+    cache.get("b", render("b"))
+    assert renders == ["a", "b", "c", "b"]
+
+
+def test_plot_view_in_label_layout(app):
+    pytest.importorskip("pyqtgraph")
+    window = QtWidgets.QWidget()
+    label = QtWidgets.QLabel(parent=window)
+    label.setGeometry(10, 10, 300, 200)
+    view = plotting.PlotView(label, native=True)
+    assert view.widget.parentWidget() is label
+    assert label.layout().indexOf(view.widget) >= 0
+    window.show()
+    label.resize(400, 250)
+    app.processEvents()
+    assert view.widget.size() == label.size()
+
+
+def test_plot_view_render_cache(app):
+    window = QtWidgets.QWidget()
+    label = QtWidgets.QLabel(parent=window)
+    label.setGeometry(0, 0, 200, 150)
+    view = plotting.PlotView(label, native=False)
+    window.show()
+    app.processEvents()
+    view.show("run1", 'ffi', np.arange(5.0), np.arange(5.0))
+    view.show("run2", 'ffi', np.arange(5.0), -np.arange(5.0))
+    assert len(view.cache) == 2 and not label.pixmap().isNull()
+    view.show("run1", 'ffi', np.arange(5.0), np.arange(5.0))
+    assert len(view.cache) == 2
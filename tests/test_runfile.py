@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Файл прогона: запас заголовка, оборванная запись, отметка завершения."""
+import numpy as np
+import pytest
+
+from Calculation import runfile
+
+FIELDS = [("time", "<f8"), ("eds", "<f8")]
+
+
+def _write(path, n, **close):
+    run = runfile.RunWriter(str(path), FIELDS, {"speed": 40.0})
+    run.extend(time=np.arange(n, dtype=float), eds=np.ones(n))
+    run.close(**close)
+    return runfile.open_run(str(path))
+
+
+def test_header_slack(tmp_path):
+    # Исходный заголовок вплотную к любой границе 4096: close() всё равно помещает "complete" и "records"
+    path = tmp_path / "edge.run"
+    for n in range(runfile.HEADER_ALIGN - runfile.HEADER_SLACK - 100, runfile.HEADER_ALIGN + 100):
+        run = runfile.RunWriter(str(path), FIELDS, {"note": "x"*n})
+        run.append(1.0, 2.0)
+        run.close(points=12345678)
+        read = runfile.open_run(str(path))
+        assert read.complete and read.header["records"] == 1
+        assert read.meta["points"] == 12345678
+        assert read.offset % runfile.HEADER_ALIGN == 0
+
+
+def test_header_overflow_keeps_complete(tmp_path):
+    path = tmp_path / "big.run"
+    run = runfile.RunWriter(str(path), FIELDS)
+    run.append(1.0, 2.0)
+    with pytest.warns(UserWarning, match="не записаны"):
+        run.close(note="x"*(2*runfile.HEADER_ALIGN))
+    read = runfile.open_run(str(path))
+    assert read.complete and "note" not in read.meta
+    assert len(read) == 1
+
+
+def test_torn_last_record(tmp_path):
+    path = tmp_path / "torn.run"
+    _write(path, 10)
+    with open(path, "ab") as f:
+        f.write(b"\0"*(np.dtype(FIELDS).itemsize - 3))
+    read = runfile.open_run(str(path))
+    assert len(read) == 10
+    np.testing.assert_array_equal(read["time"], np.arange(10))
+
+
+def test_complete_flag(tmp_path):
+    assert _write(tmp_path / "done.run", 5).complete
+    cancelled = _write(tmp_path / "cancel.run", 5, complete=False)
+    assert not cancelled.complete and cancelled.header["records"] == 5
+
+    path = tmp_path / "error.run"
+    with pytest.raises(KeyboardInterrupt):
+        with runfile.RunWriter(str(path), FIELDS) as run:
+            run.append(1.0, 2.0)
+            raise KeyboardInterrupt
+    read = runfile.open_run(str(path))
+    assert not read.complete and len(read) == 1
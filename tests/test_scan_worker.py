@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Поток скана (scan_worker.ScanWorker): сигналы и удаление потока и worker после завершения."""
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6 import QtWidgets, sip
+from PyQt6.QtCore import QCoreApplication, QEvent
+
+from scan_worker import ScanWorker
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def _run(app, worker, timeout=5.0):
+    """Запускает worker и крутит цикл событий GUI до stopped; возвращает порядок сигналов."""
+    events = []
+    worker.finished.connect(lambda result: events.append(("finished", result)))
+    worker.failed.connect(lambda message: events.append(("failed", message)))
+    worker.stopped.connect(lambda: events.append(("stopped",)))
+    parent = QtWidgets.QWidget()
+    worker.start(parent)
+    thread = worker._thread
+    deadline = time.time() + timeout
+    while ("stopped",) not in events and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+    return events, thread
+
+
+def _scan(ctx, value):
+    ctx.progress(0.5, "Половина")
+    return value * 2
+
+
+def _cancelled(ctx):
+    ctx.cancel()
+    ctx.check()
+
+
+def test_finished_then_deleted(app):
+    worker = ScanWorker(_scan, 21)
+    events, thread = _run(app, worker)
+    assert events == [("finished", 42), ("stopped",)]
+    assert sip.isdeleted(worker) and sip.isdeleted(thread)
+
+
+def test_failed_then_deleted(app):
+    worker = ScanWorker(_cancelled)
+    events, thread = _run(app, worker)
+    assert events == [("failed", "Сканирование прервано"), ("stopped",)]
+    assert sip.isdeleted(worker) and sip.isdeleted(thread)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Сканы (scans.py) на симуляторах контроллера (acsc_sim) и вольтметра
+(Keithley_2182A.keithley_sim) с известным полем: диполь b1 и квадруполь b2
+на r_ref = 10 мм, нить 3 м. Проверяются значения модели, а не сами вызовы.
+Время симуляторов - реальное, весь модуль идёт около 35 с.
+"""
+import os
+
+import numpy as np
+import pytest
+
+import acsc_modified as acsc
+import newACS
+import scan_plan
+import scans
+from Calculation import Calc_integrals_func as calc, harmonics, runfile
+from Keithley_2182A import keithley_sim
+
+B1, B2, R_REF = 1e-3, 5e-3, 10.0      # Тл*м, Тл*м, мм
+WIRE_LENGTH = 3.0                     # м
+SPEED = 40.0                          # мм/с
+DISTANCE = 20.0                       # мм
+RESOURCE = "SIM::7::INSTR"
+I1_REL = 1e-2                         # Время ЭДС и координат - с разных часов, разброс до 0.5%
+I1 = B1*1e-3                          # Первый интеграл в центре, В*с/мм (Тл*м/1000)
+GRADIENT = B2/R_REF*1e-3              # dI1/dx, В*с/мм на мм
+
+
+@pytest.fixture
+def stand():
+    """Свежий симулятор контроллера с осями в нуле и вольтметр, видящий его нить."""
+    library = acsc.setBackend("sim")
+    keithley_sim.configure(field=keithley_sim.MultipoleField({1: B1, 2: B2}, r_ref=R_REF,
+                                                             wire_length=WIRE_LENGTH),
+                           wire=keithley_sim.acs_wire(library), clock=library.clock,
+                           trigger=keithley_sim.acs_peg_trigger(library, (1, 0)), seed=1)
+    stand = newACS.newAcsController("sim", newACS.acs_port, n_axes=4)
+    for axis in stand.axes:
+        axis.enable()
+        acsc.setVelocity(stand.hc, axis.axisno, SPEED)
+    yield stand
+    stand.disconnect()
+
+
+def _ffi(**extra):
+    """Проход вдоль X обоими концами нити (оси 1, 3), как prepare_ffi_motion в окне."""
+    params = {'distance': DISTANCE, 'speed': SPEED, 'axes': [1, 3], 'leader': 1,
+              'resource': RESOURCE, 'pos_key': 'x_pos', 'other_key': 'y_pos', 'other_pos': 0.0}
+    params.update(extra)
+    return params
+
+
+def test_ffi_scan(stand, tmp_path):
+    run_file = str(tmp_path/"ffi.run")
+    result = scans.ffi_scan(scans.ScanContext(), stand, _ffi(run_file=run_file))
+    integral = calc.first_field_integral(result['time'], result['pos'], result['eds'])
+    assert integral['integral'] == pytest.approx(I1, rel=I1_REL)
+    run = runfile.RunFile(run_file)
+    assert run.complete and len(run.data) == len(result['eds'])
+
+
+def test_ffi_peg_scan(stand):
+    result = scans.ffi_peg_scan(scans.ScanContext(), stand, _ffi(peg_bitcodes=(0, 0)))
+    assert result['eds'].size == scans.BUFFER_SIZE
+    integral = calc.first_field_integral(result['time'], result['pos'], result['eds'])
+    assert integral['integral'] == pytest.approx(I1, rel=I1_REL)
+
+
+def test_ffi_peg_scan_needs_bitcodes(stand):
+    """Без подключения PEG по схеме стенда скан не двигает оси."""
+    with pytest.raises(ValueError):
+        scans.ffi_peg_scan(scans.ScanContext(), stand, _ffi())
+    assert acsc.getFPosition(stand.hc, 1) == 0.0
+
+
+def test_ffi_peg_scan_missed_pulse(stand, tmp_path):
+    """Пропущенный импульс сдвинул бы все следующие ЭДС на точку - скан прерывается без файла."""
+    pulses = keithley_sim.acs_peg_trigger(acsc.acs, (1, 0))
+    keithley_sim.configure(trigger=lambda t: np.delete(pulses(t), 10) if pulses(t).size > 10 else pulses(t))
+    run_file = str(tmp_path/"peg.run")
+    with pytest.raises(RuntimeError, match="импульсов PEG"):
+        scans.ffi_peg_scan(scans.ScanContext(), stand, _ffi(peg_bitcodes=(0, 0), run_file=run_file))
+    assert not os.path.exists(run_file)
+
+
+def test_ffi_bidir_scan(stand, tmp_path):
+    run_file = str(tmp_path/"bidir.run")
+    result = scans.ffi_bidir_scan(scans.ScanContext(), stand, _ffi(repeats=1, run_file=run_file))
+    assert list(result['direction']) == [1, -1]
+    integral = calc.bidirectional_field_integral(result['time'], result['pos'], result['eds'])
+    assert integral['integral'] == pytest.approx(I1, rel=I1_REL)
+    run = runfile.RunFile(run_file)
+    assert run.complete and run.meta['nplc'] > 0
+    assert np.bincount(run.data['stroke']).tolist() == [len(eds) for eds in result['eds']]
+
+
+def test_ffi_bidir_scan_cancelled(stand, tmp_path):
+    """Проходы до отмены уже в файле прогона, прогон не завершён."""
+    run_file = str(tmp_path/"bidir.run")
+    ctx = scans.ScanContext(progress=lambda fraction, message: message == "Проход 2 из 2" and ctx.cancel())
+    with pytest.raises(scans.ScanCancelled):
+        scans.ffi_bidir_scan(ctx, stand, _ffi(repeats=1, run_file=run_file))
+    run = runfile.RunFile(run_file)
+    assert not run.complete
+    assert len(run.data) > 0 and set(run.data['stroke']) == {0}
+
+
+def test_sfi_scan(stand):
+    result = scans.sfi_scan(scans.ScanContext(), stand, _ffi())
+    first = result['first']
+    first_integral = calc.first_field_integral(first['time'], first['pos'], first['eds'])
+    assert first_integral['integral'] == pytest.approx(I1, rel=I1_REL)
+    second = calc.second_field_integral(result['time'], result['pos'], result['eds'],
+                                        first_integral['integral'], WIRE_LENGTH*1e3,
+                                        first_integral['integral_err'])
+    # Поле постоянно вдоль нити: I2 от второго конца = I1*L/2, В*с = Тл*м^2
+    assert second['integral'] == pytest.approx(B1*WIRE_LENGTH/2, rel=2e-2)
+
+
+def test_map_scan(stand):
+    x, y = np.linspace(-10.0, 10.0, 3), np.array([-5.0, 5.0])
+    mp = _ffi(points=scan_plan.grid_points(x, y), method='serpentine')
+    result = scans.map_scan(scans.ScanContext(), stand, mp)
+    integral = calc.integral_map(result['time'], result['pos'], result['eds'], shape=(len(y), len(x)))
+    # Вдоль X поле By = b1 + b2*x/r_ref, от y не зависит
+    expected = np.tile(I1 + GRADIENT*x, (len(y), 1))
+    assert np.allclose(integral['integral'], expected, rtol=I1_REL, atol=I1_REL*I1)
+    assert result['dead_path'] == pytest.approx(
+        scan_plan.path_length(mp['points'][result['order']], result['signs'], DISTANCE, 'X', start=(0.0, 0.0)))
+
+
+def test_map_scan_cancelled(stand, tmp_path):
+    """Карта, прерванная после первой точки, остаётся в файле прогона незавершённой."""
+    run_file = str(tmp_path/"map.run")
+    mp = _ffi(points=scan_plan.grid_points([-5.0, 5.0], [0.0]), run_file=run_file)
+    ctx = scans.ScanContext(progress=lambda fraction, message: message == "Точка 2 из 2" and ctx.cancel())
+    with pytest.raises(scans.ScanCancelled):
+        scans.map_scan(ctx, stand, mp)
+    run = runfile.RunFile(run_file)
+    assert not run.complete
+    assert len(run.data) > 0 and len(set(run.data['point'])) == 1
+
+
+def test_circular_scan(stand):
+    radius = 5.0
+    circ = {'velocity': 20.0, 'radius': radius, 'turns': 2, 'resource': RESOURCE}
+    result = scans.circular_scan(scans.ScanContext(), stand, circ)
+    assert result['center'] == pytest.approx((0.0, 0.0), abs=1e-6)
+    res = harmonics.binned_multipoles(result['bins'], radius, n_max=4)
+    b, a = res['b'][0], res['a'][0]
+    # На радиусе скана: b_n(r) = b_n(r_ref)*(r/r_ref)^(n-1)
+    assert b[0] == pytest.approx(B1, rel=2e-2)
+    assert b[1] == pytest.approx(B2*radius/R_REF, rel=2e-2)
+    assert np.all(np.abs(b[2:]) < 2e-2*B1)
+    # Косые - только от разброса запаздывания опроса координат относительно ЭДС (~1 градус)
+    assert np.all(np.abs(a) < 5e-2*np.hypot(b[0], b[1]))
+
+
+def test_circular_sequence_error(stand):
+    """Отказ контроллера при планировании окружности - исключение, а не молча недописанная траектория."""
+    acsc.disable(stand.hc, 3)
+    with pytest.raises(RuntimeError, match="ExtendedSegmentedMotionV2"):
+        scans._circular_sequence(stand.hc, [2, 3], [0.0, 0.0], [0.0, 5.0], 20.0, 1)
+    with pytest.raises(RuntimeError, match="SegmentArc2V2"):
+        acsc.segmentArc2V2(stand.hc, acsc.AMF_VELOCITY, [2, 3], [0.0, 0.0], 2*np.pi, None, 20.0,
+                           acsc.NONE, acsc.NONE, None, None, acsc.NONE, None, acsc.NONE, acsc.NONE,
+                           acsc.NONE, acsc.NONE, None)
+    with pytest.raises(RuntimeError, match="EndSequenceM"):
+        acsc.endSequenceM(stand.hc, [2, 3], None)